@@ -20,14 +20,16 @@ import os
 import requests
 from packaging import version
 
-from .ipaddresses import IPNetwork
-from .cached_objects import CachedObject
+from .ipaddresses import parse_ip_network
+from .cached_objects import CachedObject, COMPACT_CACHE_SERIALIZER
 from .errors import ARINWhoisDBDumpError
+from .http_client import HTTPNotModified
 
 
 class ARINWhoisDBDump(CachedObject):
 
     EXPIRY_TIME_TAG = "arin_whois_db_dump"
+    CACHE_SERIALIZER = COMPACT_CACHE_SERIALIZER
 
     def __init__(self, *args, **kwargs):
         CachedObject.__init__(self, *args, **kwargs)
@@ -89,7 +91,7 @@ class ARINWhoisDBDump(CachedObject):
                             raise ValueError("'prefix' key is missing")
                         prefix = record["prefix"]
                         try:
-                            IPNetwork(prefix)
+                            parse_ip_network(prefix, cache=False)
                         except Exception as e:
                             raise ValueError("invalid prefix: {} - {}".format(
                                 prefix, str(e)
@@ -121,13 +123,17 @@ class ARINWhoisDBDump(CachedObject):
 
     def _get_data(self):
         if self.source.lower().startswith("http://") or \
-            self.source.lower().starswith("https://"):
+            self.source.lower().startswith("https://"):
 
             logging.debug("Downloading ARIN Whois DB dump")
 
             url = self.source
             try:
-                response = requests.get(url).content
+                response = self._http_get(url)
+                response.raise_for_status()
+                response = response.content
+            except HTTPNotModified:
+                raise
             except requests.exceptions.HTTPError as e:
                 raise ARINWhoisDBDumpError(
                     "HTTP error while retrieving ARIN Whois DB dump "
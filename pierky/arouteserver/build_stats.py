@@ -0,0 +1,275 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .errors import ARouteServerError
+
+
+class BuildStats(object):
+    """
+    Metrics collected while a configuration is built.
+
+    - histograms, for durations (seconds): build phases, enrichers,
+      enrichers' tasks, templates rendering;
+
+    - counters: cache lookups, HTTP requests and downloaded bytes,
+      external programs that are executed.
+
+    Each metric is identified by its name and by a set of labels.
+    Metrics can be saved in JSON format or in the Prometheus text
+    format (to be used with the node_exporter's textfile collector).
+    """
+
+    # Upper bounds of the histograms' buckets (seconds).
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+               1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    FORMATS = ("json", "prometheus")
+
+    PROMETHEUS_PREFIX = "arouteserver_"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # { (<name>, <labels>): [<count>, <sum>, <min>, <max>,
+            #                        [<bucket_count>, ...]] }
+            self.histograms = {}
+
+            # { (<name>, <labels>): <value> }
+            self.counters = {}
+
+    @staticmethod
+    def _get_key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        """Add a value to a histogram."""
+        key = self._get_key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = [0, 0.0, value, value, [0] * len(self.BUCKETS)]
+                self.histograms[key] = hist
+            hist[0] += 1
+            hist[1] += value
+            hist[2] = min(hist[2], value)
+            hist[3] = max(hist[3], value)
+            for idx, upper_bound in enumerate(self.BUCKETS):
+                if value <= upper_bound:
+                    hist[4][idx] += 1
+                    break
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Add the time spent within the block to a histogram."""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start_time, **labels)
+
+    def incr(self, name, value=1, **labels):
+        """Increment a counter."""
+        key = self._get_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def export(self):
+        """Return the metrics, to be merged into another BuildStats.
+
+        Used to pass the metrics collected by other processes back to
+        the main one.
+        """
+        with self.lock:
+            return {
+                "histograms": [
+                    (key, hist[:4] + [list(hist[4])])
+                    for key, hist in self.histograms.items()
+                ],
+                "counters": list(self.counters.items())
+            }
+
+    def merge(self, exported):
+        """Merge the metrics returned by export()."""
+        with self.lock:
+            for key, other in exported["histograms"]:
+                hist = self.histograms.get(key)
+                if hist is None:
+                    self.histograms[key] = other[:4] + [list(other[4])]
+                    continue
+                hist[0] += other[0]
+                hist[1] += other[1]
+                hist[2] = min(hist[2], other[2])
+                hist[3] = max(hist[3], other[3])
+                hist[4] = [a + b for a, b in zip(hist[4], other[4])]
+            for key, value in exported["counters"]:
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    @staticmethod
+    def get_peak_rss():
+        """Return the peak RSS (bytes) of this process and its children.
+
+        None is returned when it can't be determined.
+        """
+        if resource is None:
+            return None
+
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS.
+        multiplier = 1 if sys.platform == "darwin" else 1024
+
+        return {
+            "self": resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * multiplier,
+            "children": resource.getrusage(
+                resource.RUSAGE_CHILDREN).ru_maxrss * multiplier
+        }
+
+    def to_dict(self):
+        res = {
+            "histograms": {},
+            "counters": {},
+            "peak_rss_bytes": self.get_peak_rss()
+        }
+
+        with self.lock:
+            for (name, labels), hist in sorted(self.histograms.items()):
+                count, total, min_value, max_value, buckets = hist
+                res["histograms"].setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": count,
+                    "sum": total,
+                    "min": min_value,
+                    "max": max_value,
+                    "buckets": dict(
+                        (str(upper_bound), bucket_count)
+                        for upper_bound, bucket_count in zip(self.BUCKETS,
+                                                             buckets)
+                    )
+                })
+            for (name, labels), value in sorted(self.counters.items()):
+                res["counters"].setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "value": value
+                })
+
+        return res
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        return "{{{}}}".format(",".join([
+            '{}="{}"'.format(
+                name,
+                str(value).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for name, value in labels
+        ]))
+
+    def to_prometheus(self):
+        lines = []
+        prefix = self.PROMETHEUS_PREFIX
+
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        last_name = None
+        for (name, labels), hist in histograms:
+            count, total, _, _, buckets = hist
+            if name != last_name:
+                lines.append("# TYPE {}{} histogram".format(prefix, name))
+                last_name = name
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.BUCKETS, buckets):
+                cumulative_count += bucket_count
+                lines.append("{}{}_bucket{} {}".format(
+                    prefix, name,
+                    self._format_labels(labels + (("le", upper_bound),)),
+                    cumulative_count
+                ))
+            lines.append("{}{}_bucket{} {}".format(
+                prefix, name, self._format_labels(labels + (("le", "+Inf"),)),
+                count
+            ))
+            lines.append("{}{}_sum{} {}".format(
+                prefix, name, self._format_labels(labels), total
+            ))
+            lines.append("{}{}_count{} {}".format(
+                prefix, name, self._format_labels(labels), count
+            ))
+
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append("# TYPE {}{} counter".format(prefix, name))
+                last_name = name
+            lines.append("{}{}{} {}".format(
+                prefix, name, self._format_labels(labels), value
+            ))
+
+        peak_rss = self.get_peak_rss()
+        if peak_rss:
+            lines.append("# TYPE {}peak_rss_bytes gauge".format(prefix))
+            for process in sorted(peak_rss):
+                lines.append("{}peak_rss_bytes{} {}".format(
+                    prefix, self._format_labels((("process", process),)),
+                    peak_rss[process]
+                ))
+
+        return "\n".join(lines) + "\n"
+
+    def save(self, path, fmt="json"):
+        """Save the metrics to a file, in the given format."""
+        if fmt not in self.FORMATS:
+            raise ARouteServerError(
+                "Invalid format for the build stats: {}; "
+                "it must be one of {}".format(fmt, ", ".join(self.FORMATS))
+            )
+
+        if fmt == "json":
+            data = json.dumps(self.to_dict(), indent=2, sort_keys=True)
+        else:
+            data = self.to_prometheus()
+
+        # The file is replaced atomically, so that it's never read
+        # while it's partially written (textfile collector).
+        tmp_path = "{}.tmp".format(path)
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except Exception as e:
+            raise ARouteServerError(
+                "Error while saving the build stats to {}: {}".format(
+                    path, str(e)
+                )
+            )
+
+build_stats = BuildStats()
@@ -14,20 +14,26 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from aggregate6 import aggregate
+import hashlib
 import logging
+import multiprocessing
 import os
 from packaging import version
 import sys
 import time
 import yaml
 
-from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, \
+                   FileSystemBytecodeCache
+from jinja2.bccache import Bucket
 
+from .build_stats import build_stats
 from .config.general import ConfigParserGeneral
 from .config.bogons import ConfigParserBogons
 from .config.asns import ConfigParserASNS
 from .config.clients import ConfigParserClients
 from .enrichers.arin_db_dump import ARINWhoisDBDumpEnricher
+from .enrichers.base import run_enrichers
 from .enrichers.registrobr_db_dump import RegistroBRWhoisDBDumpEnricher
 from .enrichers.irrdb import IRRDBConfigEnricher_ASNs, \
                              IRRDBConfigEnricher_Prefixes
@@ -39,10 +45,68 @@ from .errors import MissingDirError, MissingFileError, BuilderError, \
                     ARouteServerError, MissingArgumentError, \
                     TemplateRenderingError, CompatibilityIssuesError, \
                     ConfigError, MissingGeneralConfigFileError
-from .ipaddresses import IPNetwork
+from .ipaddresses import parse_ip_network
 from .irrdb import IRRDBInfo
-from .cached_objects import CachedObject, normalize_expiry_time
+from .packed_lists import ROAList
+from .prefix_lists import bird_prefix_list, bird_prefix_list_entry, \
+                          bird_roa_table, openbgpd_prefix_list, \
+                          openbgpd_prefix_list_entry, \
+                          openbgpd_prefixset_list, openbgpd_origin_set, \
+                          openbgpd_roa_set, openbgpd_roas_action
+from .cached_objects import CachedObject, SQLiteCache, \
+                            normalize_expiry_time
+
+
+class TemplatesBytecodeCache(FileSystemBytecodeCache):
+    """Jinja2 bytecode cache, stored within the cache directory.
+
+    Compiled templates are keyed by their name and fingerprint (the
+    same SHA-512 hash of the content that is calculated by
+    ConfigParserProgram.calculate_fingerprints()), so a template is
+    compiled again only after it has been changed.
+    """
+
+    DIR_NAME = "templates_bytecode"
 
+    def __init__(self, cache_dir):
+        directory = os.path.join(cache_dir, self.DIR_NAME)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Concurrent builds.
+                pass
+        FileSystemBytecodeCache.__init__(self, directory)
+
+    def get_bucket(self, environment, name, filename, source):
+        fingerprint = hashlib.sha512(source.encode("utf-8")).hexdigest()
+        key = "{}_{}".format(name.replace("/", "_"), fingerprint)
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket):
+        try:
+            FileSystemBytecodeCache.load_bytecode(self, bucket)
+        except Exception as e:
+            logging.debug("Can't load compiled template {}: {}".format(
+                bucket.key, str(e)))
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        # Written to a temporary file first, then renamed: the
+        # cache directory can be shared among concurrent builds.
+        path = self._get_cache_filename(bucket)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                bucket.write_bytecode(f)
+            os.rename(tmp_path, path)
+        except Exception as e:
+            logging.debug("Can't save compiled template {}: {}".format(
+                bucket.key, str(e)))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
 class ConfigBuilder(object):
     """The base configuration builder class.
@@ -57,6 +121,14 @@ class ConfigBuilder(object):
 
     IGNORABLE_ISSUES = []
 
+    # Filters and tests added to the Jinja2 environment by
+    # render_template() and enrich_j2_environment(); templates
+    # can't be compiled without them.
+    J2_FILTERS = ("community_is_set", "ipaddr_ver", "include_local_file",
+                  "target_version_ge", "target_version_le",
+                  "get_normalized_rtt")
+    J2_TESTS = ("current_ipver",)
+
     def validate_bgpspeaker_specific_configuration(self):
         """Check compatibility between config and target BGP speaker
 
@@ -90,6 +162,40 @@ class ConfigBuilder(object):
     def enrich_j2_environment(self, env):
         pass
 
+    @staticmethod
+    def get_j2_environment(template_dir, cache_dir):
+        return Environment(
+            loader=FileSystemLoader(template_dir),
+            trim_blocks=True,
+            lstrip_blocks=True,
+            undefined=StrictUndefined,
+            bytecode_cache=TemplatesBytecodeCache(cache_dir)
+        )
+
+    @classmethod
+    def precompile_templates(cls, template_dir, cache_dir):
+        """Compile templates and store them in the cache directory.
+
+        The compiled templates are then used by the following
+        builds; returns the number of templates that have been
+        compiled.
+        """
+
+        def placeholder(*args, **kwargs):
+            raise AssertionError("Only used to compile templates.")
+
+        env = cls.get_j2_environment(template_dir, cache_dir)
+        for name in cls.J2_FILTERS:
+            env.filters.setdefault(name, placeholder)
+        for name in cls.J2_TESTS:
+            env.tests.setdefault(name, placeholder)
+
+        cnt = 0
+        for name in env.list_templates(extensions=["j2"]):
+            env.get_template(name)
+            cnt += 1
+        return cnt
+
     @staticmethod
     def _get_cfg(obj_or_path, cls, descr, **kwargs):
         assert obj_or_path is not None
@@ -122,14 +228,17 @@ class ConfigBuilder(object):
 
     def __init__(self, template_dir=None, template_name=None,
                  cache_dir=None, cache_expiry=CachedObject.DEFAULT_EXPIRY,
+                 cache_backend="files",
                  bgpq3_path="bgpq3", bgpq3_host=IRRDBInfo.BGPQ3_DEFAULT_HOST,
                  bgpq3_sources=IRRDBInfo.BGPQ3_DEFAULT_SOURCES,
+                 irrdb_client="bgpq3", irrdb_whois_connections=16,
+                 irrdb_memory_cache_size=256,
                  rtt_getter_path=None, threads=4,
                  ip_ver=None, perform_graceful_shutdown=False,
                  ignore_errors=[], live_tests=False,
                  local_files=[], local_files_dir=None, target_version=None,
                  cfg_general=None, cfg_bogons=None, cfg_clients=None,
-                 **kwargs):
+                 incremental=False, **kwargs):
         """Initialize the configuration builder.
 
         Here, external data sources are also queried to enrich the
@@ -200,6 +309,14 @@ class ConfigBuilder(object):
 
                 - *cache_expiry* program's configuration file option.
 
+            cache_backend (str): how cached data is stored: "files", one
+                file for each object within *cache_dir*, or "sqlite", a
+                single SQLite database within *cache_dir*.
+
+                Same of:
+
+                - *cache_backend* program's configuration file option.
+
             ip_ver (int): if *None*, the output configuration will be targeted
                 for both IPv4 and IPv6; otherwise, set this to *4* or to
                 *6* to obtain AFI-specific output configuration.
@@ -306,6 +423,36 @@ class ConfigBuilder(object):
 
                 - *bgpq3_sources* program's configuration file option.
 
+            irrdb_client (str): how IRRDBs are queried: "bgpq3" to run
+                the external program, "whois" to connect directly to the
+                IRRd whois server set in *bgpq3_host*, using a pool of
+                persistent sessions and pipelining the queries;
+                *bgpq3_sources* is used in both cases.
+
+                Same of:
+
+                - *irrdb_client* program's configuration file option.
+
+            irrdb_whois_connections (int): max number of concurrent
+                connections opened toward the IRRd whois server when
+                *irrdb_client* is "whois"; the AS-SETs are expanded by
+                as many threads.
+
+                Same of:
+
+                - *irrdb_whois_connections* program's configuration file
+                  option.
+
+            irrdb_memory_cache_size (int): max amount of IRRDB data
+                (AS-SETs origin ASNs and prefixes), in MB, that is kept
+                in memory once loaded; the least recently used data is
+                loaded again from disk when needed.
+
+                Same of:
+
+                - *irrdb_memory_cache_size* program's configuration file
+                  option.
+
             rtt_getter_path (str): path to the program that is executed to
                 determine the RTT of a peer.
                 Syntax and details can be found at the following URL:
@@ -322,26 +469,28 @@ class ConfigBuilder(object):
 
                 - *threads* program's configuration file option.
 
+            incremental (bool): when True, the AS-SET bundles whose inputs
+                did not change since the previous build are not refreshed
+                from IRRDBs: their cached data is used even if it's expired.
+                Only new or changed bundles are expanded using bgpq3.
+
+                Same of:
+
+                - *--incremental* CLI argument.
+
             kwargs: additional arguments used by BGP daemon specific builder
                 classes.
 
             live_tests (bool): only used on live tests.
         """
 
-        # Parameters initialization
+        init_start_time = time.time()
 
-        self.template_dir = self._check_is_dir(
-            "template_dir", template_dir
-        )
-
-        self.template_name = template_name
-        if not self.template_name:
-            raise MissingArgumentError("template_name")
+        # Parameters initialization
 
-        self.template_path = os.path.join(self.template_dir,
-                                          self.template_name)
-        if not os.path.isfile(self.template_path):
-            raise MissingFileError(self.template_path)
+        self._set_target(template_dir, template_name, ip_ver,
+                         ignore_errors, local_files, local_files_dir,
+                         target_version, kwargs)
 
         self.cache_dir = self._check_is_dir(
             "cache_dir", cache_dir
@@ -349,14 +498,34 @@ class ConfigBuilder(object):
 
         self.cache_expiry = normalize_expiry_time(cache_expiry)
 
+        if cache_backend not in CachedObject.CACHE_BACKENDS:
+            raise BuilderError(
+                "Invalid cache backend: {}; it must be one of {}".format(
+                    cache_backend, ", ".join(CachedObject.CACHE_BACKENDS)
+                )
+            )
+        self.cache_backend = cache_backend
+
         self.bgpq3_path = bgpq3_path
         self.bgpq3_host = bgpq3_host
         self.bgpq3_sources = bgpq3_sources
 
+        if irrdb_client not in IRRDBInfo.IRRDB_CLIENTS:
+            raise BuilderError(
+                "Invalid IRRDB client: {}; it must be one of {}".format(
+                    irrdb_client, ", ".join(IRRDBInfo.IRRDB_CLIENTS)
+                )
+            )
+        self.irrdb_client = irrdb_client
+        self.irrdb_whois_connections = irrdb_whois_connections
+        self.irrdb_memory_cache_size = irrdb_memory_cache_size
+
         self.rtt_getter_path = rtt_getter_path
 
         self.threads = threads
 
+        self.incremental = incremental
+
         try:
             with open(os.path.join(self.cache_dir, "write_test"), "w") as f:
                 f.write("OK")
@@ -367,23 +536,25 @@ class ConfigBuilder(object):
                 )
             )
 
-        self.ip_ver = ip_ver
-        if self.ip_ver is not None:
-            self.ip_ver = int(self.ip_ver)
-            if self.ip_ver not in (4, 6):
-                raise BuilderError("Invalid IP version: {}".format(ip_ver))
+        # Expired objects would be fetched again anyway, unless an
+        # incremental build is running or they can be revalidated.
+        if self.cache_backend == "sqlite" and not self.incremental:
+            try:
+                purged = SQLiteCache.get(self.cache_dir).purge_expired()
+                if purged:
+                    logging.debug("{} expired objects removed from the "
+                                  "cache".format(purged))
+            except Exception as e:
+                raise BuilderError(
+                    "Can't open the cache database in {}: {}".format(
+                        self.cache_dir, str(e)
+                    )
+                )
 
         self.perform_graceful_shutdown = perform_graceful_shutdown
 
-        self.ignore_errors = ignore_errors or []
-
         self.live_tests = live_tests
 
-        self.local_files = local_files
-        self.local_files_dir = local_files_dir
-
-        self.target_version = target_version or self.DEFAULT_VERSION
-
         try:
             self.cfg_general = self._get_cfg(cfg_general,
                                              ConfigParserGeneral,
@@ -409,15 +580,27 @@ class ConfigBuilder(object):
                                          "clients",
                                          general_cfg=self.cfg_general)
 
-        self.kwargs = kwargs
-
         # Initially None; is set to IRRDB() and finally populated by
         # the IRRDB enrichers.
         # { "<as_set_bundle_id>": <IRRDBRecord>, ... }
         self.irrdb_info = None
 
-        # { "<len>": [{"prefix": "<ip>/<len>", "max_len": x, "asn": "AS<n>"}]
-        self.rpki_roas = {}
+        # IRRDBBuildManifest(), set by the IRRDB enrichers.
+        self.irrdb_manifest = None
+
+        # IRRdASSetResolver(), set by the IRRDB enrichers when the
+        # 'whois' IRRDB client is used; shared by the ASNs and the
+        # prefixes enrichers.
+        self.irrdb_whois_resolver = None
+
+        # IRRdWhoisSessionPool(), shared by the ASNs and the prefixes
+        # enrichers when the 'whois' IRRDB client is used, and the
+        # number of enrichers that are using it.
+        self.irrdb_whois_pool = None
+        self.irrdb_whois_pool_users = 0
+
+        # ROAList(), sorted by prefix length, prefix and ASN
+        self.rpki_roas = ROAList()
 
         # { "<origin_asn>": ["a/b", "c/d"] }
         self.arin_whois_records = {}
@@ -425,6 +608,59 @@ class ConfigBuilder(object):
 
         # Validation
 
+        self._validate_target()
+
+        build_stats.observe("build_phase_seconds",
+                            time.time() - init_start_time,
+                            phase="config_load")
+
+        # Processing
+
+        logging.info("Started processing configuration "
+                     "for {}".format(self.template_path))
+
+        start_time = int(time.time())
+
+        with build_stats.timer("build_phase_seconds", phase="enrichment"):
+            self.enrich_config()
+
+        stop_time = int(time.time())
+
+        logging.info("Configuration processing completed after "
+                     "{} seconds.".format(stop_time - start_time))
+
+    def _set_target(self, template_dir, template_name, ip_ver,
+                    ignore_errors, local_files, local_files_dir,
+                    target_version, kwargs):
+        self.template_dir = self._check_is_dir(
+            "template_dir", template_dir
+        )
+
+        self.template_name = template_name
+        if not self.template_name:
+            raise MissingArgumentError("template_name")
+
+        self.template_path = os.path.join(self.template_dir,
+                                          self.template_name)
+        if not os.path.isfile(self.template_path):
+            raise MissingFileError(self.template_path)
+
+        self.ip_ver = ip_ver
+        if self.ip_ver is not None:
+            self.ip_ver = int(self.ip_ver)
+            if self.ip_ver not in (4, 6):
+                raise BuilderError("Invalid IP version: {}".format(ip_ver))
+
+        self.ignore_errors = ignore_errors or []
+
+        self.local_files = local_files
+        self.local_files_dir = local_files_dir
+
+        self.target_version = target_version or self.DEFAULT_VERSION
+
+        self.kwargs = kwargs
+
+    def _validate_target(self):
         if self.local_files:
             if not isinstance(self.local_files, list):
                 raise BuilderError(
@@ -443,23 +679,106 @@ class ConfigBuilder(object):
                 "One or more compatibility issues have been found."
             )
 
-        # Processing
+    def _restrict_to_ip_ver(self):
+        # Only the data related to the current IP version is kept,
+        # as if the enrichers had been run for it alone.
+        ip_ver = self.ip_ver
 
-        logging.info("Started processing configuration "
-                     "for {}".format(self.template_path))
+        bundle_ids = set()
+        used_by = set()
+        for client in self.cfg_clients.cfg["clients"]:
+            if parse_ip_network(client["ip"]).version != ip_ver:
+                continue
+            irrdb_cfg = client["cfg"]["filtering"]["irrdb"]
+            bundle_ids.update(irrdb_cfg.get("as_set_bundle_ids", []))
+            used_by.add("client {}".format(client["id"]))
+            used_by.add("client {} white list".format(client["id"]))
+
+        # Origin ASNs authorized for the clients of this IP version.
+        origin_asns = None
+        if self.irrdb_info is not None:
+            self.irrdb_info = self.irrdb_info.get_view(bundle_ids, ip_ver,
+                                                       used_by)
+            origin_asns = set()
+            for bundle_id in self.irrdb_info:
+                origin_asns.update(self.irrdb_info[bundle_id].asns)
+
+        # When ROAs are used only as route objects, only those
+        # for the authorized origin ASNs are needed.
+        all_roas = origin_asns is None or \
+            self.cfg_general["filtering"]["rpki_bgp_origin_validation"]["enabled"]
+
+        self.rpki_roas = self.rpki_roas.filter(
+            afis=set([ip_ver]), asns=None if all_roas else origin_asns
+        )
 
-        start_time = int(time.time())
+        for attr in ("arin_whois_records", "registrobr_whois_records"):
+            records = {}
+            for origin_asn, record in getattr(self, attr).items():
+                if origin_asns is not None and \
+                    int(origin_asn[2:]) not in origin_asns:
+                    continue
+                record = record.get_view(ip_ver)
+                if record.has_prefixes():
+                    records[origin_asn] = record
+            setattr(self, attr, records)
+
+    def get_target_builder(self, builder_class, template_dir,
+                           template_name=None, ip_ver=None,
+                           ignore_errors=None, local_files=[],
+                           local_files_dir=None, target_version=None,
+                           **kwargs):
+        """Return a builder for another target, using the same data.
+
+        The builder that is returned shares the configuration and the
+        data gathered by the enrichers with this one, which must have
+        been initialized with *ip_ver* = *None*: the enrichers are not
+        run again.
+
+        When *ip_ver* is set, only the data related to that IP version
+        is used by the new builder.
 
-        self.enrich_config()
+        Args:
 
-        stop_time = int(time.time())
+            builder_class: the class of the new builder
+                (BIRDConfigBuilder, OpenBGPDConfigBuilder, ...).
 
-        logging.info("Configuration processing completed after "
-                     "{} seconds.".format(stop_time - start_time))
+            Other arguments have the same meaning of those used in
+            ``__init__``; *template_name* and *ignore_errors*, when not
+            set, are taken from this builder.
+        """
 
-    def enrich_config(self):
-        errors = False
+        if self.ip_ver is not None:
+            raise BuilderError(
+                "Target builders can be obtained only from builders "
+                "that have been initialized for both IPv4 and IPv6."
+            )
+
+        builder = builder_class.__new__(builder_class)
+        builder.__dict__.update(self.__dict__)
+
+        builder._set_target(
+            template_dir, template_name or self.template_name, ip_ver,
+            ignore_errors if ignore_errors is not None else self.ignore_errors,
+            local_files, local_files_dir, target_version, kwargs
+        )
+        builder._validate_target()
+
+        if builder.ip_ver is not None:
+            builder._restrict_to_ip_ver()
+
+        return builder
 
+    def __getstate__(self):
+        # Objects used only while the enrichers are running can't
+        # be sent to other processes.
+        state = self.__dict__.copy()
+        state["irrdb_manifest"] = None
+        state["irrdb_whois_resolver"] = None
+        state["irrdb_whois_pool"] = None
+        return state
+
+    def enrich_config(self):
         # Unique ASNs from clients list.
         clients_asns = {}
 
@@ -487,11 +806,13 @@ class ConfigBuilder(object):
             self.cfg_general["communities"][comm_name]["peer_as"] = comm.get("peer_as", False)
 
         # Enrichers
-        # Order matters: AS-SET from PeeringDB must be run first
-        # in order to acquire missing AS-SETs that are processed
-        # later by IRRDB enrichers. RPKI ROAs (when only used as
-        # route objects) are processed only
-        # for those origin ASNs that have been gathered from AS-SETs.
+        # They are run concurrently, each one as soon as those it
+        # depends on (DEPENDS_ON) are completed: AS-SET from PeeringDB
+        # must be run first in order to acquire missing AS-SETs that
+        # are processed later by IRRDB enrichers. RPKI ROAs (when only
+        # used as route objects) and the whois DB dumps are processed
+        # only for those origin ASNs that have been gathered from
+        # AS-SETs.
         filtering = self.cfg_general["filtering"]
         irrdb_cfg = filtering["irrdb"]
         used_enricher_classes = []
@@ -507,8 +828,8 @@ class ConfigBuilder(object):
             used_enricher_classes.append(RTTGetterConfigEnricher)
 
         if self.cfg_general.rpki_roas_needed and \
-            self.cfg_general["rpki_roas"]["source"] == \
-                "ripe-rpki-validator-cache":
+            self.cfg_general["rpki_roas"]["source"] in \
+                RPKIROAsEnricher.SOURCES:
             used_enricher_classes.append(RPKIROAsEnricher)
 
         if irrdb_cfg["use_arin_bulk_whois_data"]["enabled"]:
@@ -517,16 +838,7 @@ class ConfigBuilder(object):
         if irrdb_cfg["use_registrobr_bulk_whois_data"]["enabled"]:
             used_enricher_classes.append(RegistroBRWhoisDBDumpEnricher)
 
-        for enricher_class in used_enricher_classes:
-            enricher = enricher_class(self, threads=self.threads)
-            try:
-                enricher.enrich()
-            except ARouteServerError as e:
-                errors = True
-                if str(e):
-                    logging.error(str(e))
-
-        if errors:
+        if not run_enrichers(self, used_enricher_classes, self.threads):
             raise BuilderError()
 
     def _include_local_file(self, local_file_id):
@@ -550,16 +862,6 @@ class ConfigBuilder(object):
                 be written.
         """
 
-        def sorted_rpki_roas():
-            """Returns a list of ROAs, sorted by prefix length, prefix, ASN"""
-            res = []
-            prefix_lengths = sorted(map(int, self.rpki_roas.keys()))
-            for pref_len in prefix_lengths:
-                for roa in sorted(self.rpki_roas[str(pref_len)],
-                                  key=lambda r: (r["prefix"], r["asn"])):
-                    res.append(roa)
-            return res
-
         self.data = {}
         self.data["ip_ver"] = self.ip_ver
         self.data["cfg"] = self.cfg_general
@@ -567,7 +869,7 @@ class ConfigBuilder(object):
         self.data["clients"] = self.cfg_clients
         self.data["asns"] = self.cfg_asns
         self.data["irrdb_info"] = self.irrdb_info
-        self.data["rpki_roas"] = sorted_rpki_roas()
+        self.data["rpki_roas"] = self.rpki_roas
         self.data["arin_whois_records"] = self.arin_whois_records
         self.data["registrobr_whois_records"] = self.registrobr_whois_records
         self.data["live_tests"] = self.live_tests
@@ -576,12 +878,12 @@ class ConfigBuilder(object):
         self.data["perform_graceful_shutdown"] = self.perform_graceful_shutdown
 
         def ipaddr_ver(ip):
-            return IPNetwork(ip).version
+            return parse_ip_network(ip).version
 
         def current_ipver(ip):
             if self.ip_ver is None:
                 return True
-            return IPNetwork(ip).version == self.ip_ver
+            return parse_ip_network(ip).version == self.ip_ver
 
         def include_local_file(local_file_id):
             if local_file_id not in self.LOCAL_FILES_IDS:
@@ -622,12 +924,7 @@ class ConfigBuilder(object):
                 return False
             return True
 
-        env = Environment(
-            loader=FileSystemLoader(self.template_dir),
-            trim_blocks=True,
-            lstrip_blocks=True,
-            undefined=StrictUndefined
-        )
+        env = self.get_j2_environment(self.template_dir, self.cache_dir)
         env.tests["current_ipver"] = current_ipver
         env.filters["community_is_set"] = community_is_set
         env.filters["ipaddr_ver"] = ipaddr_ver
@@ -641,6 +938,7 @@ class ConfigBuilder(object):
         tpl = env.get_template(self.template_name)
 
         start_time = int(time.time())
+        render_start_time = time.time()
 
         logging.info("Started template rendering "
                      "for {}".format(self.template_path))
@@ -659,6 +957,10 @@ class ConfigBuilder(object):
         finally:
             stop_time = int(time.time())
 
+            build_stats.observe("template_render_seconds",
+                                time.time() - render_start_time,
+                                template=self.template_path)
+
             logging.info("Template rendering completed after "
                         "{} seconds.".format(stop_time - start_time))
 
@@ -688,6 +990,10 @@ class BIRDConfigBuilder(ConfigBuilder):
     AVAILABLE_VERSION = ["1.6.3", "1.6.4"]
     DEFAULT_VERSION = "1.6.4"
 
+    J2_FILTERS = ConfigBuilder.J2_FILTERS + ("hook_is_set",
+                                             "prefix_list_entry",
+                                             "prefix_list", "roa_table")
+
     def validate_bgpspeaker_specific_configuration(self):
         if self.ip_ver is None:
             raise BuilderError(
@@ -724,7 +1030,13 @@ class BIRDConfigBuilder(ConfigBuilder):
             hooks = self.kwargs.get("hooks", []) or []
             return hook_name in hooks
 
+        def prefix_list(prefix_list, group=False):
+            return bird_prefix_list(prefix_list, self.ip_ver, group)
+
         env.filters["hook_is_set"] = hook_is_set
+        env.filters["prefix_list_entry"] = bird_prefix_list_entry
+        env.filters["prefix_list"] = prefix_list
+        env.filters["roa_table"] = bird_roa_table
 
 class OpenBGPDConfigBuilder(ConfigBuilder):
     """OpenBGPD configuration builder.
@@ -740,6 +1052,12 @@ class OpenBGPDConfigBuilder(ConfigBuilder):
     AVAILABLE_VERSION = ["6.0", "6.1", "6.2", "6.3", "6.4"]
     DEFAULT_VERSION = "6.3"
 
+    J2_FILTERS = ConfigBuilder.J2_FILTERS + ("convert_ext_comm",
+                                             "prefix_list_entry",
+                                             "prefix_list", "prefixset_list",
+                                             "origin_set", "roa_set",
+                                             "roas_action")
+
     IGNORABLE_ISSUES = ["path_hiding", "transit_free_action",
                         "add_path", "max_prefix_action",
                         "blackhole_filtering_rewrite_ipv6_nh",
@@ -981,20 +1299,22 @@ class OpenBGPDConfigBuilder(ConfigBuilder):
         use_rpki_roas_as_route_objects_cfg = \
             self.cfg_general["filtering"]["irrdb"]["use_rpki_roas_as_route_objects"]
         if use_rpki_roas_as_route_objects_cfg["enabled"]:
-            if self.cfg_general["rpki_roas"]["source"] != "ripe-rpki-validator-cache":
+            if self.cfg_general["rpki_roas"]["source"] not in RPKIROAsEnricher.SOURCES:
                 if not self.process_bgpspeaker_specific_compatibility_issue(
                     "rpki_roas_as_route_objects_source",
                     "For OpenBGPD only the 'ripe-rpki-validator-cache' "
-                    "value is allowed for the 'rpki_roas.source' option."
+                    "and 'rtr' values are allowed for the "
+                    "'rpki_roas.source' option."
                 ):
                     res = False
 
         if self.cfg_general.rpki_roas_needed:
-            if self.cfg_general["rpki_roas"]["source"] != "ripe-rpki-validator-cache":
+            if self.cfg_general["rpki_roas"]["source"] not in RPKIROAsEnricher.SOURCES:
                 if not self.process_bgpspeaker_specific_compatibility_issue(
                     "rpki_roas_source",
                     "For OpenBGPD only the 'ripe-rpki-validator-cache' "
-                    "value is allowed for the 'rpki_roas.source' option."
+                    "and 'rtr' values are allowed for the "
+                    "'rpki_roas.source' option."
                 ):
                     res = False
 
@@ -1029,20 +1349,25 @@ class OpenBGPDConfigBuilder(ConfigBuilder):
             return True
 
         def aggregated_roas_covered_space():
-            prefixes = []
-            for pref_len in self.rpki_roas:
-                for roa in self.rpki_roas[pref_len]:
-                    prefixes.append(roa["prefix"])
-            return aggregate(prefixes)
+            return aggregate(self.rpki_roas.prefixes)
 
         env.filters["convert_ext_comm"] = convert_ext_comm
         env.filters["community_is_set"] = community_is_set
+        env.filters["prefix_list_entry"] = openbgpd_prefix_list_entry
+        env.filters["prefix_list"] = openbgpd_prefix_list
+        env.filters["prefixset_list"] = openbgpd_prefixset_list
+        env.filters["origin_set"] = openbgpd_origin_set
+        env.filters["roa_set"] = openbgpd_roa_set
+        env.filters["roas_action"] = openbgpd_roas_action
         self.data["at_least_one_client_uses_tag_reject_policy"] = \
             at_least_one_client_uses_tag_reject_policy()
         self.data["rpki_roas_covered_space"] = aggregated_roas_covered_space()
 
 class TemplateContextDumper(ConfigBuilder):
 
+    J2_FILTERS = ConfigBuilder.J2_FILTERS + ("to_yaml", "parse_irrdb_info",
+                                             "parse_generic_irr_whois_records")
+
     def enrich_j2_environment(self, env):
 
         def to_yaml(obj):
@@ -1064,3 +1389,69 @@ class TemplateContextDumper(ConfigBuilder):
         env.filters["to_yaml"] = to_yaml
         env.filters["parse_irrdb_info"] = parse_irrdb_info
         env.filters["parse_generic_irr_whois_records"] = parse_generic_irr_whois_records
+
+def _render_target(target):
+    builder, output_path = target
+    try:
+        with open(output_path, "w") as f:
+            builder.render_template(output_file=f)
+    except Exception as e:
+        # Exceptions (and their tracebacks) can't be always sent
+        # back to the parent process.
+        return "{}: {}".format(output_path, str(e) or "unknown error")
+    return None
+
+def _render_target_in_pool(target):
+    # Metrics collected here are sent back to the parent process,
+    # that merges them into its own ones.
+    build_stats.reset()
+    err = _render_target(target)
+    return err, build_stats.export()
+
+def render_targets(targets, processes=None):
+    """Render the output configuration of several builders.
+
+    Templates are rendered concurrently, using a pool of processes.
+
+    Raises:
+
+        TemplateRenderingError, when the rendering of one or more
+          targets failed.
+
+    Args:
+
+        targets (list): (builder, output_path) tuples; builders are
+            usually obtained using ``ConfigBuilder.get_target_builder``.
+
+        processes (int): size of the pool of processes; when *None*,
+            the number of CPUs is used, up to the number of targets.
+    """
+
+    if not processes:
+        processes = min(len(targets), multiprocessing.cpu_count())
+
+    logging.info("Started rendering {} targets using {} "
+                 "processes".format(len(targets), processes))
+
+    if processes <= 1 or len(targets) <= 1:
+        errors = [_render_target(target) for target in targets]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_render_target_in_pool, targets, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        errors = []
+        for err, stats in results:
+            errors.append(err)
+            build_stats.merge(stats)
+
+    errors = [err for err in errors if err]
+    if errors:
+        raise TemplateRenderingError(
+            "Error while rendering templates: {}".format(
+                "; ".join(errors)
+            )
+        )
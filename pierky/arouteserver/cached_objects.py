@@ -15,11 +15,23 @@
 
 import json
 import logging
+import mmap
 import os
+import six
+import sqlite3
+import struct
+import threading
 import time
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from .errors import CachedObjectsError, ExternalDataNoInfoError, \
                     CachedObjectsExpiryTimeConfigurationError
+from .build_stats import build_stats
+from .http_client import http_get, get_validators, HTTPNotModified
 
 
 def normalize_expiry_time(config=None):
@@ -63,6 +75,247 @@ def normalize_expiry_time(config=None):
             res[k] = res["general"]
     return res
 
+class JSONCacheSerializer(object):
+    """Plain JSON file: {"ts": <epoch>, "data": <data>, "meta": <meta>}
+
+    "meta" is optional.
+    """
+
+    EXTENSION = "json"
+    BINARY = False
+
+    @staticmethod
+    def dump(f, ts, data, meta=None):
+        dic = {"ts": ts, "data": data}
+        if meta:
+            dic["meta"] = meta
+        json.dump(dic, f)
+
+    @staticmethod
+    def load(f):
+        """Returns (ts, get_data, meta) or (None, None, None) if the
+        file is invalid.
+
+        get_data is a function that returns the cached data.
+        """
+        dic = json.load(f)
+
+        if "ts" not in dic:
+            return None, None, None
+        if "data" not in dic:
+            return None, None, None
+
+        return dic["ts"], lambda: dic["data"], dic.get("meta") or {}
+
+class MsgPackCacheSerializer(object):
+    """Compact binary format, for large objects.
+
+    Layout: magic (4 bytes), version (1 byte), timestamp (8 bytes),
+    flags (1 byte), then the msgpack-encoded data.
+    When FLAG_META is set, the msgpack-encoded metadata, preceded by
+    its length (4 bytes), is between the header and the data.
+
+    The timestamp is read from the fixed-size header and the data is
+    memory-mapped, so that it's decoded only when the cache is not
+    expired. Truncated files are treated as cache misses.
+    Data must be JSON-compatible.
+    """
+
+    EXTENSION = "msgpack"
+    BINARY = True
+
+    MAGIC = b"ARSC"
+    VERSION = 1
+    HEADER = struct.Struct("!4sBQB")
+
+    FLAG_NO_DATA = 0x01
+    FLAG_META = 0x02
+
+    META_LEN = struct.Struct("!I")
+
+    @classmethod
+    def dump(cls, f, ts, data, meta=None):
+        flags = cls.FLAG_NO_DATA if data is None else 0
+        if meta:
+            flags |= cls.FLAG_META
+        f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, ts, flags))
+        if meta:
+            packed_meta = msgpack.packb(meta, use_bin_type=True)
+            f.write(cls.META_LEN.pack(len(packed_meta)))
+            f.write(packed_meta)
+        if data is not None:
+            f.write(msgpack.packb(data, use_bin_type=True))
+
+    @classmethod
+    def load(cls, f):
+        header = f.read(cls.HEADER.size)
+        if len(header) < cls.HEADER.size:
+            return None, None, None
+
+        magic, version, ts, flags = cls.HEADER.unpack(header)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            return None, None, None
+
+        data_offset = cls.HEADER.size
+        meta = {}
+        if flags & cls.FLAG_META:
+            meta_len = cls.META_LEN.unpack(f.read(cls.META_LEN.size))[0]
+            meta = msgpack.unpackb(f.read(meta_len), raw=False)
+            data_offset += cls.META_LEN.size + meta_len
+
+        if flags & cls.FLAG_NO_DATA:
+            return ts, lambda: None, meta
+
+        # The mapping outlives the file object, so that stale data
+        # can be decoded later; it's closed once the data is decoded.
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        decoded = []
+
+        def get_data():
+            if decoded:
+                return decoded[0]
+
+            try:
+                if six.PY2:
+                    data = msgpack.unpackb(mm[data_offset:], raw=False)
+                else:
+                    payload = memoryview(mm)[data_offset:]
+                    try:
+                        data = msgpack.unpackb(payload, raw=False)
+                    finally:
+                        payload.release()
+            finally:
+                mm.close()
+
+            decoded.append(data)
+            return data
+
+        return ts, get_data, meta
+
+# Used for large objects (RPKI ROAs, Whois DB dumps), when msgpack
+# is available.
+COMPACT_CACHE_SERIALIZER = MsgPackCacheSerializer if msgpack \
+                           else JSONCacheSerializer
+
+class SQLiteCache(object):
+    """Single-file cache backend.
+
+    All the objects are stored in the 'cache' table of the
+    <cache_dir>/cache.sqlite database, indexed by kind (class name)
+    and key (object filename). The database is in WAL mode, so it can
+    be safely shared among threads and concurrent builds.
+
+    Use SQLiteCache.get(cache_dir) to get the instance for a given
+    cache directory.
+    """
+
+    FILENAME = "cache.sqlite"
+
+    # How long expired objects that can be revalidated are kept.
+    STALE_GRACE_PERIOD = 30 * 86400
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS cache ("
+        "  kind TEXT NOT NULL,"
+        "  key TEXT NOT NULL,"
+        "  ts INTEGER NOT NULL,"
+        "  expires INTEGER NOT NULL,"
+        "  format TEXT NOT NULL,"
+        "  data BLOB,"
+        "  meta TEXT,"
+        "  PRIMARY KEY (kind, key)"
+        ")",
+        "CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)",
+    )
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, cache_dir):
+        path = os.path.join(cache_dir, cls.FILENAME)
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def __init__(self, path):
+        self.path = path
+
+        # sqlite3 connections can't be shared among threads.
+        self.local = threading.local()
+
+        conn = self._get_conn()
+        with conn:
+            for stmt in self.SCHEMA:
+                conn.execute(stmt)
+
+    def _get_conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def load(self, kind, key):
+        """Returns (ts, format, data, meta) or (None, None, None, None).
+
+        meta is a dict.
+        """
+
+        row = self._get_conn().execute(
+            "SELECT ts, format, data, meta FROM cache "
+            "WHERE kind = ? AND key = ?",
+            (kind, key)
+        ).fetchone()
+
+        if row is None:
+            return None, None, None, None
+
+        ts, fmt, data, meta = row
+        return ts, fmt, data, json.loads(meta) if meta else {}
+
+    def save(self, kind, key, ts, expires, fmt, data, meta=None):
+        conn = self._get_conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache "
+                "(kind, key, ts, expires, format, data, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, key, ts, expires, fmt, data,
+                 json.dumps(meta) if meta else None)
+            )
+
+    def count_expired(self, epoch_time=None):
+        if epoch_time is None:
+            epoch_time = int(time.time())
+
+        return self._get_conn().execute(
+            "SELECT COUNT(*) FROM cache WHERE expires <= ?", (epoch_time,)
+        ).fetchone()[0]
+
+    def purge_expired(self, epoch_time=None):
+        """Remove the expired objects; returns their number.
+
+        Objects saved with metadata (HTTP validators, ...) are kept
+        until STALE_GRACE_PERIOD seconds after their expiry, since
+        their data can still be revalidated and used again.
+        """
+
+        if epoch_time is None:
+            epoch_time = int(time.time())
+
+        conn = self._get_conn()
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM cache WHERE expires <= ? AND "
+                "(meta IS NULL OR expires <= ?)",
+                (epoch_time, epoch_time - self.STALE_GRACE_PERIOD)
+            )
+        return cur.rowcount
+
 class CachedObject(object):
 
     DEFAULT_EXPIRY = {
@@ -74,6 +327,9 @@ class CachedObject(object):
         "registrobr_whois_db_dump": 43200
     }
 
+    # Keep in sync with config.d/arouteserver.yml cache_backend
+    CACHE_BACKENDS = ("files", "sqlite")
+
     # Keep in sync with config.d/arouteserver.yml cache_expiry
     ALLOWED_EXPIRY_TIME_TAGS = ("general", "pdb_info", "ripe_rpki_roas",
                                 "irr_as_sets", "arin_whois_db_dump",
@@ -82,6 +338,8 @@ class CachedObject(object):
 
     MISSING_INFO_EXCEPTION = ExternalDataNoInfoError
 
+    CACHE_SERIALIZER = JSONCacheSerializer
+
     def get_expiry_time(self, cache_expiry):
         return cache_expiry[self.EXPIRY_TIME_TAG]
 
@@ -96,60 +354,196 @@ class CachedObject(object):
         else:
             self.cache_expiry_time = cache_expiry[self.EXPIRY_TIME_TAG]
 
+        # When True, data found in the cache is used even if it's
+        # expired (incremental builds).
+        self.ignore_cache_expiry = kwargs.get("ignore_cache_expiry", False)
+
+        # "files": one file for each object within cache_dir;
+        # "sqlite": a single SQLiteCache database within cache_dir.
+        self.cache_backend = kwargs.get("cache_backend") or "files"
+        if self.cache_backend not in self.CACHE_BACKENDS:
+            raise CachedObjectsError(
+                "Unknown cache backend: {}".format(self.cache_backend)
+            )
+
         self.raw_data = None
         self.bypass_cache = False
         self.from_cache = False
 
+        # Metadata saved in the cache along with the data: URL and
+        # validators (ETag, Last-Modified) of the HTTP response
+        # the data comes from, or anything else that allows to
+        # update the data once expired (RTR session ID and serial).
+        self.http_meta = {}
+
+        # When the data found in the cache is expired but it can be
+        # revalidated, this is a function that returns it.
+        self.get_stale_data = None
+
+        # Set when the data found in the cache is expired.
+        self.cache_expired = False
+
     def _get_object_filename(self):
         raise NotImplementedError()
 
     def _get_object_filepath(self):
-        return os.path.join(self.cache_dir, self._get_object_filename())
+        filename = self._get_object_filename()
+
+        # Objects filenames are "<name>.json": the extension is
+        # changed on the basis of the serializer that is used.
+        ext = self.CACHE_SERIALIZER.EXTENSION
+        if ext != JSONCacheSerializer.EXTENSION and filename.endswith(".json"):
+            filename = "{}.{}".format(filename[:-len(".json")], ext)
+
+        return os.path.join(self.cache_dir, filename)
+
+    def _set_stale_data(self, get_data, meta):
+        if meta.get("etag") or meta.get("last_modified"):
+            self.get_stale_data = get_data
+            self.http_meta = meta
+
+    def _is_expired(self, ts, descr):
+        epoch_time = int(time.time())
+
+        if ts <= epoch_time - self.cache_expiry_time:
+            if not self.ignore_cache_expiry:
+                return True
+            logging.debug("Cache expired but used anyway: {}".format(descr))
+
+        return False
+
+    def _load_data_from_files(self):
+        """Returns (found, data)."""
 
-    def load_data_from_cache(self):
         file_path = self._get_object_filepath()
 
         if not os.path.isfile(file_path):
-            return False
+            return False, None
+
+        serializer = self.CACHE_SERIALIZER
+
+        with open(file_path, "rb" if serializer.BINARY else "r") as f:
+            ts, get_data, meta = serializer.load(f)
+
+            if ts is None:
+                return False, None
+
+            if self._is_expired(ts, file_path):
+                self.cache_expired = True
+                self._set_stale_data(get_data, meta)
+                return False, None
+
+            self.http_meta = meta
+            return True, get_data()
+
+    def _load_data_from_sqlite(self):
+        """Returns (found, data)."""
 
+        kind = self.__class__.__name__
+        key = self._get_object_filename()
+
+        ts, fmt, data, meta = SQLiteCache.get(self.cache_dir).load(kind, key)
+
+        if ts is None:
+            return False, None
+
+        def get_data():
+            if fmt == MsgPackCacheSerializer.EXTENSION:
+                return msgpack.unpackb(data, raw=False)
+            return json.loads(data)
+
+        if self._is_expired(ts, "{} {}".format(kind, key)):
+            self.cache_expired = True
+            self._set_stale_data(get_data, meta)
+            return False, None
+
+        self.http_meta = meta
+        return True, get_data()
+
+    def load_data_from_cache(self):
         try:
-            with open(file_path, "r") as f:
-                data = json.load(f)
+            if self.cache_backend == "sqlite":
+                found, data = self._load_data_from_sqlite()
+            else:
+                found, data = self._load_data_from_files()
         except Exception as e:
             logging.error(
                 "Error while reading data from cache: {} - {}".format(
-                    file_path, str(e)
+                    self._get_object_filepath(), str(e)
                 )
             )
             return False
 
-        if "ts" not in data:
-            return False
-        if "data" not in data:
-            return False
-
-        epoch_time = int(time.time())
-
-        if data["ts"] <= epoch_time - self.cache_expiry_time:
+        if not found:
             return False
 
-        if data["data"] is None:
+        if data is None:
             logging.debug(
                 "Cache hit: missing info {}".format(self._get_object_filepath())
             )
             raise self.MISSING_INFO_EXCEPTION()
 
-        self.raw_data = data["data"]
+        self.raw_data = data
         return True
 
     def _get_data(self):
         raise NotImplementedError()
 
+    def _http_get(self, url, **kwargs):
+        """HTTP GET, to be used by _get_data() to fetch the object.
+
+        If the expired copy of the object found in the cache was
+        fetched from the same URL, the request is conditional: when
+        the server answers 304 Not Modified, HTTPNotModified is raised
+        and load_data() uses the cached copy.
+
+        kwargs are passed to http_client.http_get().
+        """
+        validators = None
+        if self.get_stale_data and not self.bypass_cache and \
+            self.http_meta.get("url") == url:
+            validators = self.http_meta
+
+        try:
+            response = http_get(url, validators=validators, **kwargs)
+        except HTTPNotModified as e:
+            # Servers are not required to send the validators again
+            # in 304 responses: the previous ones are kept, unless
+            # new ones are given.
+            if e.response is not None:
+                self.http_meta = dict(self.http_meta,
+                                      **get_validators(e.response))
+            raise
+
+        self.http_meta = {}
+        if response.ok:
+            validators = get_validators(response)
+            if validators:
+                self.http_meta = dict(validators, url=url)
+
+        return response
+
+    def _count_cache_lookup(self, result):
+        build_stats.incr("cache_lookups_total",
+                         object_type=self.__class__.__name__, result=result)
+
     def load_data(self):
-        if not self.bypass_cache and self.load_data_from_cache():
-            logging.debug("Cache hit: {}".format(self._get_object_filepath()))
-            self.from_cache = True
-            return
+        if not self.bypass_cache:
+            self.cache_expired = False
+            try:
+                found = self.load_data_from_cache()
+            except self.MISSING_INFO_EXCEPTION:
+                self._count_cache_lookup("hit")
+                raise
+
+            if found:
+                self._count_cache_lookup("hit")
+                logging.debug("Cache hit: {}".format(self._get_object_filepath()))
+                self.from_cache = True
+                return
+
+            self._count_cache_lookup("expired" if self.cache_expired
+                                     else "miss")
 
         # Children classes raise ExternalDataNoInfoError-derived exceptions
         # when no information can be obtained for the requested resource.
@@ -158,27 +552,53 @@ class CachedObject(object):
         try:
             self.raw_data = self._get_data()
             self.from_cache = False
+            self.get_stale_data = None
+        except HTTPNotModified:
+            logging.debug(
+                "Cache revalidated: {}".format(self._get_object_filepath())
+            )
+            build_stats.incr("cache_revalidations_total",
+                             object_type=self.__class__.__name__)
+            self.raw_data = self.get_stale_data()
+            self.from_cache = True
         except ExternalDataNoInfoError:
             self.save_data_to_cache()
             raise
 
         self.save_data_to_cache()
 
-    def save_data_to_cache(self):
+    def _save_data_to_files(self, epoch_time):
         file_path = self._get_object_filepath()
 
-        epoch_time = int(time.time())
+        serializer = self.CACHE_SERIALIZER
 
-        cache_data = {
-            "ts": epoch_time,
-            "data": self.raw_data
-        }
+        if not os.path.exists(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, "wb" if serializer.BINARY else "w") as f:
+            serializer.dump(f, epoch_time, self.raw_data, self.http_meta)
+
+    def _save_data_to_sqlite(self, epoch_time):
+        if self.CACHE_SERIALIZER is MsgPackCacheSerializer:
+            data = sqlite3.Binary(
+                msgpack.packb(self.raw_data, use_bin_type=True)
+            )
+        else:
+            data = json.dumps(self.raw_data)
+
+        SQLiteCache.get(self.cache_dir).save(
+            self.__class__.__name__, self._get_object_filename(),
+            epoch_time, epoch_time + self.cache_expiry_time,
+            self.CACHE_SERIALIZER.EXTENSION, data, self.http_meta
+        )
+
+    def save_data_to_cache(self):
+        epoch_time = int(time.time())
 
         try:
-            if not os.path.exists(os.path.dirname(file_path)):
-                os.makedirs(os.path.dirname(file_path))
-            with open(file_path, "w") as f:
-                json.dump(cache_data, f)
+            if self.cache_backend == "sqlite":
+                self._save_data_to_sqlite(epoch_time)
+            else:
+                self._save_data_to_files(epoch_time)
         except Exception as e:
             raise CachedObjectsError(
                 "Error while saving data to the cache: {}".format(str(e))
@@ -106,7 +106,8 @@ class ClientsFromEuroIXCommand(ARouteServerCommand):
     def run(self):
         euro_ix = EuroIXMemberList(self.args.url or self.args.input_file,
                                    program_config.get_dir("cache_dir"),
-                                   program_config.get("cache_expiry"))
+                                   program_config.get("cache_expiry"),
+                                   program_config.get("cache_backend"))
 
         if self.args.ixp_id:
             clients = euro_ix.get_clients(
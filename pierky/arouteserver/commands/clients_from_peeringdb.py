@@ -52,7 +52,8 @@ class ClientsFromPeeringDBCommand(ARouteServerCommand):
         sys.stdout.write("Loading list of IXs... ")
         ix_list = PeeringDBIXList(
             cache_dir=program_config.get_dir("cache_dir"),
-            cache_expiry=program_config.get("cache_expiry")
+            cache_expiry=program_config.get("cache_expiry"),
+            cache_backend=program_config.get("cache_backend")
         )
         ix_list.load_data()
         sys.stdout.write("OK\n")
@@ -110,7 +111,8 @@ class ClientsFromPeeringDBCommand(ARouteServerCommand):
 
         data = clients_from_peeringdb(
             netixlanid,
-            program_config.get_dir("cache_dir")
+            program_config.get_dir("cache_dir"),
+            cache_backend=program_config.get("cache_backend")
         )
         yaml.safe_dump(data, self.args.output_file, default_flow_style=False)
 
@@ -13,8 +13,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 from .base import ARouteServerCommand
 
+from ..builder import ConfigBuilder, BIRDConfigBuilder, \
+                      OpenBGPDConfigBuilder, TemplateContextDumper
 from ..config.program import program_config
 
 class SetupTemplatesCommand(ARouteServerCommand):
@@ -26,5 +30,63 @@ class SetupTemplatesCommand(ARouteServerCommand):
                     "to those used by the new version.")
     NEEDS_CONFIG = True
 
+    # Templates sub-directories and the builders that use them.
+    BUILDERS = (
+        ("bird", BIRDConfigBuilder),
+        ("openbgpd", OpenBGPDConfigBuilder),
+        ("html", ConfigBuilder),
+        ("template-context", TemplateContextDumper),
+    )
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(SetupTemplatesCommand, cls).add_arguments(parser)
+
+        parser.add_argument(
+            "--precompile",
+            help="Compile the templates once installed and store them "
+                 "in the cache directory, so that they are ready to be "
+                 "used by the following builds.",
+            action="store_true",
+            dest="precompile")
+
+    def precompile_templates(self):
+        templates_dir = program_config.get_dir("templates_dir")
+
+        # Using .get and not .get_dir because the dir may not exist.
+        cache_dir = program_config.get("cache_dir")
+
+        program_config.v("")
+        if not os.path.isdir(cache_dir):
+            program_config.mk_dir(cache_dir)
+        program_config.v("Compiling templates into {}...".format(cache_dir))
+
+        for sub_dir, builder_class in self.BUILDERS:
+            template_dir = os.path.join(templates_dir, sub_dir)
+            if not os.path.isdir(template_dir):
+                continue
+
+            try:
+                cnt = builder_class.precompile_templates(template_dir,
+                                                         cache_dir)
+            except Exception as e:
+                program_config.v(
+                    "Error while compiling templates in {}: {}".format(
+                        template_dir, str(e)
+                    )
+                )
+                return False
+
+            program_config.v("- {}: {} templates compiled".format(
+                sub_dir, cnt))
+
+        return True
+
     def run(self):
-        return program_config.setup_templates()
+        if not program_config.setup_templates():
+            return False
+
+        if self.args.precompile:
+            return self.precompile_templates()
+
+        return True
@@ -16,13 +16,17 @@
 import argparse
 import logging
 import os
+import re
 import sys
 
 from .base import ARouteServerCommand
+from ..build_stats import build_stats, BuildStats
 from ..builder import ConfigBuilder, BIRDConfigBuilder, \
-                      OpenBGPDConfigBuilder, TemplateContextDumper
+                      OpenBGPDConfigBuilder, TemplateContextDumper, \
+                      render_targets
 from ..config.program import program_config
 from ..errors import ARouteServerError, TemplateRenderingError
+from ..profiling import BuildProfiler
 
 class TemplateRenderingCommands(ARouteServerCommand):
 
@@ -30,16 +34,22 @@ class TemplateRenderingCommands(ARouteServerCommand):
 
     BUILDER_CLASS = None
 
+    # When False, the command builds more than one output
+    # configuration, so arguments that are specific to only one
+    # of them are not added.
+    SINGLE_TARGET = True
+
     @classmethod
     def add_arguments(cls, parser):
         super(TemplateRenderingCommands, cls).add_arguments(parser)
 
-        parser.add_argument(
-            "-o", "--output",
-            type=argparse.FileType('w'),
-            help="Output file. Default: stdout.",
-            default=sys.stdout,
-            dest="output_file")
+        if cls.SINGLE_TARGET:
+            parser.add_argument(
+                "-o", "--output",
+                type=argparse.FileType('w'),
+                help="Output file. Default: stdout.",
+                default=sys.stdout,
+                dest="output_file")
 
         parser.add_argument(
             "--test-only",
@@ -49,6 +59,16 @@ class TemplateRenderingCommands(ARouteServerCommand):
                  "configuration.",
             dest="test_only")
 
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Incremental build: the AS-SETs whose expansion inputs "
+                 "did not change since the previous build are not "
+                 "refreshed from IRRDBs, and their cached data is used "
+                 "even if expired. Only new or changed AS-SETs are "
+                 "expanded.",
+            dest="incremental")
+
         parser.add_argument(
             "--ignore-issues",
             nargs="+",
@@ -57,6 +77,33 @@ class TemplateRenderingCommands(ARouteServerCommand):
             metavar="ISSUE_ID",
             dest="ignore_errors")
 
+        parser.add_argument(
+            "--stats-file",
+            help="Save metrics about the build process (duration of "
+                 "each phase, enricher and template, cache hits and "
+                 "misses, downloaded bytes, external programs executed, "
+                 "peak memory usage) to this file.",
+            metavar="FILE",
+            dest="stats_file")
+
+        parser.add_argument(
+            "--stats-format",
+            help="Format of the file given in --stats-file: JSON or "
+                 "Prometheus text format (to be used with the "
+                 "node_exporter's textfile collector). "
+                 "Default: json.",
+            choices=BuildStats.FORMATS,
+            default="json",
+            dest="stats_format")
+
+        parser.add_argument(
+            "--profile",
+            help="Profile the configuration processing and the "
+                 "template rendering phases, using cProfile and "
+                 "tracemalloc, and save the results to this directory.",
+            metavar="DIR",
+            dest="profile_dir")
+
         group = parser.add_argument_group(
             title="Route server configuration",
             description="The following arguments override those provided "
@@ -101,14 +148,15 @@ class TemplateRenderingCommands(ARouteServerCommand):
             metavar="NAME",
             dest="template_name")
 
-        group.add_argument(
-            "--ip-ver",
-            help="IP version. "
-                 "Default: both IPv4 and IPv6",
-            default=None,
-            choices=[4, 6],
-            type=int,
-            dest="ip_ver")
+        if cls.SINGLE_TARGET:
+            group.add_argument(
+                "--ip-ver",
+                help="IP version. "
+                     "Default: both IPv4 and IPv6",
+                default=None,
+                choices=[4, 6],
+                type=int,
+                dest="ip_ver")
 
         group.add_argument(
             "--perform-graceful-shutdown",
@@ -134,7 +182,7 @@ class TemplateRenderingCommands(ARouteServerCommand):
     def _set_cfg_builder_params(self):
         pass
 
-    def run(self):
+    def _verify_templates(self):
         tpl_all_right = program_config.verify_templates() == []
         if not tpl_all_right:
             logging.warning("One or more templates are not aligned "
@@ -142,25 +190,53 @@ class TemplateRenderingCommands(ARouteServerCommand):
                             "of the program. "
                             "Run 'arouteserver verify-templates' for "
                             "more information.")
+        return tpl_all_right
 
-        # Config builder setup
-        self.cfg_builder_params = {
+    def _get_cfg_builder_params(self):
+        return {
             "cfg_general": program_config.get("cfg_general"),
             "cfg_clients": program_config.get("cfg_clients"),
             "cfg_bogons": program_config.get("cfg_bogons"),
             "cache_dir": program_config.get_dir("cache_dir"),
             "cache_expiry": program_config.get("cache_expiry"),
+            "cache_backend": program_config.get("cache_backend"),
             "bgpq3_path": program_config.get("bgpq3_path"),
             "bgpq3_host": program_config.get("bgpq3_host"),
             "bgpq3_sources": program_config.get("bgpq3_sources"),
+            "irrdb_client": program_config.get("irrdb_client"),
+            "irrdb_whois_connections":
+                program_config.get("irrdb_whois_connections"),
+            "irrdb_memory_cache_size":
+                program_config.get("irrdb_memory_cache_size"),
             "rtt_getter_path": program_config.get("rtt_getter_path"),
             "template_dir": program_config.get_dir("templates_dir"),
             "template_name": program_config.get("template_name"),
-            "ip_ver": self.args.ip_ver,
+            "ip_ver": self.args.ip_ver if self.SINGLE_TARGET else None,
             "perform_graceful_shutdown": self.args.perform_graceful_shutdown,
             "threads": program_config.get("threads"),
             "ignore_errors": self.args.ignore_errors,
+            "incremental": self.args.incremental,
         }
+
+    def run(self):
+        build_stats.reset()
+        self.profiler = BuildProfiler(self.args.profile_dir)
+        try:
+            with build_stats.timer("build_phase_seconds", phase="total"):
+                return self._run()
+        finally:
+            if self.args.stats_file:
+                try:
+                    build_stats.save(self.args.stats_file,
+                                     self.args.stats_format)
+                except ARouteServerError as e:
+                    logging.error(str(e))
+
+    def _run(self):
+        tpl_all_right = self._verify_templates()
+
+        # Config builder setup
+        self.cfg_builder_params = self._get_cfg_builder_params()
         self._set_cfg_builder_params()
 
         builder_class = self.BUILDER_CLASS
@@ -172,9 +248,13 @@ class TemplateRenderingCommands(ARouteServerCommand):
             )
 
         try:
-            builder = builder_class(**self.cfg_builder_params)
+            with self.profiler.phase("enrichment"):
+                builder = builder_class(**self.cfg_builder_params)
             if not self.args.test_only:
-                builder.render_template(output_file=self.args.output_file)
+                with self.profiler.phase("rendering"):
+                    builder.render_template(
+                        output_file=self.args.output_file
+                    )
         except TemplateRenderingError as e:
             if tpl_all_right:
                 raise
@@ -330,3 +410,183 @@ class DumpTemplateContextCommand(TemplateRenderingCommands):
 
     def _get_template_sub_dir(self):
         return "template-context"
+
+class MultiTargetRenderingCommand(TemplateRenderingCommands):
+
+    COMMAND_NAME = "multi-target"
+    COMMAND_HELP = ("Build the configuration for several targets (BGP "
+                    "speakers, IP versions, HTML page, ...) at once: "
+                    "data from external sources is gathered only once "
+                    "and then used to render the templates of all the "
+                    "targets concurrently.")
+
+    SINGLE_TARGET = False
+
+    # Target name, templates sub-directory, builder class.
+    TARGETS = (
+        ("bird", "bird", BIRDConfigBuilder),
+        ("openbgpd", "openbgpd", OpenBGPDConfigBuilder),
+        ("html", "html", ConfigBuilder),
+        ("template-context", "template-context", TemplateContextDumper),
+    )
+
+    # BGP speakers with their own target version and .local files.
+    SPEAKERS = (
+        ("bird", BIRDConfigBuilder),
+        ("openbgpd", OpenBGPDConfigBuilder),
+    )
+
+    TARGET_RE = re.compile(r"^({})([46]?)=(.+)$".format(
+        "|".join([re.escape(name) for name, _, _ in TARGETS])
+    ))
+
+    @classmethod
+    def parse_target(cls, s):
+        match = cls.TARGET_RE.match(s)
+        if not match:
+            raise argparse.ArgumentTypeError(
+                "invalid target '{}': the format must be "
+                "NAME[IP_VER]=OUTPUT_FILE, where NAME is one of {}".format(
+                    s, ", ".join([name for name, _, _ in cls.TARGETS])
+                )
+            )
+        name, ip_ver, output_path = match.groups()
+        return name, int(ip_ver) if ip_ver else None, output_path
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(MultiTargetRenderingCommand, cls).add_arguments(parser)
+
+        parser.add_argument(
+            "-t", "--targets",
+            help="The targets to build, in the NAME[IP_VER]=OUTPUT_FILE "
+                 "format, where NAME is one of {} and IP_VER, optional, "
+                 "is 4 or 6. Example: bird4=/etc/bird/bird.conf "
+                 "bird6=/etc/bird/bird6.conf html=/var/www/rs.html".format(
+                     ", ".join([name for name, _, _ in cls.TARGETS])
+                 ),
+            nargs="+",
+            type=cls.parse_target,
+            required=True,
+            metavar="TARGET",
+            dest="targets")
+
+        parser.add_argument(
+            "--processes",
+            help="Number of processes used to render the templates "
+                 "concurrently. Default: the number of CPUs, up to "
+                 "the number of targets.",
+            type=int,
+            dest="processes")
+
+        for speaker, builder_class in cls.SPEAKERS:
+            group = parser.add_argument_group(
+                title="{} targets".format(speaker),
+                description="The following arguments are used to build "
+                            "the configuration for {} targets; they have "
+                            "the same meaning of those used by the '{}' "
+                            "command.".format(speaker, speaker)
+            )
+
+            group.add_argument(
+                "--{}-target-version".format(speaker),
+                help="The version of {}. Default: {}".format(
+                    speaker, builder_class.DEFAULT_VERSION
+                ),
+                choices=builder_class.AVAILABLE_VERSION,
+                default=builder_class.DEFAULT_VERSION,
+                dest="{}_target_version".format(speaker))
+
+            group.add_argument(
+                "--{}-local-files-dir".format(speaker),
+                help="The directory where .local files are located, from "
+                     "the route server's perspective.",
+                default=builder_class.LOCAL_FILES_BASE_DIR,
+                dest="{}_local_files_dir".format(speaker))
+
+            group.add_argument(
+                "--{}-use-local-files".format(speaker),
+                help="Enable the inclusion of .local files into the "
+                     "configuration. The list of available .local files "
+                     "IDs follows: {}".format(
+                         ", ".join(builder_class.LOCAL_FILES_IDS)
+                     ),
+                nargs="*",
+                choices=builder_class.LOCAL_FILES_IDS,
+                metavar="FILE_ID",
+                dest="{}_local_files".format(speaker))
+
+            if builder_class is BIRDConfigBuilder:
+                group.add_argument(
+                    "--bird-use-hooks",
+                    help="Enable the use of function hooks. The list of "
+                         "available hooks follows: {}".format(
+                             ", ".join(builder_class.HOOKS)
+                         ),
+                    nargs="*",
+                    choices=builder_class.HOOKS,
+                    metavar="HOOK_NAME",
+                    dest="bird_hooks")
+
+    def _get_target_builder_params(self, name):
+        if name not in [speaker for speaker, _ in self.SPEAKERS]:
+            return {}
+
+        params = {
+            "target_version": getattr(self.args,
+                                      "{}_target_version".format(name)),
+            "local_files_dir": getattr(self.args,
+                                       "{}_local_files_dir".format(name)),
+            "local_files": getattr(self.args, "{}_local_files".format(name))
+        }
+        if name == "bird":
+            params["hooks"] = self.args.bird_hooks
+        return params
+
+    def _run(self):
+        tpl_all_right = self._verify_templates()
+
+        self.cfg_builder_params = self._get_cfg_builder_params()
+        templates_dir = self.cfg_builder_params["template_dir"]
+
+        targets = dict([(name, (sub_dir, builder_class))
+                        for name, sub_dir, builder_class in self.TARGETS])
+
+        # External data sources are queried only once, for both
+        # IPv4 and IPv6; the builder of each target then picks
+        # only the data it needs.
+        first_target_sub_dir = targets[self.args.targets[0][0]][0]
+        self.cfg_builder_params["template_dir"] = os.path.join(
+            templates_dir, first_target_sub_dir
+        )
+        with self.profiler.phase("enrichment"):
+            builder = ConfigBuilder(**self.cfg_builder_params)
+
+        target_builders = []
+        for name, ip_ver, output_path in self.args.targets:
+            sub_dir, builder_class = targets[name]
+            target_builders.append((
+                builder.get_target_builder(
+                    builder_class,
+                    template_dir=os.path.join(templates_dir, sub_dir),
+                    ip_ver=ip_ver,
+                    **self._get_target_builder_params(name)
+                ),
+                output_path
+            ))
+
+        if self.args.test_only:
+            return True
+
+        try:
+            # Targets rendered by child processes are not profiled.
+            with self.profiler.phase("rendering"):
+                render_targets(target_builders,
+                               processes=self.args.processes)
+        except TemplateRenderingError as e:
+            if tpl_all_right:
+                raise
+            e.templates_not_aligned = True
+            raise e
+
+        return True
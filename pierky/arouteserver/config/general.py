@@ -196,7 +196,7 @@ class ConfigParserGeneral(ConfigParserBase):
         c["rpki_roas"] = OrderedDict()
         r = c["rpki_roas"]
         r["source"] = ValidatorOption("source",
-            ("ripe-rpki-validator-cache", "rtrlib"),
+            ("ripe-rpki-validator-cache", "rtrlib", "rtr"),
             mandatory=True,
             default="ripe-rpki-validator-cache"
         )
@@ -207,6 +207,8 @@ class ConfigParserGeneral(ConfigParserBase):
                 "https://rpki.gin.ntt.net/api/export.json"
             ]
         )
+        r["rtr_server"] = ValidatorText(mandatory=True,
+                                        default="127.0.0.1:3323")
         r["allowed_trust_anchors"] = ValidatorListOf(
             ValidatorText, mandatory=True, default=[
                 "APNIC RPKI Root",
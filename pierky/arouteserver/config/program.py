@@ -56,11 +56,16 @@ class ConfigParserProgram(object):
 
         "cache_dir": "cache",
         "cache_expiry": CachedObject.DEFAULT_EXPIRY,
+        "cache_backend": "files",
 
         "bgpq3_path": "bgpq3",
         "bgpq3_host": IRRDBInfo.BGPQ3_DEFAULT_HOST,
         "bgpq3_sources": IRRDBInfo.BGPQ3_DEFAULT_SOURCES,
 
+        "irrdb_client": "bgpq3",
+        "irrdb_whois_connections": 16,
+        "irrdb_memory_cache_size": 256,
+
         "rtt_getter_path": "",
 
         "threads": 4,
@@ -13,23 +13,29 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, \
+                               wait as futures_wait
 import logging
+import six
 from six.moves import queue
+import sys
 import time
 import threading
 
+from ..build_stats import build_stats
 from ..errors import BuilderError, ARouteServerError
 
-class BaseConfigEnricherThread(threading.Thread):
+class BaseConfigEnricherTaskHandler(object):
+    """
+    The worker of an enricher: do_task() is run by the threads of
+    the executor, save_data() by the enricher itself, one result
+    at a time.
 
-    DESCR = None
-
-    def __init__(self, tasks_q, errors_q, lock):
-        threading.Thread.__init__(self)
+    The same instance is shared by all the threads, so do_task()
+    must not change its attributes.
+    """
 
-        self.tasks_q = tasks_q
-        self.errors_q = errors_q
-        self.lock = lock
+    DESCR = None
 
     def do_task(self, task):
         raise NotImplementedError()
@@ -37,83 +43,30 @@ class BaseConfigEnricherThread(threading.Thread):
     def save_data(self, task, data):
         raise NotImplementedError()
 
-    def run(self):
-        logging.debug("{} thread {} started".format(self.DESCR, self.name))
-
-        while True:
-            try:
-                task = self.tasks_q.get(block=True, timeout=0.1)
-            except queue.Empty:
-                break
-
-            try:
-                data = self.do_task(task)
-                if data:
-                    with self.lock:
-                        self.save_data(task, data)
-            except Exception as e:
-                if isinstance(e, ARouteServerError):
-                    if str(e):
-                        logging.error(
-                            "{} thread {} error: {}".format(
-                                self.DESCR, self.name,
-                                str(e)
-                            )
-                        )
-                else:
-                    logging.error(
-                        "{} thread {} unhandled exception: {}".format(
-                            self.DESCR, self.name,
-                            str(e) if str(e) else "error unknown"
-                        ),
-                        exc_info=True
-                    )
-
-                try:
-                    self.errors_q.put_nowait(True)
-                except queue.Full:
-                    pass
+def _do_task(worker, task):
+    with build_stats.timer("enricher_task_seconds", enricher=worker.DESCR):
+        return worker.do_task(task)
 
-            self.tasks_q.task_done()
-
-        logging.debug("{} thread {} stopped".format(
-            self.DESCR, self.name))
-
-class QueueLengthMonitor(threading.Thread):
-
-    def __init__(self, tasks_q, descr, threads):
-        threading.Thread.__init__(self)
-
-        self.tasks_q = tasks_q
-        self.descr = descr
-        self.threads = threads
-
-        self.name = "'{}' enricher queue monitor".format(self.descr)
-        self.daemon = True
+class BaseConfigEnricher(object):
 
-        self.done = False
+    WORKER_THREAD_CLASS = None
 
-    def run(self):
-        start_time = int(time.time())
-        while not self.done and self.tasks_q.qsize() > 0:
-            time.sleep(1)
+    # Enrichers whose data is needed by this one: when they are
+    # used, this enricher is started only after they completed
+    # successfully.
+    DEPENDS_ON = ()
 
-            # Print n. of remaining tasks every 10 seconds
-            if (int(time.time()) - start_time) % 10 == 0:
-                tasks_left = self.tasks_q.qsize()
-                logging.info("Enricher '{}', {} tasks left".format(
-                    self.descr, tasks_left
-                ))
+    # Max number of tasks submitted to the executor and not yet
+    # completed, for each thread.
+    MAX_IN_FLIGHT_TASKS_PER_THREAD = 2
 
-class BaseConfigEnricher(object):
-
-    WORKER_THREAD_CLASS = None
+    # Interval (seconds) between the log messages about the
+    # progress of the enricher.
+    PROGRESS_LOG_INTERVAL = 10
 
     def __init__(self, builder, threads):
         self.builder = builder
         self.threads = threads
-        self.tasks_q = queue.Queue()
-        self.errors_q = queue.Queue(maxsize=1)
 
     def prepare(self):
         pass
@@ -121,56 +74,268 @@ class BaseConfigEnricher(object):
     def _config_thread(self, thread):
         pass
 
-    def add_tasks(self):
+    def get_tasks(self):
+        """Yield the tasks that are passed to the worker's do_task()."""
         raise NotImplementedError()
 
-    def enrich(self):
-        logging.info(
-            "Enricher '{}' started".format(self.WORKER_THREAD_CLASS.DESCR)
-        )
+    def enrich(self, executor=None):
+        """Process the tasks of the enricher.
+
+        executor: the ThreadPoolExecutor used to run the tasks; it's
+        shared among the enrichers that are run concurrently, so that
+        the number of threads doesn't grow with them. When not given,
+        an executor with self.threads threads is used.
+        """
+        descr = self.WORKER_THREAD_CLASS.DESCR
+
+        logging.info("Enricher '{}' started".format(descr))
         start_time = int(time.time())
 
         self.prepare()
 
-        lock = threading.Lock()
+        worker = self.WORKER_THREAD_CLASS()
+        self._config_thread(worker)
 
-        threads = []
-        for i in range(self.threads):
-            t = self.WORKER_THREAD_CLASS(
-                self.tasks_q, self.errors_q, lock
-            )
-            self._config_thread(t)
-            threads.append(t)
+        max_in_flight_tasks = self.threads * self.MAX_IN_FLIGHT_TASKS_PER_THREAD
 
-        self.add_tasks()
+        # { <future>: <task> }
+        in_flight_tasks = {}
 
-        for t in threads:
-            t.start()
+        errors = False
+        fatal_error = False
+        completed_tasks = 0
+        last_progress_log = time.time()
 
-        q_monitor = QueueLengthMonitor(self.tasks_q,
-                                       self.WORKER_THREAD_CLASS.DESCR,
-                                       self.threads)
-        q_monitor.start()
+        tasks = iter(self.get_tasks())
+        all_tasks_submitted = False
 
-        self.tasks_q.join()
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=self.threads)
+        try:
+            while True:
+                # Tasks are submitted while they are generated, but
+                # only up to max_in_flight_tasks at a time.
+                while not all_tasks_submitted and \
+                    len(in_flight_tasks) < max_in_flight_tasks:
+                    try:
+                        task = next(tasks)
+                    except StopIteration:
+                        all_tasks_submitted = True
+                        break
+                    future = executor.submit(_do_task, worker, task)
+                    in_flight_tasks[future] = task
+
+                if not in_flight_tasks:
+                    break
+
+                done, _ = futures_wait(list(in_flight_tasks),
+                                       timeout=self.PROGRESS_LOG_INTERVAL,
+                                       return_when=FIRST_COMPLETED)
+
+                # Results are processed here, one at a time: no
+                # lock is needed to save them.
+                for future in done:
+                    task = in_flight_tasks.pop(future)
+                    completed_tasks += 1
+                    try:
+                        data = future.result()
+                        if data:
+                            worker.save_data(task, data)
+                    except ARouteServerError as e:
+                        errors = True
+                        if str(e):
+                            logging.error(
+                                "{} error: {}".format(descr, str(e))
+                            )
+                    except Exception as e:
+                        errors = True
+                        fatal_error = True
+                        logging.error(
+                            "{} unhandled exception: {}".format(
+                                descr, str(e) if str(e) else "error unknown"
+                            ),
+                            exc_info=True
+                        )
 
-        q_monitor.done = True
-        q_monitor.join(timeout=5)
+                if fatal_error:
+                    break
+
+                if time.time() - last_progress_log >= self.PROGRESS_LOG_INTERVAL:
+                    last_progress_log = time.time()
+                    if all_tasks_submitted:
+                        logging.info("Enricher '{}', {} tasks left".format(
+                            descr, len(in_flight_tasks)
+                        ))
+                    else:
+                        logging.info(
+                            "Enricher '{}', {} tasks completed".format(
+                                descr, completed_tasks
+                            )
+                        )
+        finally:
+            # Tasks that are not running yet are cancelled; the
+            # running ones are completed before leaving.
+            for future in in_flight_tasks:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=True)
+            elif in_flight_tasks:
+                futures_wait(list(in_flight_tasks))
 
         stop_time = int(time.time())
 
-        try:
-            self.errors_q.get_nowait()
+        if errors:
             logging.error(
-                "Enricher '{}' completed with errors after {} seconds".format(
-                    self.WORKER_THREAD_CLASS.DESCR, stop_time - start_time
+                "Enricher '{}' {} after {} seconds".format(
+                    descr,
+                    "aborted" if fatal_error else "completed with errors",
+                    stop_time - start_time
                 )
             )
             raise BuilderError()
-        except queue.Empty:
-            logging.info(
-                "Enricher '{}' completed successfully after {} seconds".format(
-                    self.WORKER_THREAD_CLASS.DESCR, stop_time - start_time
-                )
+
+        logging.info(
+            "Enricher '{}' completed successfully after {} seconds".format(
+                descr, stop_time - start_time
             )
-            return
+        )
+
+def _get_enricher_descr(enricher_class):
+    if enricher_class.WORKER_THREAD_CLASS:
+        return enricher_class.WORKER_THREAD_CLASS.DESCR
+    return getattr(enricher_class, "DESCR", None) or enricher_class.__name__
+
+class EnricherRunner(threading.Thread):
+
+    def __init__(self, enricher, executor, results_q):
+        threading.Thread.__init__(self)
+
+        self.enricher = enricher
+        self.executor = executor
+        self.results_q = results_q
+
+        self.name = "'{}' enricher".format(
+            _get_enricher_descr(enricher.__class__)
+        )
+
+    def run(self):
+        exc_info = None
+        try:
+            with build_stats.timer("enricher_seconds",
+                                   enricher=_get_enricher_descr(
+                                       self.enricher.__class__)):
+                self.enricher.enrich(executor=self.executor)
+            succeeded = True
+        except ARouteServerError as e:
+            succeeded = False
+            if str(e):
+                logging.error(str(e))
+        except Exception:
+            succeeded = False
+            exc_info = sys.exc_info()
+
+        self.results_q.put((self.enricher.__class__, succeeded, exc_info))
+
+def run_enrichers(builder, enricher_classes, threads):
+    """Run the enrichers, concurrently when possible.
+
+    Each enricher is started as soon as those it depends on (the
+    ones listed in its DEPENDS_ON attribute that are also in
+    enricher_classes) completed successfully; enrichers that depend
+    on a failed one are not run at all.
+
+    The tasks of all the enrichers are run by the same executor,
+    whose number of threads is the highest among the enrichers'
+    ones (usually, the given threads).
+
+    Return True if all the enrichers completed successfully.
+    Exceptions other than ARouteServerError are raised again once
+    the enrichers that are still running are completed.
+    """
+    enricher_classes = list(enricher_classes)
+
+    def depends_on(enricher_class, dep):
+        if dep is enricher_class:
+            return False
+        return issubclass(dep, tuple(enricher_class.DEPENDS_ON))
+
+    deps = {}
+    for enricher_class in enricher_classes:
+        deps[enricher_class] = [
+            dep for dep in enricher_classes
+            if depends_on(enricher_class, dep)
+        ] if enricher_class.DEPENDS_ON else []
+
+    enrichers = dict(
+        (enricher_class, enricher_class(builder, threads=threads))
+        for enricher_class in enricher_classes
+    )
+
+    pending = list(enricher_classes)
+    succeeded = set()
+    failed = set()
+    running = 0
+    exc_info = None
+
+    results_q = queue.Queue()
+
+    executor = None
+    if enrichers:
+        executor = ThreadPoolExecutor(
+            max_workers=max(enricher.threads
+                            for enricher in enrichers.values())
+        )
+
+    try:
+        while pending or running:
+            skipped = True
+            while skipped:
+                skipped = False
+                for enricher_class in list(pending):
+                    if any(dep in failed for dep in deps[enricher_class]):
+                        logging.error(
+                            "Enricher '{}' not started because of the errors "
+                            "of the enrichers it depends on".format(
+                                _get_enricher_descr(enricher_class)
+                            )
+                        )
+                        pending.remove(enricher_class)
+                        failed.add(enricher_class)
+                        skipped = True
+
+            for enricher_class in list(pending):
+                if exc_info or \
+                    not all(dep in succeeded for dep in deps[enricher_class]):
+                    continue
+
+                pending.remove(enricher_class)
+                EnricherRunner(
+                    enrichers[enricher_class], executor, results_q
+                ).start()
+                running += 1
+
+            if not running:
+                # Enrichers can be left pending only because of an
+                # unhandled exception.
+                assert exc_info or not pending, \
+                    "Circular dependencies among enrichers"
+                break
+
+            enricher_class, res, enricher_exc_info = results_q.get()
+            running -= 1
+
+            if res:
+                succeeded.add(enricher_class)
+            else:
+                failed.add(enricher_class)
+            if enricher_exc_info and not exc_info:
+                exc_info = enricher_exc_info
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+
+    if exc_info:
+        six.reraise(*exc_info)
+
+    return not failed
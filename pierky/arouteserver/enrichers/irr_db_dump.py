@@ -18,30 +18,55 @@ import logging
 import os
 
 from .base import BaseConfigEnricher
-from ..ipaddresses import IPNetwork
+from .irrdb import IRRDBConfigEnricher_ASNs
+from ..ipaddresses import parse_ip_networks
+from ..prefix_aggregation import aggregate_prefix_list
+from ..prefix_lists import prefix_ip_ver
 from ..errors import ARouteServerError, BuilderError
 
 class GenericIRRWhoisRecord_Proxy(object):
 
-    def __init__(self, asn, path, allow_longer_prefixes):
+    def __init__(self, asn, path, ip_ver=None):
         self.asn = asn
         self.path = path
-        self.allow_longer_prefixes = allow_longer_prefixes
+        self.ip_ver = ip_ver
+
+    def get_view(self, ip_ver):
+        """Return a proxy limited to the prefixes of one IP version."""
+        return GenericIRRWhoisRecord_Proxy(self.asn, self.path, ip_ver)
+
+    def has_prefixes(self):
+        for _ in self.prefixes:
+            return True
+        return False
+
+    @staticmethod
+    def save(path, prefixes, allow_longer_prefixes):
+        """Save the aggregated prefix list built from a list of prefixes."""
+        entries = []
+        for net in sorted(parse_ip_networks(prefixes),
+                          key=lambda net: (net.version, net.net,
+                                           net.prefixlen)):
+            entries.append({
+                "prefix": net.ip,
+                "length": net.prefixlen,
+                "max_length": net.max_prefixlen,
+                "exact": not allow_longer_prefixes,
+                "ge": net.prefixlen,
+                "le": net.prefixlen if not allow_longer_prefixes else net.max_prefixlen
+            })
+        with open(path, "w") as f:
+            json.dump(aggregate_prefix_list(entries), f)
 
     @property
     def prefixes(self):
         with open(self.path, "r") as f:
-            prefix_lst = json.load(f)
-            for prefix in prefix_lst:
-                net = IPNetwork(prefix)
-                yield {
-                    "prefix": net.ip,
-                    "length": net.prefixlen,
-                    "max_length": net.max_prefixlen,
-                    "exact": not self.allow_longer_prefixes,
-                    "ge": net.prefixlen,
-                    "le": net.prefixlen if not self.allow_longer_prefixes else net.max_prefixlen
-                }
+            entries = json.load(f)
+            for entry in entries:
+                if self.ip_ver and \
+                    prefix_ip_ver(entry["prefix"]) != self.ip_ver:
+                    continue
+                yield entry
 
 class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
 
@@ -51,7 +76,9 @@ class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
     PARSER_CLASS = None
     BUILDER_TARGET_DICT_NAME = None
 
-    def enrich(self):
+    DEPENDS_ON = (IRRDBConfigEnricher_ASNs,)
+
+    def enrich(self, executor=None):
         if self.builder.irrdb_info is None:
             raise BuilderError(
                 "{} Whois DB records can be fetched only after that the "
@@ -89,6 +116,7 @@ class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
 
         whois_db_dump = self.PARSER_CLASS(
             cache_dir=cache_dir, cache_expiry=self.builder.cache_expiry,
+            cache_backend=self.builder.cache_backend,
             source=source)
         whois_db_dump.load_data()
         whois_records = whois_db_dump.whois_records
@@ -105,8 +133,7 @@ class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
             if int(asn[2:]) not in origin_asns:
                 continue
 
-            prefix_obj = IPNetwork(prefix)
-            if prefix_obj.version not in afis:
+            if prefix_ip_ver(prefix) not in afis:
                 continue
 
             asn = asn.upper()
@@ -117,11 +144,10 @@ class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
         allow_longer_prefixes = self.builder.cfg_general["filtering"]["irrdb"]["allow_longer_prefixes"]
         for asn in asn_prefixes:
             path = os.path.join(db_dir, "{}.json".format(asn))
-            with open(path, "w") as f:
-                json.dump(list(asn_prefixes[asn]), f)
+            GenericIRRWhoisRecord_Proxy.save(path, asn_prefixes[asn],
+                                             allow_longer_prefixes)
             target_dic = getattr(self.builder, self.BUILDER_TARGET_DICT_NAME)
-            target_dic[asn] = \
-                GenericIRRWhoisRecord_Proxy(asn, path, allow_longer_prefixes)
+            target_dic[asn] = GenericIRRWhoisRecord_Proxy(asn, path)
 
         del asn_prefixes
         del whois_records
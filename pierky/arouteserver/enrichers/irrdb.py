@@ -14,21 +14,93 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import atexit
+from collections import OrderedDict
+import hashlib
+import json
 import logging
+import os
 import shutil
-from six.moves import cPickle
 import six
 import tempfile
+import threading
+import time
 
-from .base import BaseConfigEnricher, BaseConfigEnricherThread
+from .base import BaseConfigEnricher, BaseConfigEnricherTaskHandler
+from .pdb_as_set import PeeringDBConfigEnricher_ASSet
 from ..errors import BuilderError, ARouteServerError
-from ..ipaddresses import IPAddress, IPNetwork
+from ..ipaddresses import parse_ip_network
+from ..packed_lists import PackedPrefixList, pack_asns, unpack_asns
+from ..prefix_aggregation import aggregate_prefix_list
 from ..irrdb import ASSet, RSet, AS_SET_Bundle
+from ..irrdb_whois import IRRdWhoisSessionPool, IRRdASSetResolver
 
+# Guards the objects that are shared by the IRRDB enrichers
+# (builder.irrdb_info and the AS-SET resolver).
+_irrdb_info_lock = threading.Lock()
 
 def clear_irrdb_pickle_dir(target_dir):
     shutil.rmtree(target_dir, ignore_errors=True)
 
+class IRRDBMemoryCache(object):
+    """
+    LRU in-memory layer in front of the files where IRRDB records
+    data is stored.
+
+    The size of each item is that of its packed representation; the
+    least recently used items are evicted when the total size exceeds
+    max_size (bytes). Items bigger than max_size are never kept in
+    memory. A max_size of 0 disables the cache.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        # { "<path>": (<size>, <data>) }
+        self.items = OrderedDict()
+        self.size = 0
+
+    def __getstate__(self):
+        # Cached data is not passed to other processes.
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_size"])
+
+    def _put(self, path, size, data):
+        with self.lock:
+            self._discard(path)
+            if size > self.max_size:
+                return
+            self.items[path] = (size, data)
+            self.size += size
+            while self.size > self.max_size:
+                _, (evicted_size, _) = self.items.popitem(last=False)
+                self.size -= evicted_size
+
+    def _discard(self, path):
+        item = self.items.pop(path, None)
+        if item:
+            self.size -= item[0]
+
+    def save(self, path, raw, data):
+        with open(path, "wb") as f:
+            f.write(raw)
+        self._put(path, len(raw), data)
+
+    def load(self, path, decode):
+        with self.lock:
+            item = self.items.pop(path, None)
+            if item:
+                self.items[path] = item
+                return item[1]
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = decode(raw)
+        self._put(path, len(raw), data)
+        return data
+
 class IRRDB(object):
     """
     Container for IRRDB "records".
@@ -38,15 +110,26 @@ class IRRDB(object):
     passed to bgpq3 to retrieve prefixes and/or ASNs; bgpq3's ability
     to aggregate prefixes is used to merge the content of each object
     into a single dataset.
+
+    Records data is stored in files, in a packed format (ASNs as
+    array('I'), prefixes as PackedPrefixList); the most recently used
+    data, up to memory_cache_size bytes, is also kept in memory.
     """
 
-    def __init__(self):
+    DEFAULT_MEMORY_CACHE_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, memory_cache_size=DEFAULT_MEMORY_CACHE_SIZE):
         self.irrdb_pickle_dir = tempfile.mkdtemp(suffix="_arouteserver")
         atexit.register(clear_irrdb_pickle_dir,
                         target_dir=self.irrdb_pickle_dir)
 
+        self.memory_cache = IRRDBMemoryCache(memory_cache_size)
+
         self.records = {}
 
+        # Built by get_ref().
+        self.refs = None
+
     def request(self, names, used_by, object_types=set(["prefixes", "asns"])):
         assert object_types.issubset(set(["prefixes", "asns"]))
 
@@ -63,7 +146,8 @@ class IRRDB(object):
                 )
             )
 
-        new_record = IRRDBRecord(names_list, self.irrdb_pickle_dir)
+        new_record = IRRDBRecord(names_list, self.irrdb_pickle_dir,
+                                 self.memory_cache)
 
         if new_record.id not in self.records:
             self.records[new_record.id] = new_record
@@ -92,9 +176,46 @@ class IRRDB(object):
     def values(self):
         return self.records.values()
 
+    def get_view(self, record_ids, ip_ver, used_by):
+        """Return an IRRDB with only the given records.
+
+        Prefixes of the records that are returned are limited to those
+        of the given IP version, and their 'used_by' attribute to the
+        items that are also in used_by.
+        """
+        res = IRRDB.__new__(IRRDB)
+        res.irrdb_pickle_dir = self.irrdb_pickle_dir
+        res.memory_cache = self.memory_cache
+        res.records = {}
+        res.refs = None
+        for record_id in record_ids:
+            res.records[record_id] = IRRDBRecordView(self.records[record_id],
+                                                     ip_ver, used_by)
+        return res
+
+    def get_ref(self, record_id, objects):
+        """Return the name of the record whose data is used for record_id.
+
+        Records whose objects ("asns" or "prefixes") are the same are
+        all referenced using the name of the first one (sorted by id),
+        so that the templates can render the data only once.
+        """
+        if self.refs is None:
+            refs = {"asns": {}, "prefixes": {}}
+            for objs in refs:
+                names_by_digest = {}
+                for rec_id in sorted(self.records):
+                    record = self.records[rec_id]
+                    digest = record.get_digest(objs)
+                    if digest not in names_by_digest:
+                        names_by_digest[digest] = record.name
+                    refs[objs][rec_id] = names_by_digest[digest]
+            self.refs = refs
+        return self.refs[objects][record_id]
+
 class IRRDBRecord(AS_SET_Bundle):
 
-    def __init__(self, as_set_names, irrdb_pickle_dir):
+    def __init__(self, as_set_names, irrdb_pickle_dir, memory_cache):
         AS_SET_Bundle.__init__(self, as_set_names)
 
         self.used_by = set()
@@ -103,25 +224,47 @@ class IRRDBRecord(AS_SET_Bundle):
 
         self.irrdb_pickle_dir = irrdb_pickle_dir
 
+        self.memory_cache = memory_cache
+
         self.saved_objects = []
 
+        # Digests of the IRRDB configuration of the clients that
+        # use the bundle, part of its build manifest fingerprint.
+        self.clients_cfg_digests = set()
+
     def get_path(self, objects):
-        return "{}/pickle_{}.{}".format(self.irrdb_pickle_dir, self.id, objects)
+        return "{}/packed_{}.{}".format(self.irrdb_pickle_dir, self.id, objects)
 
     def save(self, objects, data):
-        if objects in ("asns", "prefixes"):
-            with open(self.get_path(objects), "wb") as f:
-                cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
-            self.saved_objects += [objects]
+        if objects == "asns":
+            raw = pack_asns(data)
+            data = unpack_asns(raw)
+        elif objects == "prefixes":
+            raw = PackedPrefixList.pack(aggregate_prefix_list(data))
+            data = PackedPrefixList(raw)
         else:
             raise ValueError("Unknown objects: {}".format(objects))
+        self.memory_cache.save(self.get_path(objects), raw, data)
+        self.saved_objects += [objects]
 
     def load(self, objects):
+        # The returned data is shared with other callers: ASNs are
+        # an array('I'), prefixes a (read-only) PackedPrefixList.
         if objects in self.saved_objects:
-            with open(self.get_path(objects), "rb") as f:
-                return cPickle.load(f)
+            if objects == "asns":
+                decode = unpack_asns
+            else:
+                decode = PackedPrefixList
+            return self.memory_cache.load(self.get_path(objects), decode)
+        elif objects == "asns":
+            return unpack_asns(b"")
         else:
-            return []
+            return PackedPrefixList(PackedPrefixList.pack([]))
+
+    def get_digest(self, objects):
+        if objects == "asns":
+            return hashlib.sha1(pack_asns(sorted(self.asns))).hexdigest()
+        return self.prefixes.digest()
 
     @property
     def asns(self):
@@ -137,24 +280,164 @@ class IRRDBRecord(AS_SET_Bundle):
             "name": self.name,
             "descr": self.descr,
             "used_by": ", ".join(sorted(self.used_by)),
-            "asns": self.asns,
-            "prefixes": self.prefixes
+            "asns": list(self.asns),
+            "prefixes": list(self.prefixes)
         }
 
-class IRRDBConfigEnricher_WorkerThread(BaseConfigEnricherThread):
+class IRRDBRecordView(IRRDBRecord):
+    """
+    An IRRDBRecord whose prefixes are limited to one IP version.
 
-    TARGET_FIELD = None
+    Views are read-only: they share the data of the original record.
+    """
+
+    def __init__(self, record, ip_ver, used_by):
+        self.__dict__.update(record.__dict__)
+        self.ip_ver = ip_ver
+        self.used_by = record.used_by & used_by
+
+    def save(self, objects, data):
+        raise BuilderError(
+            "Can't save {} into the IPv{} view of {}: views are "
+            "read-only, data must be saved into the original "
+            "record".format(objects, self.ip_ver, self.descr)
+        )
+
+    @property
+    def prefixes(self):
+        return self.load("prefixes").filter_ip_ver(self.ip_ver)
+
+class IRRDBBuildManifest(object):
+    """
+    Persistent list of the AS-SET bundles expanded by previous builds.
+    Each bundle is identified by its id and by the fingerprint of the
+    inputs used to expand it (bgpq3 options, address families,
+    configuration of the clients that use it, ...), together with the
+    time its data was last refreshed.
+    When an incremental build is requested, bundles whose fingerprint
+    is already known are not refreshed from IRRDBs: data is taken from
+    the cache even if it's expired, unless it was refreshed more than
+    MAX_AGE seconds ago.
+    Older fingerprints are removed when the manifest is saved.
+    """
+
+    FILENAME = "irrdb_build_manifest.json"
+
+    MAX_AGE = 7 * 86400
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, self.FILENAME)
+        self.lock = threading.Lock()
+
+        # { "<as_set_bundle_id>": { "<fingerprint>": <ts>, ... } }
+        self.bundles = {}
+
+    @staticmethod
+    def get_fingerprint(irrdb_record, target_field, ip_ver, irrdbtools_cfg):
+        inputs = {
+            "object_names": irrdb_record.object_names,
+            "target_field": target_field,
+            "ip_ver": ip_ver,
+            "bgpq3_host": irrdbtools_cfg.get("bgpq3_host"),
+            "bgpq3_sources": irrdbtools_cfg.get("bgpq3_sources"),
+            "irrdb_client": irrdbtools_cfg.get("irrdb_client", "bgpq3"),
+            "allow_longer_prefixes":
+                irrdbtools_cfg.get("allow_longer_prefixes", False),
+            "clients_cfg": sorted(irrdb_record.clients_cfg_digests)
+        }
+        hasher = hashlib.sha512()
+        hasher.update(json.dumps(inputs, sort_keys=True).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                self.bundles = json.load(f)
+        except Exception as e:
+            logging.warning(
+                "Error while reading the IRRDB build manifest {}, "
+                "all the AS-SET bundles will be processed: {}".format(
+                    self.path, str(e)
+                )
+            )
+            self.bundles = {}
+
+    def _remove_old(self):
+        min_ts = int(time.time()) - self.MAX_AGE
+        for bundle_id in list(self.bundles):
+            fingerprints = self.bundles[bundle_id]
+            for fingerprint in list(fingerprints):
+                if fingerprints[fingerprint] < min_ts:
+                    del fingerprints[fingerprint]
+            if not fingerprints:
+                del self.bundles[bundle_id]
+
+    def save(self):
+        tmp_path = "{}.tmp".format(self.path)
+        try:
+            with self.lock:
+                self._remove_old()
+                with open(tmp_path, "w") as f:
+                    json.dump(self.bundles, f)
+                os.rename(tmp_path, self.path)
+        except Exception as e:
+            logging.warning(
+                "Error while saving the IRRDB build manifest {}: {}".format(
+                    self.path, str(e)
+                )
+            )
+
+    def is_known(self, bundle_id, fingerprint):
+        """True if the bundle's data can be reused as it is."""
+        ts = self.bundles.get(bundle_id, {}).get(fingerprint)
+        if ts is None:
+            return False
+        return ts >= int(time.time()) - self.MAX_AGE
+
+    def add(self, bundle_id, fingerprint, refreshed):
+        """Add the bundle to the manifest.
+
+        refreshed: True if the bundle's data has not been reused from
+        the cache regardless of its expiry.
+        """
+        with self.lock:
+            if bundle_id not in self.bundles:
+                self.bundles[bundle_id] = {}
+            fingerprints = self.bundles[bundle_id]
+            if refreshed or fingerprint not in fingerprints:
+                fingerprints[fingerprint] = int(time.time())
 
-    def __init__(self, *args, **kwargs):
-        BaseConfigEnricherThread.__init__(self, *args, **kwargs)
+class IRRDBConfigEnricher_WorkerThread(BaseConfigEnricherTaskHandler):
 
+    TARGET_FIELD = None
+
+    def __init__(self):
         self.ip_ver = None
         self.irrdbtools_cfg = None
+        self.manifest = None
+        self.incremental = False
 
     def do_task(self, task):
         irrdb_record = task
         used_by_descr = ", ".join(irrdb_record.used_by)
-        data = self._get_external_data(used_by_descr, irrdb_record.object_names)
+
+        fingerprint = IRRDBBuildManifest.get_fingerprint(
+            irrdb_record, self.TARGET_FIELD, self.ip_ver, self.irrdbtools_cfg
+        )
+        unchanged = self.incremental and \
+            self.manifest.is_known(irrdb_record.id, fingerprint)
+        if unchanged:
+            logging.debug("IRRDB: {} for {} unchanged since the last "
+                          "build".format(irrdb_record.descr, used_by_descr))
+
+        data = self._get_external_data(used_by_descr, irrdb_record.object_names,
+                                       ignore_cache_expiry=unchanged)
+
+        self.manifest.add(irrdb_record.id, fingerprint,
+                          refreshed=not unchanged)
         return data
 
     def save_data(self, task, data):
@@ -166,12 +449,15 @@ class IRRDBConfigEnricher_WorkerThread_Prefixes(IRRDBConfigEnricher_WorkerThread
     DESCR = "IRRdb prefixes"
     TARGET_FIELD = "prefixes"
 
-    def _get_external_data(self, used_by_descr, as_set_names):
+    def _get_external_data(self, used_by_descr, as_set_names,
+                           ignore_cache_expiry=False):
         errors = False
         ip_versions = [self.ip_ver] if self.ip_ver else [4, 6]
         res = []
         for ip_ver in ip_versions:
-            obj = RSet(as_set_names, ip_ver, **self.irrdbtools_cfg)
+            obj = RSet(as_set_names, ip_ver,
+                       ignore_cache_expiry=ignore_cache_expiry,
+                       **self.irrdbtools_cfg)
             try:
                 obj.load_data()
                 prefixes = obj.prefixes
@@ -199,9 +485,11 @@ class IRRDBConfigEnricher_WorkerThread_ASNs(IRRDBConfigEnricher_WorkerThread):
     DESCR = "IRRdb origin ASNs"
     TARGET_FIELD = "asns"
 
-    def _get_external_data(self, used_by_descr, as_set_name):
+    def _get_external_data(self, used_by_descr, as_set_name,
+                           ignore_cache_expiry=False):
         errors = False
-        obj = ASSet(as_set_name, **self.irrdbtools_cfg)
+        obj = ASSet(as_set_name, ignore_cache_expiry=ignore_cache_expiry,
+                    **self.irrdbtools_cfg)
         try:
             obj.load_data()
             asns = obj.asns
@@ -225,21 +513,43 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
 
     WORKER_THREAD_CLASS = None
 
+    DEPENDS_ON = (PeeringDBConfigEnricher_ASSet,)
+
     WHITE_LIST_OBJECT_NAME_PREFIX = "WHITE_LIST_"
 
+    def __init__(self, builder, threads):
+        # When the IRRd whois server is queried directly, threads
+        # are cheap (they mostly wait for the server): as many threads
+        # as the number of connections in the pool are used.
+        if builder.irrdb_client == "whois":
+            threads = max(threads, builder.irrdb_whois_connections)
+
+        BaseConfigEnricher.__init__(self, builder, threads)
+
+        self.whois_pool = None
+
     def prepare(self):
         # Create and populate the IRRDB() instances only once
         # (two IRR enrichers are used, but only the first one builds it).
-        if self.builder.irrdb_info is not None:
-            return
+        # They can run concurrently: the other one waits here until
+        # irrdb_info is complete.
+        with _irrdb_info_lock:
+            if self.builder.irrdb_info is None:
+                self._prepare()
 
+    def _prepare(self):
         # In the end, self.builder.irrdb_info will be an IRRDB()
         # object. Its items will be:
         # {
         #   "<as_set_bundle_id>": <IRRDBRecord>
         # }
 
-        self.builder.irrdb_info = IRRDB()
+        self.builder.irrdb_info = IRRDB(
+            memory_cache_size=self.builder.irrdb_memory_cache_size * 1024 * 1024
+        )
+
+        self.builder.irrdb_manifest = IRRDBBuildManifest(self.builder.cache_dir)
+        self.builder.irrdb_manifest.load()
 
         # Add to irrdb_info all the AS-SET bundles reported in the 'clients' section.
         for client in self.builder.cfg_clients.cfg["clients"]:
@@ -255,7 +565,7 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
 
             if self.builder.ip_ver is not None:
                 ip = client["ip"]
-                if IPAddress(ip).version != self.builder.ip_ver:
+                if parse_ip_network(ip).version != self.builder.ip_ver:
                     # The address family of this client is not the
                     # current one used to build the configuration.
                     continue
@@ -285,7 +595,7 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
                     ip_ver = self.builder.ip_ver
                     white_list_objects = [
                         p for p in white_list_objects
-                        if IPNetwork(p["prefix"]).version == ip_ver
+                        if parse_ip_network(p["prefix"]).version == ip_ver
                     ]
 
                 if white_list_objects:
@@ -357,23 +667,92 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
                                 client["id"], client["asn"]
                             ))
 
+        for client in self.builder.cfg_clients.cfg["clients"]:
+            client_irrdb = client["cfg"]["filtering"]["irrdb"]
+            digest = self._get_client_cfg_digest(client)
+            for bundle_id in client_irrdb["as_set_bundle_ids"]:
+                self.builder.irrdb_info[bundle_id].clients_cfg_digests.add(
+                    digest
+                )
+
+    @staticmethod
+    def _get_client_cfg_digest(client):
+        client_irrdb = client["cfg"]["filtering"]["irrdb"]
+        cfg = {
+            "asn": client["asn"],
+            "irrdb": dict([
+                (k, v) for k, v in six.iteritems(client_irrdb)
+                if k != "as_set_bundle_ids"
+            ])
+        }
+        hasher = hashlib.sha1()
+        hasher.update(
+            json.dumps(cfg, sort_keys=True, default=str).encode("utf-8")
+        )
+        return hasher.hexdigest()
+
+    def _acquire_whois_pool(self):
+        # The two IRR enrichers can run concurrently: they share the
+        # same pool, so that no more than irrdb_whois_connections
+        # sessions are opened. The last one that completes closes it.
+        with _irrdb_info_lock:
+            if not self.builder.irrdb_whois_resolver:
+                self.builder.irrdb_whois_resolver = IRRdASSetResolver()
+
+            if not self.builder.irrdb_whois_pool:
+                self.builder.irrdb_whois_pool = IRRdWhoisSessionPool(
+                    self.builder.bgpq3_host,
+                    self.builder.irrdb_whois_connections,
+                    resolver=self.builder.irrdb_whois_resolver
+                )
+                self.builder.irrdb_whois_pool_users = 0
+
+            self.builder.irrdb_whois_pool_users += 1
+            self.whois_pool = self.builder.irrdb_whois_pool
+
+    def _release_whois_pool(self):
+        with _irrdb_info_lock:
+            self.builder.irrdb_whois_pool_users -= 1
+            if self.builder.irrdb_whois_pool_users == 0:
+                self.builder.irrdb_whois_pool.close()
+                self.builder.irrdb_whois_pool = None
+            self.whois_pool = None
+
+    def enrich(self, executor=None):
+        if self.builder.irrdb_client == "whois":
+            self._acquire_whois_pool()
+
+        try:
+            BaseConfigEnricher.enrich(self, executor=executor)
+        finally:
+            if self.whois_pool:
+                self._release_whois_pool()
+
+        # Reached only when no errors occurred.
+        self.builder.irrdb_manifest.save()
+
     def _config_thread(self, thread):
         thread.ip_ver = self.builder.ip_ver
+        thread.manifest = self.builder.irrdb_manifest
+        thread.incremental = self.builder.incremental
         thread.irrdbtools_cfg = {
+            "irrdb_client": self.builder.irrdb_client,
             "bgpq3_path": self.builder.bgpq3_path,
             "bgpq3_host": self.builder.bgpq3_host,
             "bgpq3_sources": self.builder.bgpq3_sources,
             "cache_dir": self.builder.cache_dir,
             "cache_expiry": self.builder.cache_expiry,
+            "cache_backend": self.builder.cache_backend,
+            "whois_client": self.whois_pool,
         }
 
-    def add_tasks(self):
+    def get_tasks(self):
         target_objects = self.WORKER_THREAD_CLASS.TARGET_FIELD
 
-        # Enqueuing tasks.
+        # Generating tasks.
         for as_set_record_id, as_set_record in six.iteritems(self.builder.irrdb_info):
             if target_objects in as_set_record.requested_objects:
-                self.tasks_q.put(as_set_record)
+                yield as_set_record
 
 class IRRDBConfigEnricher_ASNs(IRRDBConfigEnricher):
 
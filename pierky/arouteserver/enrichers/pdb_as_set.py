@@ -16,26 +16,26 @@
 from copy import deepcopy
 import logging
 
-from .base import BaseConfigEnricher, BaseConfigEnricherThread
+from .base import BaseConfigEnricher, BaseConfigEnricherTaskHandler
 from ..errors import BuilderError, PeeringDBError, PeeringDBNoInfoError
 from ..peering_db import PeeringDBNet
 
-class PeeringDBConfigEnricher_ASSet_WorkerThread(BaseConfigEnricherThread):
+class PeeringDBConfigEnricher_ASSet_WorkerThread(BaseConfigEnricherTaskHandler):
 
     DESCR = "PeeringDB AS-SET"
 
-    def __init__(self, *args, **kwargs):
-        BaseConfigEnricherThread.__init__(self, *args, **kwargs)
-
+    def __init__(self):
         self.cache_dir = None
         self.cache_expiry = None
+        self.cache_backend = None
 
     def do_task(self, task):
         asn, _ = task
         try:
             net = PeeringDBNet(asn,
                                cache_dir=self.cache_dir,
-                               cache_expiry=self.cache_expiry)
+                               cache_expiry=self.cache_expiry,
+                               cache_backend=self.cache_backend)
             net.load_data()
         except PeeringDBNoInfoError:
             # No data found on PeeringDB.
@@ -68,12 +68,13 @@ class PeeringDBConfigEnricher_ASSet(BaseConfigEnricher):
     def _config_thread(self, thread):
         thread.cache_dir = self.builder.cache_dir
         thread.cache_expiry = self.builder.cache_expiry
+        thread.cache_backend = self.builder.cache_backend
 
-    def add_tasks(self):
+    def get_tasks(self):
         # "<asn>": <clients>
         tasks = {}
 
-        # Enqueuing tasks.
+        # Generating tasks.
         for client in self.builder.cfg_clients.cfg["clients"]:
             client_irrdb = client["cfg"]["filtering"]["irrdb"]
 
@@ -99,5 +100,12 @@ class PeeringDBConfigEnricher_ASSet(BaseConfigEnricher):
                 tasks[asn] = []
             tasks[asn].append(client)
 
+        # Records of all the networks are fetched from PeeringDB
+        # at once and cached, to be then used by each thread.
+        PeeringDBNet.prefetch([int(asn) for asn in tasks],
+                              cache_dir=self.builder.cache_dir,
+                              cache_expiry=self.builder.cache_expiry,
+                              cache_backend=self.builder.cache_backend)
+
         for asn in tasks:
-            self.tasks_q.put((int(asn), tasks[asn]))
+            yield (int(asn), tasks[asn])
@@ -15,21 +15,21 @@
 
 import logging
 
-from .base import BaseConfigEnricher, BaseConfigEnricherThread
+from .base import BaseConfigEnricher, BaseConfigEnricherTaskHandler
+from .pdb_as_set import PeeringDBConfigEnricher_ASSet
 from ..errors import BuilderError, PeeringDBError, PeeringDBNoInfoError
 from ..peering_db import PeeringDBNet
 
-class PeeringDBConfigEnricher_MaxPrefix_WorkerThread(BaseConfigEnricherThread):
+class PeeringDBConfigEnricher_MaxPrefix_WorkerThread(BaseConfigEnricherTaskHandler):
 
     DESCR = "PeeringDB max-prefix"
 
-    def __init__(self, *args, **kwargs):
-        BaseConfigEnricherThread.__init__(self, *args, **kwargs)
-
+    def __init__(self):
         self.ip_ver = None
         self.cfg_general = None
         self.cache_dir = None
         self.cache_expiry = None
+        self.cache_backend = None
         self.general_limits = None
 
     def do_task(self, task):
@@ -38,7 +38,8 @@ class PeeringDBConfigEnricher_MaxPrefix_WorkerThread(BaseConfigEnricherThread):
         try:
             net = PeeringDBNet(asn,
                                cache_dir=self.cache_dir,
-                               cache_expiry=self.cache_expiry)
+                               cache_expiry=self.cache_expiry,
+                               cache_backend=self.cache_backend)
             net.load_data()
 
             return net.info_prefixes4 or self.general_limits["ipv4"], \
@@ -81,6 +82,11 @@ class PeeringDBConfigEnricher_MaxPrefix_WorkerThread(BaseConfigEnricherThread):
 
 class PeeringDBConfigEnricher_MaxPrefix(BaseConfigEnricher):
 
+    # Started after the AS-SET one, so that the PeeringDB records
+    # of the clients are fetched only once and then taken from
+    # the cache.
+    DEPENDS_ON = (PeeringDBConfigEnricher_ASSet,)
+
     WORKER_THREAD_CLASS = PeeringDBConfigEnricher_MaxPrefix_WorkerThread
 
     def _get_general_limit(self, ip_ver):
@@ -91,16 +97,17 @@ class PeeringDBConfigEnricher_MaxPrefix(BaseConfigEnricher):
         thread.cfg_general = self.builder.cfg_general
         thread.cache_dir = self.builder.cache_dir
         thread.cache_expiry = self.builder.cache_expiry
+        thread.cache_backend = self.builder.cache_backend
         thread.general_limits = {
             "ipv4": self._get_general_limit(4),
             "ipv6": self._get_general_limit(6)
         }
 
-    def add_tasks(self):
+    def get_tasks(self):
         # "<asn>": <clients>
         tasks = {}
 
-        # Enqueuing tasks.
+        # Generating tasks.
         for client in self.builder.cfg_clients.cfg["clients"]:
             client_max_prefix = client["cfg"]["filtering"]["max_prefix"]
 
@@ -135,5 +142,12 @@ class PeeringDBConfigEnricher_MaxPrefix(BaseConfigEnricher):
                     tasks[asn] = []
                 tasks[asn].append(client)
 
+        # Records of all the networks are fetched from PeeringDB
+        # at once and cached, to be then used by each thread.
+        PeeringDBNet.prefetch([int(asn) for asn in tasks],
+                              cache_dir=self.builder.cache_dir,
+                              cache_expiry=self.builder.cache_expiry,
+                              cache_backend=self.builder.cache_backend)
+
         for asn in tasks:
-            self.tasks_q.put((int(asn), tasks[asn]))
+            yield (int(asn), tasks[asn])
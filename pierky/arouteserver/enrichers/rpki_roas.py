@@ -16,34 +16,24 @@
 import logging
 
 from .base import BaseConfigEnricher
-from ..ipaddresses import IPNetwork
+from .irrdb import IRRDBConfigEnricher_ASNs
 from ..errors import BuilderError
+from ..packed_lists import ROAList
 from ..ripe_rpki_cache import RIPE_RPKI_ROAs
+from ..rpki_rtr import RTR_ROAs
 
 class RPKIROAsEnricher(BaseConfigEnricher):
 
-    def _use_roas_for_this_origin(self, asn):
-        """Return True if ROAs for the given origin ASN must be used
+    DESCR = "RPKI ROAs"
 
-        When ROAs are used only as route objects (so, no BGP Origin
-        Validation is configured) only ROAs for authorized origin ASNs
-        are returned.
-        """
+    # Sources of ROAs that are fetched by ARouteServer.
+    SOURCES = ("ripe-rpki-validator-cache", "rtr")
 
-        if self._origin_validation:
-            # ROAs are used to perform BGP Origin Validation, so
-            # every ROA must be used.
-            return True
-
-        if self._roas_as_route_object:
-            # If the current ROA is for an origin ASN that is
-            # not allowed for any client then skip it.
-            if asn in self.origin_asns:
-                return True
+    # The list of authorized origin ASNs is needed when ROAs
+    # are used as route objects.
+    DEPENDS_ON = (IRRDBConfigEnricher_ASNs,)
 
-        return False
-
-    def enrich(self):
+    def enrich(self, executor=None):
         logging.info("Updating RPKI ROAs...")
 
         filtering = self.builder.cfg_general["filtering"]
@@ -77,58 +67,64 @@ class RPKIROAsEnricher(BaseConfigEnricher):
         afis = [4, 6] if self.builder.ip_ver is None else [self.builder.ip_ver]
 
         rpki_roas_cfg = self.builder.cfg_general["rpki_roas"]
-        assert rpki_roas_cfg["source"] == "ripe-rpki-validator-cache", \
-            "source is not ripe-rpki-validator-cache"
-        urls = rpki_roas_cfg["ripe_rpki_validator_url"]
+        assert rpki_roas_cfg["source"] in self.SOURCES, \
+            "source is not one of {}".format(", ".join(self.SOURCES))
+
+        cache_cfg = {
+            "cache_dir": self.builder.cache_dir,
+            "cache_expiry": self.builder.cache_expiry,
+            "cache_backend": self.builder.cache_backend
+        }
 
-        ripe_cache = RIPE_RPKI_ROAs(cache_dir=self.builder.cache_dir,
-                                    cache_expiry=self.builder.cache_expiry,
-                                    ripe_rpki_validator_url=urls)
-        ripe_cache.load_data()
-        roas = ripe_cache.roas
+        if rpki_roas_cfg["source"] == "rtr":
+            roas_obj = RTR_ROAs(rtr_server=rpki_roas_cfg["rtr_server"],
+                                **cache_cfg)
 
-        allowed_tas = rpki_roas_cfg["allowed_trust_anchors"]
+            # Trust anchors are not carried by RTR: the choice of
+            # those to be used is left to the RPKI cache.
+            allowed_tas = None
+        else:
+            urls = rpki_roas_cfg["ripe_rpki_validator_url"]
+            roas_obj = RIPE_RPKI_ROAs(ripe_rpki_validator_url=urls,
+                                      **cache_cfg)
+
+            allowed_tas = rpki_roas_cfg["allowed_trust_anchors"]
+
+        roas_obj.load_data()
+        roas = ROAList.from_roas(roas_obj.roas)
 
         roas_cnt = {
-            "total": 0,
+            "total": len(roas),
             "invalid_ta": 0,
             "unused": 0,
-            "used": {
-                "4": 0,
-                "6": 0
-            }
+            "redundant": 0,
+            "used": {}
         }
-        for roa in roas["roas"]:
-            roas_cnt["total"] += 1
-
-            asn = int(roa["asn"][2:])
-            if not self._use_roas_for_this_origin(asn):
-                roas_cnt["unused"] += 1
-                continue
 
-            ta = roa["ta"]
-            if ta not in allowed_tas:
-                roas_cnt["invalid_ta"] += 1
-                continue
+        if not self._origin_validation:
+            # ROAs are used only as route objects: those for origin
+            # ASNs that are not allowed for any client are skipped.
+            used_roas = roas.filter(asns=self.origin_asns)
+            roas_cnt["unused"] = len(roas) - len(used_roas)
+            roas = used_roas
 
-            prefix = roa["prefix"]
+        if allowed_tas is not None:
+            valid_roas = roas.filter(tas=set(allowed_tas))
+            roas_cnt["invalid_ta"] = len(roas) - len(valid_roas)
+            roas = valid_roas
 
-            prefix_obj = IPNetwork(prefix)
-            if prefix_obj.version not in afis:
-                continue
+        roas = roas.filter(afis=set(afis))
 
-            max_len = int(roa["maxLength"])
+        # ROAs covered by another one for the same origin ASN, with a
+        # max length that is not shorter, are not needed.
+        needed_roas = roas.remove_redundant()
+        roas_cnt["redundant"] = len(roas) - len(needed_roas)
+        roas = needed_roas.sort()
 
-            roa_payload = {"prefix": prefix, "length": prefix_obj.prefixlen,
-                           "max_len": max_len, "asn": asn}
-
-            prefix_len = str(prefix_obj.prefixlen)
-            if prefix_len not in self.builder.rpki_roas:
-                self.builder.rpki_roas[prefix_len] = [roa_payload]
-            else:
-                self.builder.rpki_roas[prefix_len].append(roa_payload)
+        for afi in afis:
+            roas_cnt["used"][str(afi)] = roas.count_afi(afi)
 
-            roas_cnt["used"][str(prefix_obj.version)] += 1
+        self.builder.rpki_roas = roas
 
         stats = "RPKI ROAs: "
         stats += "{} total".format(roas_cnt["total"])
@@ -136,6 +132,8 @@ class RPKIROAsEnricher(BaseConfigEnricher):
             stats += ", {} from not allowed TAs".format(roas_cnt["invalid_ta"])
         if roas_cnt["unused"] > 0:
             stats += ", {} unused".format(roas_cnt["unused"])
+        if roas_cnt["redundant"] > 0:
+            stats += ", {} redundant".format(roas_cnt["redundant"])
         for afi in afis:
             stats += ", {} used for IPv{}".format(
                 roas_cnt["used"][str(afi)], afi
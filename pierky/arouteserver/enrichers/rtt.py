@@ -18,19 +18,18 @@ import os
 import re
 import subprocess
 
-from .base import BaseConfigEnricher, BaseConfigEnricherThread
+from .base import BaseConfigEnricher, BaseConfigEnricherTaskHandler
+from ..build_stats import build_stats
 from ..errors import BuilderError, MissingFileError
 
-class RTTGetter_WorkerThread(BaseConfigEnricherThread):
+class RTTGetter_WorkerThread(BaseConfigEnricherTaskHandler):
 
     DESCR = "RTTGetter"
 
     # The following regex pattern is reported by docs/RTT_GETTER.rst
     RETURN_VALUE_RE_PATTERN = re.compile("^\d+[.]?\d*$")
 
-    def __init__(self, *args, **kwargs):
-        BaseConfigEnricherThread.__init__(self, *args, **kwargs)
-
+    def __init__(self):
         self.rtt_getter_path = None
 
     @staticmethod
@@ -59,6 +58,7 @@ class RTTGetter_WorkerThread(BaseConfigEnricherThread):
         cmd += [str(client["asn"])]
         cmd += [str(client["id"])]
 
+        build_stats.incr("subprocesses_total", program="rtt_getter")
         try:
             out = subprocess.check_output(cmd)
         except Exception as e:
@@ -102,7 +102,7 @@ class RTTGetterConfigEnricher(BaseConfigEnricher):
     def _config_thread(self, thread):
         thread.rtt_getter_path = self.builder.rtt_getter_path
 
-    def add_tasks(self):
-        # Enqueuing tasks.
+    def get_tasks(self):
+        # Generating tasks.
         for client in self.builder.cfg_clients.cfg["clients"]:
-            self.tasks_q.put(client)
+            yield client
@@ -109,6 +109,9 @@ class EuroIXSchemaError(EuroIXError):
 class RPKIValidatorCacheError(ARouteServerError):
     pass
 
+class RTRError(ARouteServerError):
+    pass
+
 class ARINWhoisDBDumpError(ARouteServerError):
     pass
 
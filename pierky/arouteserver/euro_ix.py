@@ -21,6 +21,7 @@ import six
 
 from .peering_db import PeeringDBNet, PeeringDBNoInfoError
 from .errors import EuroIXError, EuroIXSchemaError
+from .http_client import http_get
 
 class EuroIXMemberList(object):
 
@@ -38,16 +39,18 @@ class EuroIXMemberList(object):
     ]
     INFO_FROM_PEERINGDB = ["as-set", "max-prefix"]
 
-    def __init__(self, input_object, cache_dir, cache_expiry):
+    def __init__(self, input_object, cache_dir, cache_expiry,
+                 cache_backend=None):
         self.cache_dir = cache_dir
         self.cache_expiry = cache_expiry
+        self.cache_backend = cache_backend
 
         self.raw_data = None
 
         if isinstance(input_object, dict):
             self.raw_data = input_object
         elif isinstance(input_object, six.string_types):
-            response = requests.get(input_object)
+            response = http_get(input_object)
             raw = response.content.decode("utf-8")
             try:
                 response.raise_for_status()
@@ -253,7 +256,8 @@ class EuroIXMemberList(object):
                     try:
                         pdb_net = PeeringDBNet(client["asn"],
                                                cache_dir=self.cache_dir,
-                                               cache_expiry=self.cache_expiry)
+                                               cache_expiry=self.cache_expiry,
+                                               cache_backend=self.cache_backend)
                         pdb_net.load_data()
                     except PeeringDBNoInfoError:
                         continue
@@ -0,0 +1,107 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .build_stats import build_stats
+
+
+class HTTPNotModified(Exception):
+    """Raised by http_get() when the server answers 304 Not Modified.
+
+    response: the 304 response, which may or may not carry the
+    validators of the resource.
+    """
+
+    def __init__(self, response=None):
+        Exception.__init__(self)
+        self.response = response
+
+# Size of the pool of connections kept alive for each host.
+POOL_MAXSIZE = 10
+
+_local = threading.local()
+
+def get_session():
+    """Return the requests.Session of the current thread.
+
+    Sessions are not shared among threads; within the same thread,
+    connections are kept alive and reused by the following requests.
+    Responses are transparently decompressed when the server sends
+    them gzip-encoded.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+        _local.session = session
+    return session
+
+def get_validators(response):
+    """Return the ETag and Last-Modified headers of a response.
+
+    The dict that is returned can be passed to http_get() to
+    revalidate a copy of the resource later.
+    """
+    res = {}
+    if response.headers.get("ETag"):
+        res["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        res["last_modified"] = response.headers["Last-Modified"]
+    return res
+
+def http_get(url, headers=None, validators=None, **kwargs):
+    """Perform an HTTP GET request using the thread's session.
+
+    validators: dict returned by get_validators() for a copy of
+    the resource which was previously fetched. If given, the request
+    is conditional (If-None-Match, If-Modified-Since) and
+    HTTPNotModified is raised when the server answers that the copy
+    is still valid.
+
+    Other kwargs are passed to requests.Session.get().
+    """
+    headers = dict(headers or {})
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = get_session().get(url, headers=headers, **kwargs)
+
+    build_stats.incr("http_requests_total", status=response.status_code)
+
+    # Bytes received, as reported by the server; when missing, the
+    # size of the body, unless it's streamed (not read yet).
+    try:
+        downloaded = int(response.headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        downloaded = None
+    if downloaded is None and not kwargs.get("stream"):
+        downloaded = len(response.content)
+    if downloaded:
+        build_stats.incr("http_downloaded_bytes_total", downloaded)
+
+    if validators and response.status_code == 304:
+        raise HTTPNotModified(response)
+
+    return response
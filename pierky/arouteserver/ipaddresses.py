@@ -13,6 +13,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import socket
+import struct
+
 try:
     import ipaddr
     ip_library = "ipaddr"
@@ -53,3 +56,171 @@ class IPNetwork(object):
 
     def __str__(self):
         return "{}/{}".format(self.ip, self.prefixlen)
+
+
+def ip_pton(ip):
+    """Return the packed (4 or 16 bytes) representation of an IP address."""
+    if ":" in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return socket.inet_pton(socket.AF_INET, ip)
+
+def ip_ntop(packed):
+    """Return the string representation of a packed IP address.
+
+    The result is the same of IPAddress(...).ip.
+    """
+    if len(packed) == 4:
+        return socket.inet_ntop(socket.AF_INET, packed)
+
+    ip = socket.inet_ntop(socket.AF_INET6, packed)
+    if "." not in ip:
+        return ip
+
+    # inet_ntop uses the dotted notation for IPv4-mapped addresses:
+    # hextets are used here instead, compressing the longest run
+    # of zeros, if longer than one hextet.
+    hextets = ["{:x}".format(hextet)
+               for hextet in struct.unpack("!8H", packed)]
+    best_start, best_len = -1, 1
+    start = None
+    for idx, hextet in enumerate(hextets + [None]):
+        if hextet == "0":
+            if start is None:
+                start = idx
+        elif start is not None:
+            if idx - start > best_len:
+                best_start, best_len = start, idx - start
+            start = None
+    if best_start < 0:
+        return ":".join(hextets)
+    return "{}::{}".format(":".join(hextets[:best_start]),
+                           ":".join(hextets[best_start + best_len:]))
+
+
+class IPNet(object):
+    """
+    Lightweight IP network, used on the hot paths (ROAs, IRR and Whois
+    records) instead of IPNetwork.
+
+    The network address is kept as an integer; objects are immutable
+    and are shared among callers by parse_ip_network(), which caches
+    them.
+    """
+
+    __slots__ = ("version", "net", "prefixlen", "max_prefixlen")
+
+    def __init__(self, version, net, prefixlen):
+        self.version = version
+        self.net = net
+        self.prefixlen = prefixlen
+        self.max_prefixlen = 32 if version == 4 else 128
+
+    @property
+    def packed(self):
+        if self.version == 4:
+            return struct.pack("!I", self.net)
+        return struct.pack("!QQ", self.net >> 64,
+                           self.net & 0xFFFFFFFFFFFFFFFF)
+
+    @property
+    def ip(self):
+        return ip_ntop(self.packed)
+
+    def __str__(self):
+        return "{}/{}".format(self.ip, self.prefixlen)
+
+    def __repr__(self):
+        return "IPNet({})".format(str(self))
+
+    def __eq__(self, other):
+        return isinstance(other, IPNet) and \
+            (self.version, self.net, self.prefixlen) == \
+            (other.version, other.net, other.prefixlen)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.version, self.net, self.prefixlen))
+
+    def __contains__(self, other):
+        """True if other is a subnet of (or the same of) this network."""
+        if other.version != self.version or \
+            other.prefixlen < self.prefixlen:
+            return False
+        shift = self.max_prefixlen - self.prefixlen
+        return other.net >> shift == self.net >> shift
+
+_ip_network_cache = {}
+_IP_NETWORK_CACHE_MAX_SIZE = 65536
+
+def _parse_ip_network(prefix):
+    if "/" in prefix:
+        ip, prefixlen = prefix.split("/", 1)
+        if not prefixlen.isdigit():
+            raise ValueError("Invalid prefix length: {}".format(prefix))
+        prefixlen = int(prefixlen)
+    else:
+        ip, prefixlen = prefix, None
+
+    try:
+        if ":" in ip:
+            version = 6
+            hi, lo = struct.unpack("!QQ", socket.inet_pton(socket.AF_INET6, ip))
+            net = hi << 64 | lo
+        else:
+            version = 4
+            net = struct.unpack("!I", socket.inet_pton(socket.AF_INET, ip))[0]
+    except (socket.error, ValueError):
+        raise ValueError("Invalid IP address: {}".format(prefix))
+
+    max_prefixlen = 32 if version == 4 else 128
+    if prefixlen is None:
+        prefixlen = max_prefixlen
+    elif prefixlen > max_prefixlen:
+        raise ValueError("Invalid prefix length: {}".format(prefix))
+
+    if net & ((1 << (max_prefixlen - prefixlen)) - 1):
+        raise ValueError("Host bits set: {}".format(prefix))
+
+    return IPNet(version, net, prefixlen)
+
+def parse_ip_network(prefix, cache=True):
+    """Return the IPNet object for the given prefix ("ip[/len]").
+
+    Like ipaddress.ip_network(), a ValueError is raised if the prefix
+    is not valid or if it has host bits set.
+
+    Results are cached, unless cache is False: it should be used when
+    parsing bulk data (like whole ROAs or Whois dumps), that would
+    only evict the useful entries.
+    """
+    try:
+        return _ip_network_cache[prefix]
+    except KeyError:
+        pass
+
+    res = _parse_ip_network(prefix)
+    if not cache:
+        return res
+    if len(_ip_network_cache) >= _IP_NETWORK_CACHE_MAX_SIZE:
+        _ip_network_cache.clear()
+    _ip_network_cache[prefix] = res
+    return res
+
+def parse_ip_networks(prefixes):
+    """Return the list of the IPNet objects for the given prefixes.
+
+    Prefixes that are repeated are parsed only once; like for
+    parse_ip_network(cache=False), the cache is not filled.
+    """
+    parsed = {}
+    res = []
+    for prefix in prefixes:
+        try:
+            net = parsed[prefix]
+        except KeyError:
+            net = _ip_network_cache.get(prefix) or _parse_ip_network(prefix)
+            parsed[prefix] = net
+        res.append(net)
+    return res
@@ -19,10 +19,12 @@ import logging
 import re
 import subprocess
 
+from .build_stats import build_stats
 from .cached_objects import CachedObject
 from .config.validators import ValidatorPrefixListEntry
 from .errors import IRRDBToolsError
-from .ipaddresses import IPNetwork
+from .ipaddresses import parse_ip_network
+from .irrdb_whois import parse_range_operator
 
 
 class AS_SET_Bundle(object):
@@ -90,6 +92,8 @@ class AS_SET_Bundle(object):
 
 class IRRDBInfo(CachedObject, AS_SET_Bundle):
 
+    IRRDB_CLIENTS = ("bgpq3", "whois")
+
     BGPQ3_DEFAULT_HOST = "rr.ntt.net"
     BGPQ3_DEFAULT_SOURCES = ("RIPE,APNIC,AFRINIC,ARIN,NTTCOM,ALTDB,"
                              "BBOI,BELL,JPIRR,LEVEL3,RADB,RGNET,"
@@ -105,8 +109,17 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
         self.bgpq3_sources = kwargs.get("bgpq3_sources",
                                         self.BGPQ3_DEFAULT_SOURCES)
 
+        # When set, an IRRdWhoisSession (or IRRdWhoisSessionPool) used
+        # to query the IRRd whois server directly instead of running bgpq3.
+        self.whois_client = kwargs.get("whois_client")
+
         AS_SET_Bundle.__init__(self, object_names)
 
+    def _get_cache_key_suffix(self):
+        # bgpq3 and the IRRd whois client don't return the same data
+        # (bgpq3 aggregates prefixes, for example).
+        return "-whois" if self.whois_client else ""
+
     def _get_bgpq3_sources(self):
         if self.source:
             return "{},{}".format(self.source, self.bgpq3_sources)
@@ -123,6 +136,7 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
         return res
 
     def _run_cmd(self, cmd):
+        build_stats.incr("subprocesses_total", program="bgpq3")
         proc = subprocess.Popen(cmd,
                                 stdout=subprocess.PIPE,
                                 stderr=subprocess.PIPE)
@@ -154,7 +168,8 @@ class ASSet(IRRDBInfo):
         self.asns = self.raw_data
 
     def _get_object_filename(self):
-        return "{}-as_set.json".format(self.name)
+        return "{}-as_set{}.json".format(self.name,
+                                         self._get_cache_key_suffix())
 
     def _get_data(self):
         object_names = self._get_bgpq3_names()
@@ -166,6 +181,17 @@ class ASSet(IRRDBInfo):
             re.match("^AS[0-9]+$", object_names[0]):
             return [int(object_names[0][2:])]
 
+        if self.whois_client:
+            try:
+                return self.whois_client.get_asns(
+                    object_names, self._get_bgpq3_sources()
+                )
+            except Exception as e:
+                raise IRRDBToolsError(
+                    "Can't get list of authorized ASNs for {} from the "
+                    "IRRd whois server: {}".format(self.descr, str(e))
+                )
+
         cmd = [self.bgpq3_path]
         cmd += ["-h", self.bgpq3_host]
         cmd += ["-S", self._get_bgpq3_sources()]
@@ -216,12 +242,50 @@ class RSet(IRRDBInfo):
         self.prefixes = self.raw_data
 
     def _get_object_filename(self):
-        return "{}-r_set-ipv{}{}.json".format(
+        return "{}-r_set-ipv{}{}{}.json".format(
             self.name, self.ip_ver,
-            "_and_more_specific" if self.allow_longer_prefixes else ""
+            "_and_more_specific" if self.allow_longer_prefixes else "",
+            self._get_cache_key_suffix()
         )
 
+    def _get_data_from_whois(self):
+        try:
+            prefixes = self.whois_client.get_prefixes(
+                self._get_bgpq3_names(), self._get_bgpq3_sources(),
+                self.ip_ver
+            )
+        except Exception as e:
+            raise IRRDBToolsError(
+                "Can't get authorized prefix list for {} IPv{} from the "
+                "IRRd whois server: {}".format(
+                    self.descr, self.ip_ver, str(e)
+                )
+            )
+
+        max_length = 32 if self.ip_ver == 4 else 128
+
+        res = []
+        for prefix in prefixes:
+            # Route-set members can carry a range operator.
+            prefix, _, operator = prefix.partition("^")
+            raw = {"prefix": prefix}
+            if operator:
+                raw["exact"] = False
+                raw["greater-equal"], raw["less-equal"] = \
+                    parse_range_operator(operator,
+                                         int(prefix.split("/")[1]),
+                                         max_length)
+            else:
+                raw["exact"] = not self.allow_longer_prefixes
+            if self.allow_longer_prefixes:
+                raw["less-equal"] = max_length
+            res.append(self._parse_prefix(raw))
+        return res
+
     def _get_data(self):
+        if self.whois_client:
+            return self._get_data_from_whois()
+
         cmd = [self.bgpq3_path]
         cmd += ["-h", self.bgpq3_host]
         cmd += ["-S", self._get_bgpq3_sources()]
@@ -258,7 +322,7 @@ class RSet(IRRDBInfo):
         return [self._parse_prefix(prefix) for prefix in data["prefix_list"]]
 
     def _parse_prefix(self, raw):
-        prefix = IPNetwork(raw["prefix"])
+        prefix = parse_ip_network(raw["prefix"])
         res = {
             "prefix": prefix.ip,
             "length": prefix.prefixlen,
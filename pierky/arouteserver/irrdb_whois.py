@@ -0,0 +1,527 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+from six.moves import queue
+import re
+import socket
+import threading
+
+from .errors import IRRDBToolsError
+from .ipaddresses import parse_ip_network
+
+
+def parse_range_operator(operator, length, max_length):
+    """Returns the (ge, le) range of a RPSL range operator.
+
+    operator is what follows '^' in the route-set member ("-", "+",
+    "n" or "n-m"); ValueError is raised if it's not valid for a
+    prefix of the given length.
+    """
+    if operator == "-":
+        ge, le = length + 1, max_length
+    elif operator == "+":
+        ge, le = length, max_length
+    else:
+        match = re.match("^([0-9]+)(?:-([0-9]+))?$", operator)
+        if not match:
+            raise ValueError("invalid range operator: ^{}".format(operator))
+        ge = int(match.group(1))
+        le = int(match.group(2)) if match.group(2) else ge
+
+    if not length <= ge <= le <= max_length:
+        raise ValueError(
+            "range operator ^{} not valid for a /{} prefix".format(
+                operator, length
+            )
+        )
+    return ge, le
+
+class IRRdWhoisSession(object):
+    """
+    Persistent session with an IRRd whois server.
+
+    The IRRd '!!' mode is used to keep the TCP connection open
+    across queries; multiple queries are written at once on the
+    socket (pipelining) and their answers, which IRRd sends back
+    in the same order, are then read and demultiplexed.
+
+    A session is not thread-safe: threads are expected to borrow
+    sessions from an IRRdWhoisSessionPool.
+    """
+
+    DEFAULT_PORT = 43
+    TIMEOUT = 60
+
+    def __init__(self, host, timeout=TIMEOUT, resolver=None):
+        host_port = host.rsplit(":", 1)
+        if len(host_port) == 2 and host_port[1].isdigit():
+            self.host = host_port[0]
+            self.port = int(host_port[1])
+        else:
+            self.host = host
+            self.port = self.DEFAULT_PORT
+        self.timeout = timeout
+
+        # Memoized expansion of the sets; it can be shared among
+        # sessions.
+        self.resolver = resolver or IRRdASSetResolver()
+
+        self.sock = None
+        self.f = None
+        self.sources = None
+
+        # True when the server supports the '!a' query (IRRd >= 4).
+        self.aggregate_query = False
+
+    def connect(self):
+        if self.sock:
+            return
+
+        logging.debug("Connecting to IRRd whois server {}:{}".format(
+            self.host, self.port))
+
+        try:
+            self.sock = socket.create_connection((self.host, self.port),
+                                                 timeout=self.timeout)
+            self.f = self.sock.makefile("rb")
+            self.sock.sendall(b"!!\n")
+        except Exception as e:
+            self.close()
+            raise IRRDBToolsError(
+                "Can't connect to IRRd whois server {}:{}: {}".format(
+                    self.host, self.port, str(e)
+                )
+            )
+        self.sources = None
+
+        version = self.query(["!v"])[0]
+        match = re.search(r"version\s+([0-9]+)", version, re.IGNORECASE)
+        self.aggregate_query = bool(match) and int(match.group(1)) >= 4
+
+    def close(self):
+        if self.f:
+            try:
+                self.f.close()
+            except Exception:
+                pass
+        if self.sock:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.f = None
+        self.sock = None
+        self.sources = None
+
+    def _read_line(self):
+        line = self.f.readline()
+        if not line:
+            raise IRRDBToolsError("Connection closed by the server")
+        return line.decode("utf-8").strip()
+
+    def _read_response(self, query):
+        # IRRd answers:
+        # A<len>  followed by <len> bytes of data, then a 'C' line
+        # C       success, no data
+        # D       key not found
+        # E       multiple copies of the key
+        # F <msg> error
+        line = self._read_line()
+        while not line:
+            line = self._read_line()
+
+        if line.startswith("A"):
+            data_len = int(line[1:])
+            data = b""
+            while len(data) < data_len:
+                buf = self.f.read(data_len - len(data))
+                if not buf:
+                    raise IRRDBToolsError("Connection closed by the server")
+                data += buf
+            end = self._read_line()
+            while not end:
+                end = self._read_line()
+            if end != "C":
+                raise IRRDBToolsError(
+                    "Unexpected response to '{}': {}".format(query, end)
+                )
+            return data.decode("utf-8")
+        if line in ("C", "D", "E"):
+            return ""
+        if line.startswith("F"):
+            raise IRRDBToolsError(
+                "Error returned by the server for '{}': {}".format(
+                    query, line[1:].strip()
+                )
+            )
+        raise IRRDBToolsError(
+            "Unexpected response to '{}': {}".format(query, line)
+        )
+
+    def query(self, queries):
+        """Send a batch of queries and return their answers.
+
+        The answers are returned in the same order of the queries.
+        """
+
+        self.connect()
+
+        if not queries:
+            return []
+
+        try:
+            self.sock.sendall(
+                "".join(["{}\n".format(q) for q in queries]).encode("utf-8")
+            )
+
+            res = []
+            for q in queries:
+                res.append(self._read_response(q))
+            return res
+        except IRRDBToolsError:
+            # The stream can't be trusted anymore, a new connection
+            # will be established for the next queries.
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            raise IRRDBToolsError(
+                "Error while querying the IRRd whois server {}:{}: "
+                "{}".format(self.host, self.port, str(e))
+            )
+
+    def set_sources(self, sources):
+        if self.sock and self.sources == sources:
+            return
+        self.query(["!s{}".format(sources)])
+        self.sources = sources
+
+    def get_asns(self, object_names, sources):
+        self.set_sources(sources)
+
+        asns, _ = self.resolver.expand(self, object_names, sources)
+
+        return sorted(asns)
+
+    def _get_routes(self, keys, sources, ip_ver):
+        """Returns the prefixes of the given ASNs ('AS<n>') or sets.
+
+        ASNs are queried using '!g'/'!6', sets using '!a4'/'!a6';
+        answers are memoized by the resolver.
+        """
+
+        res = set()
+        missing = []
+        for key in sorted(keys):
+            routes = self.resolver.get_routes(sources, ip_ver, key)
+            if routes is None:
+                missing.append(key)
+            else:
+                res.update(routes)
+
+        queries = []
+        for key in missing:
+            if re.match("^AS[0-9]+$", key):
+                queries.append("{}{}".format(
+                    "!g" if ip_ver == 4 else "!6", key
+                ))
+            else:
+                queries.append("!a{}{}".format(ip_ver, key))
+
+        answers = self.query(queries)
+
+        for key, answer in zip(missing, answers):
+            routes = frozenset(answer.split())
+            self.resolver.set_routes(sources, ip_ver, key, routes)
+            res.update(routes)
+
+        return res
+
+    def get_prefixes(self, object_names, sources, ip_ver):
+        self.set_sources(sources)
+
+        if self.aggregate_query:
+            # IRRd >= 4: sets are expanded server-side using '!a'.
+            prefixes = self._get_routes(object_names, sources, ip_ver)
+        else:
+            asns, prefixes = self.resolver.expand(self, object_names,
+                                                  sources)
+            prefixes = set(prefixes)
+            prefixes.update(self._get_routes(
+                ["AS{}".format(asn) for asn in asns], sources, ip_ver
+            ))
+
+        res = []
+        for prefix in prefixes:
+            prefix, _, operator = prefix.partition("^")
+            try:
+                net = parse_ip_network(prefix)
+                if operator:
+                    parse_range_operator(operator, net.prefixlen,
+                                         net.max_prefixlen)
+            except ValueError as e:
+                logging.warning("Invalid prefix returned by the IRRd whois "
+                                "server: {}{} - {}".format(
+                                    prefix,
+                                    "^" + operator if operator else "",
+                                    str(e)
+                                ))
+                continue
+            if net.version != ip_ver:
+                continue
+            res.append((net, operator))
+
+        # Duplicates can't be removed before parsing the prefixes,
+        # because the same one could be formatted differently.
+        res = set([(net.net, net.prefixlen, operator,
+                    "{}^{}".format(net, operator) if operator else str(net))
+                   for net, operator in res])
+
+        return [prefix for _, _, _, prefix in sorted(res)]
+
+class IRRdASSetResolver(object):
+    """
+    Recursive resolver of AS-SETs and route-sets.
+
+    Sets are expanded one level at a time using the non-recursive
+    '!i' query; the direct members of each set are memoized, so that
+    sets nested in many bundles (transit providers' AS-SETs, for
+    example) are queried only once. Bundles are then resolved by
+    walking the resulting graph; loops among sets are detected and
+    broken.
+
+    The routes of each origin ASN (or set, with '!a') are memoized too.
+
+    The resolver is thread-safe and can be shared among sessions.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # { (sources, set_name): (asns, prefixes, sub_sets) }
+        self.members = {}
+
+        # { (sources, set_name): (asns, prefixes) }
+        # Only contains the sets whose expansion is complete.
+        self.expanded = {}
+
+        # { (sources, ip_ver, "AS<n>" or set_name): frozenset(prefixes) }
+        self.routes = {}
+
+    @staticmethod
+    def parse_members(answer):
+        asns = set()
+        prefixes = set()
+        sub_sets = set()
+
+        for member in answer.split():
+            member = member.upper()
+            if re.match("^AS[0-9]+$", member):
+                asns.add(int(member[2:]))
+            elif "/" in member and not member.startswith("AS"):
+                # route-set members, with their range operator
+                prefixes.add(member)
+            elif "^" in member:
+                raise IRRDBToolsError(
+                    "range operators are only supported on prefixes, "
+                    "not on sets or ASNs: {}".format(member)
+                )
+            else:
+                sub_sets.add(member)
+
+        return frozenset(asns), frozenset(prefixes), frozenset(sub_sets)
+
+    def get_routes(self, sources, ip_ver, key):
+        with self.lock:
+            return self.routes.get((sources, ip_ver, key))
+
+    def set_routes(self, sources, ip_ver, key, routes):
+        with self.lock:
+            self.routes[(sources, ip_ver, key)] = routes
+
+    def _fetch(self, session, set_names, sources):
+        """Query the members of all the sets reachable from set_names.
+
+        Sets are fetched in batches, one for each nesting level.
+        """
+
+        to_fetch = set(set_names)
+        seen = set()
+
+        while to_fetch:
+            seen.update(to_fetch)
+
+            with self.lock:
+                missing = sorted([name for name in to_fetch
+                                  if (sources, name) not in self.members])
+
+            answers = session.query(["!i{}".format(name)
+                                     for name in missing])
+
+            with self.lock:
+                for name, answer in zip(missing, answers):
+                    self.members[(sources, name)] = \
+                        self.parse_members(answer)
+
+                next_to_fetch = set()
+                for name in to_fetch:
+                    next_to_fetch.update(self.members[(sources, name)][2])
+
+            to_fetch = next_to_fetch - seen
+
+    def _resolve(self, name, sources, stack):
+        """Returns (asns, prefixes, loop_pos).
+
+        loop_pos is the position in the stack of the outermost set
+        that has been found to be part of a loop with this one, or
+        None. Sets whose expansion depends on a set that is still
+        being resolved are not memoized, because their expansion
+        could be incomplete.
+        """
+
+        key = (sources, name)
+
+        if key in self.expanded:
+            asns, prefixes = self.expanded[key]
+            return asns, prefixes, None
+
+        if key in stack:
+            logging.debug("Loop detected while expanding {}: {}".format(
+                name, " -> ".join([k[1] for k in stack] + [name])
+            ))
+            return frozenset(), frozenset(), stack.index(key)
+
+        pos = len(stack)
+        stack.append(key)
+
+        direct_asns, direct_prefixes, sub_sets = self.members[key]
+        asns = set(direct_asns)
+        prefixes = set(direct_prefixes)
+        loop_pos = None
+
+        for sub_set in sorted(sub_sets):
+            sub_asns, sub_prefixes, sub_loop_pos = \
+                self._resolve(sub_set, sources, stack)
+            asns.update(sub_asns)
+            prefixes.update(sub_prefixes)
+            if sub_loop_pos is not None and sub_loop_pos < pos:
+                if loop_pos is None or sub_loop_pos < loop_pos:
+                    loop_pos = sub_loop_pos
+
+        stack.pop()
+
+        asns = frozenset(asns)
+        prefixes = frozenset(prefixes)
+        if loop_pos is None:
+            self.expanded[key] = (asns, prefixes)
+
+        return asns, prefixes, loop_pos
+
+    def expand(self, session, object_names, sources):
+        """Returns (asns, prefixes) found in the given objects.
+
+        'ASxxx' elements are returned as they are, sets are
+        recursively expanded.
+        """
+
+        asns = set()
+        prefixes = set()
+
+        set_names = []
+        for name in object_names:
+            if re.match("^AS[0-9]+$", name):
+                asns.add(int(name[2:]))
+            else:
+                set_names.append(name)
+
+        if not set_names:
+            return asns, prefixes
+
+        self._fetch(session, set_names, sources)
+
+        with self.lock:
+            for name in set_names:
+                set_asns, set_prefixes, _ = self._resolve(name, sources, [])
+                asns.update(set_asns)
+                prefixes.update(set_prefixes)
+
+        return asns, prefixes
+
+class IRRdWhoisSessionPool(object):
+    """
+    Bounded pool of IRRd whois sessions shared among threads.
+
+    At most max_sessions connections are opened toward the server;
+    each thread borrows a session for the time needed to run a batch
+    of queries, then it gives it back to the pool so that it can be
+    reused by other threads.
+    It exposes the same get_asns/get_prefixes methods of
+    IRRdWhoisSession.
+    """
+
+    def __init__(self, host, max_sessions, timeout=IRRdWhoisSession.TIMEOUT,
+                 resolver=None):
+        assert max_sessions > 0
+
+        self.host = host
+        self.timeout = timeout
+
+        # Shared by all the sessions of the pool.
+        self.resolver = resolver or IRRdASSetResolver()
+
+        # Idle sessions; when empty, a new session is created unless
+        # max_sessions have already been created.
+        self.idle = queue.LifoQueue()
+        self.sessions = []
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if len(self.sessions) < self.max_sessions:
+                session = IRRdWhoisSession(self.host, timeout=self.timeout,
+                                           resolver=self.resolver)
+                self.sessions.append(session)
+                return session
+
+        return self.idle.get(block=True)
+
+    def release(self, session):
+        self.idle.put(session)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions:
+                session.close()
+
+    def get_asns(self, *args, **kwargs):
+        session = self.acquire()
+        try:
+            return session.get_asns(*args, **kwargs)
+        finally:
+            self.release(session)
+
+    def get_prefixes(self, *args, **kwargs):
+        session = self.acquire()
+        try:
+            return session.get_prefixes(*args, **kwargs)
+        finally:
+            self.release(session)
@@ -0,0 +1,359 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+import binascii
+import hashlib
+from itertools import compress
+import json
+import struct
+
+from .ipaddresses import ip_ntop, ip_pton
+
+
+def pack_asns(asns):
+    """Return the bytes representation of a list of ASNs."""
+    arr = array("I", asns)
+    if hasattr(arr, "tobytes"):
+        return arr.tobytes()
+    return arr.tostring()
+
+def unpack_asns(raw):
+    """Return an array('I') with the ASNs packed by pack_asns()."""
+    arr = array("I")
+    if hasattr(arr, "frombytes"):
+        arr.frombytes(raw)
+    else:
+        arr.fromstring(raw)
+    return arr
+
+class PackedPrefixList(object):
+    """
+    Compact, read-only list of prefix list entries.
+
+    Entries are packed into a single bytes buffer, one fixed-size
+    record each: address (16 bytes, IPv4 addresses are left-aligned),
+    length, ge, le (0 when not set) and flags. Comments, if any, are
+    JSON-encoded after the records.
+
+    Entries are returned as the same dicts used elsewhere for prefix
+    lists ("prefix", "length", "exact", "ge", "le", "max_length",
+    "comment"), built when they are accessed.
+    """
+
+    HEADER = struct.Struct("!I")
+    RECORD = struct.Struct("!16sBBBB")
+
+    FLAG_EXACT = 0x01
+    FLAG_IPV6 = 0x02
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = self.HEADER.unpack_from(raw)[0]
+
+        comments_offset = self.HEADER.size + self.count * self.RECORD.size
+        if len(raw) > comments_offset:
+            self.comments = json.loads(raw[comments_offset:].decode("utf-8"))
+        else:
+            self.comments = None
+
+    @classmethod
+    def pack(cls, entries):
+        """Return the bytes representation of a list of entries."""
+        records = []
+        comments = []
+        for entry in entries:
+            flags = 0
+            if entry["exact"]:
+                flags |= cls.FLAG_EXACT
+            if ":" in entry["prefix"]:
+                flags |= cls.FLAG_IPV6
+            addr = ip_pton(entry["prefix"])
+            records.append(cls.RECORD.pack(
+                addr, entry["length"], entry.get("ge") or 0,
+                entry.get("le") or 0, flags
+            ))
+            comments.append(entry.get("comment"))
+
+        raw = cls.HEADER.pack(len(records)) + b"".join(records)
+        if any(comment is not None for comment in comments):
+            raw += json.dumps(comments).encode("utf-8")
+        return raw
+
+    def _get_record(self, idx):
+        return self.raw[self.HEADER.size + idx * self.RECORD.size:
+                        self.HEADER.size + (idx + 1) * self.RECORD.size]
+
+    def _decode(self, idx):
+        addr, length, ge, le, flags = self.RECORD.unpack_from(
+            self.raw, self.HEADER.size + idx * self.RECORD.size
+        )
+        if flags & self.FLAG_IPV6:
+            prefix = ip_ntop(addr)
+            max_length = 128
+        else:
+            prefix = ip_ntop(addr[:4])
+            max_length = 32
+        return {
+            "prefix": prefix,
+            "length": length,
+            "exact": bool(flags & self.FLAG_EXACT),
+            "ge": ge or None,
+            "le": le or None,
+            "max_length": max_length,
+            "comment": self.comments[idx] if self.comments else None
+        }
+
+    def digest(self):
+        """Return a digest of the entries, regardless of their order.
+
+        Comments are not taken into account.
+        """
+        records = sorted([self._get_record(idx) for idx in range(self.count)])
+        return hashlib.sha1(b"".join(records)).hexdigest()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for idx in range(self.count):
+            yield self._decode(idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._decode(i) for i in range(*idx.indices(self.count))]
+        if idx < 0:
+            idx += self.count
+        if idx < 0 or idx >= self.count:
+            raise IndexError("list index out of range")
+        return self._decode(idx)
+
+    def filter_ip_ver(self, ip_ver):
+        """Return a PackedPrefixList with only the entries of ip_ver."""
+        is_ipv6 = self.FLAG_IPV6 if ip_ver == 6 else 0
+        idxs = [
+            idx for idx in range(self.count)
+            if self.RECORD.unpack_from(
+                self.raw, self.HEADER.size + idx * self.RECORD.size
+            )[4] & self.FLAG_IPV6 == is_ipv6
+        ]
+        raw = self.HEADER.pack(len(idxs)) + \
+            b"".join([self._get_record(idx) for idx in idxs])
+        if self.comments:
+            raw += json.dumps(
+                [self.comments[idx] for idx in idxs]
+            ).encode("utf-8")
+        return PackedPrefixList(raw)
+
+class ROAList(object):
+    """
+    Columnar, read-only list of ROAs.
+
+    Each field of the ROAs is kept in its own array: origin ASN, AFI,
+    prefix length, max length and the id of the trust anchor (the
+    index in the 'tas' list); prefixes are kept as strings, since
+    that's how they are used in the output configuration.
+
+    Filtering and sorting never copy the columns: the new ROAList
+    shares them, with its own array of the indices of the rows it
+    contains. ROAs are returned as the dicts used by the templates
+    ("prefix", "length", "max_len", "asn"), built when they are
+    accessed.
+    """
+
+    def __init__(self, columns=None, idxs=None):
+        if columns is None:
+            columns = {
+                "asns": array("I"),
+                "afis": array("B"),
+                "prefixes": [],
+                "lengths": array("B"),
+                "max_lens": array("B"),
+                "ta_ids": array("H"),
+                "tas": []
+            }
+        self.columns = columns
+        if idxs is None:
+            idxs = array("I", range(len(columns["prefixes"])))
+        self.idxs = idxs
+
+    def __getstate__(self):
+        # Only the rows of this list are passed to other processes.
+        if len(self.idxs) == len(self.columns["prefixes"]):
+            return {"columns": self.columns, "idxs": self.idxs}
+
+        columns = {"tas": self.columns["tas"]}
+        for name, col in self.columns.items():
+            if name == "tas":
+                continue
+            rows = [col[idx] for idx in self.idxs]
+            columns[name] = array(col.typecode, rows) \
+                if isinstance(col, array) else rows
+        return {"columns": columns,
+                "idxs": array("I", range(len(self.idxs)))}
+
+    def __setstate__(self, state):
+        self.columns = state["columns"]
+        self.idxs = state["idxs"]
+
+    @classmethod
+    def from_roas(cls, roas):
+        """Build the list from [asn, prefix, length, max_len, ta] items.
+
+        This is the format used by RIPE_RPKI_ROAs and RTR_ROAs.
+        """
+        if not roas:
+            return cls()
+
+        # Faster than zip(*roas) on big lists.
+        asns, prefixes, lengths, max_lens, tas = [
+            [roa[field] for roa in roas] for field in range(5)
+        ]
+
+        ta_ids = {}
+        for ta in set(tas):
+            ta_ids[ta] = len(ta_ids)
+
+        return cls({
+            "asns": array("I", asns),
+            "afis": array("B", [6 if ":" in prefix else 4
+                                for prefix in prefixes]),
+            "prefixes": prefixes,
+            "lengths": array("B", lengths),
+            "max_lens": array("B", max_lens),
+            "ta_ids": array("H", [ta_ids[ta] for ta in tas]),
+            "tas": sorted(ta_ids, key=ta_ids.get)
+        })
+
+    def filter(self, afis=None, asns=None, tas=None):
+        """Return the ROAs whose AFI, ASN and TA are in the given sets.
+
+        Criteria set to None are not taken into account.
+        """
+        def select(idxs, col, values):
+            if not isinstance(values, (set, frozenset)):
+                values = set(values)
+            return list(compress(
+                idxs, map(values.__contains__, map(col.__getitem__, idxs))
+            ))
+
+        idxs = self.idxs
+        if afis is not None:
+            idxs = select(idxs, self.columns["afis"], afis)
+        if asns is not None:
+            idxs = select(idxs, self.columns["asns"], asns)
+        if tas is not None:
+            idxs = select(idxs, self.columns["ta_ids"],
+                          [ta_id for ta_id, ta in enumerate(self.columns["tas"])
+                           if ta in tas])
+        if idxs is self.idxs:
+            return self
+        return ROAList(self.columns, array("I", idxs))
+
+    def remove_redundant(self):
+        """Return the ROAs that are not made redundant by other ones.
+
+        A ROA is redundant when another one for the same origin ASN
+        covers its prefix with a max length that is not shorter: all
+        the routes that it matches are matched by the other ROA too,
+        and all the routes that it covers are covered by the other
+        one as well, so removing it doesn't change the outcome of the
+        origin validation of any route. The order of the ROAs is kept.
+        """
+        asns = self.columns["asns"]
+        afis = self.columns["afis"]
+        prefixes = self.columns["prefixes"]
+        lengths = self.columns["lengths"]
+        max_lens = self.columns["max_lens"]
+
+        # Within the same ASN and AFI, a covering prefix comes before
+        # the prefixes it covers, and, for the same prefix, the ROA
+        # with the longest max length comes first.
+        # Prefixes have already been validated, so the network
+        # address is just converted to an integer.
+        rows = sorted([
+            (asns[idx], afis[idx],
+             int(binascii.hexlify(ip_pton(prefixes[idx].split("/")[0])), 16),
+             lengths[idx], -max_lens[idx], pos)
+            for pos, idx in enumerate(self.idxs)
+        ])
+
+        keep = []
+
+        # Chain of the not redundant ROAs that cover the current one,
+        # with increasing max lengths.
+        stack = []
+
+        for asn, afi, net, length, neg_max_len, pos in rows:
+            bits = 32 if afi == 4 else 128
+            while stack:
+                top_asn, top_afi, top_net, top_length, top_max_len = stack[-1]
+                if top_asn == asn and top_afi == afi and \
+                    net >> (bits - top_length) == \
+                    top_net >> (bits - top_length):
+                    break
+                stack.pop()
+
+            max_len = -neg_max_len
+            if stack and stack[-1][4] >= max_len:
+                continue
+
+            stack.append((asn, afi, net, length, max_len))
+            keep.append(pos)
+
+        if len(keep) == len(self.idxs):
+            return self
+        keep.sort()
+        return ROAList(self.columns, array("I", [self.idxs[pos]
+                                                 for pos in keep]))
+
+    def sort(self):
+        """Return the ROAs sorted by prefix length, prefix and ASN."""
+        # One (stable) sort for each column, from the least significant
+        # one: faster than sorting tuples.
+        idxs = sorted(self.idxs, key=self.columns["asns"].__getitem__)
+        idxs.sort(key=self.columns["prefixes"].__getitem__)
+        idxs.sort(key=self.columns["lengths"].__getitem__)
+        return ROAList(self.columns, array("I", idxs))
+
+    @property
+    def prefixes(self):
+        col = self.columns["prefixes"]
+        return [col[idx] for idx in self.idxs]
+
+    def count_afi(self, afi):
+        col = self.columns["afis"]
+        return sum(1 for idx in self.idxs if col[idx] == afi)
+
+    def _get(self, idx):
+        columns = self.columns
+        return {
+            "prefix": columns["prefixes"][idx],
+            "length": columns["lengths"][idx],
+            "max_len": columns["max_lens"][idx],
+            "asn": columns["asns"][idx]
+        }
+
+    def __len__(self):
+        return len(self.idxs)
+
+    def __iter__(self):
+        for idx in self.idxs:
+            yield self._get(idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._get(i) for i in self.idxs[idx]]
+        return self._get(self.idxs[idx])
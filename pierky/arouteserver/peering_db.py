@@ -20,7 +20,9 @@ import requests
 
 from .cached_objects import CachedObject
 from .config.validators import ValidatorASSet
-from .errors import PeeringDBError, PeeringDBNoInfoError, ConfigError
+from .errors import PeeringDBError, PeeringDBNoInfoError, ConfigError, \
+                    ARouteServerError
+from .http_client import http_get
 from .irrdb import IRRDBInfo
 
 
@@ -35,8 +37,8 @@ class PeeringDBInfo(CachedObject):
 
     @staticmethod
     def _read_from_url(url):
-        response = requests.get(url)
         try:
+            response = http_get(url)
             response.raise_for_status()
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
@@ -85,11 +87,88 @@ class PeeringDBNet(PeeringDBInfo):
     EXPIRY_TIME_TAG = "pdb_info"
 
     PEERINGDB_URL = "https://www.peeringdb.com/api/net?asn={asn}"
+    PEERINGDB_BULK_URL = "https://www.peeringdb.com/api/net?asn__in={asns}"
+
+    PREFETCH_CHUNK_SIZE = 100
 
     def __init__(self, asn, **kwargs):
         PeeringDBInfo.__init__(self, **kwargs)
         self.asn = asn
 
+    @classmethod
+    def _get_bulk_data_from_peeringdb(cls, asns):
+        url = cls.PEERINGDB_BULK_URL.format(
+            asns=",".join([str(asn) for asn in asns])
+        )
+        plain_text = cls._read_from_url(url)
+        try:
+            data = json.loads(plain_text)
+        except Exception as e:
+            raise PeeringDBError(
+                "Error while decoding PeeringDB output: {}".format(
+                    str(e)
+                )
+            )
+
+        if not isinstance(data.get("data", None), list):
+            raise PeeringDBError("Unexpected format: 'data' is not a list")
+
+        # { <asn>: [<net record>] }
+        res = {}
+        for net in data["data"]:
+            res[net["asn"]] = [net]
+        return res
+
+    @classmethod
+    def prefetch(cls, asns, **kwargs):
+        """Populate the cache with the records of many networks.
+
+        Networks whose record is not already in the cache are fetched
+        from PeeringDB in chunks of PREFETCH_CHUNK_SIZE ASNs, using a
+        single request per chunk; each record is then saved in the
+        cache as if it was fetched by PeeringDBNet(asn).load_data().
+
+        In case of errors, the networks of the affected chunk are
+        just left out of the cache, to be fetched one by one later.
+
+        kwargs are the same used to build PeeringDBNet objects.
+        """
+
+        to_fetch = []
+        for asn in sorted(set(asns)):
+            net = cls(asn, **kwargs)
+            try:
+                if net.load_data_from_cache():
+                    continue
+            except PeeringDBNoInfoError:
+                continue
+            to_fetch.append(asn)
+
+        if not to_fetch:
+            return
+
+        logging.debug("Prefetching {} networks from PeeringDB".format(
+            len(to_fetch)))
+
+        for i in range(0, len(to_fetch), cls.PREFETCH_CHUNK_SIZE):
+            chunk = to_fetch[i:i + cls.PREFETCH_CHUNK_SIZE]
+
+            try:
+                records = cls._get_bulk_data_from_peeringdb(chunk)
+
+                for asn in chunk:
+                    net = cls(asn, **kwargs)
+                    # None for networks not on PeeringDB (missing info).
+                    net.raw_data = records.get(asn, None)
+                    net.save_data_to_cache()
+            except ARouteServerError as e:
+                logging.warning(
+                    "Error while prefetching networks from PeeringDB, "
+                    "they will be fetched one by one: {}".format(
+                        str(e) or "error unknown"
+                    )
+                )
+
     def load_data(self):
         logging.debug("Getting data from PeeringDB: net {}".format(self.asn))
 
@@ -217,10 +296,11 @@ class PeeringDBIXList(PeeringDBInfo):
     def _get_peeringdb_url(self):
         return self.PEERINGDB_URL
 
-def clients_from_peeringdb(netixlanid, cache_dir):
+def clients_from_peeringdb(netixlanid, cache_dir, cache_backend=None):
     clients = []
 
-    pdb_net_ixlan = PeeringDBNetIXLan(netixlanid, cache_dir=cache_dir)
+    pdb_net_ixlan = PeeringDBNetIXLan(netixlanid, cache_dir=cache_dir,
+                                      cache_backend=cache_backend)
     pdb_net_ixlan.load_data()
     netixlans = pdb_net_ixlan.raw_data
     for netixlan in netixlans:
@@ -238,7 +318,8 @@ def clients_from_peeringdb(netixlanid, cache_dir):
 
     for client in clients:
         asn = client["asn"]
-        net = PeeringDBNet(asn, cache_dir=cache_dir)
+        net = PeeringDBNet(asn, cache_dir=cache_dir,
+                           cache_backend=cache_backend)
         net.load_data()
 
         if not net.irr_as_sets:
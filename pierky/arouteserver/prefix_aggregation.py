@@ -0,0 +1,265 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+
+from .ipaddresses import ip_ntop, ip_pton
+
+
+def _merge_ranges(ranges):
+    """Merge overlapping or adjacent (start, end) ranges."""
+    res = []
+    for start, end in sorted(ranges):
+        if res and start <= res[-1][1] + 1:
+            if end > res[-1][1]:
+                res[-1] = (res[-1][0], end)
+        else:
+            res.append((start, end))
+    return res
+
+def _intersect_ranges(a, b):
+    res = []
+    for a_start, a_end in a:
+        for b_start, b_end in b:
+            start = max(a_start, b_start)
+            end = min(a_end, b_end)
+            if start <= end:
+                res.append((start, end))
+    return _merge_ranges(res)
+
+def _subtract_ranges(a, b):
+    res = []
+    for start, end in a:
+        for b_start, b_end in b:
+            if b_end < start or b_start > end:
+                continue
+            if b_start > start:
+                res.append((start, b_start - 1))
+            start = b_end + 1
+            if start > end:
+                break
+        if start <= end:
+            res.append((start, end))
+    return res
+
+def _reduce_ranges(ranges, covered):
+    """Remove from ranges the parts that are covered.
+
+    Ranges are only trimmed or removed: those that would be split
+    in two parts by the subtraction are left unchanged, so that the
+    number of ranges never grows.
+    """
+    res = []
+    for rng in ranges:
+        parts = _subtract_ranges([rng], covered)
+        if len(parts) > 1:
+            res.append(rng)
+        else:
+            res.extend(parts)
+    return res
+
+class PrefixListAggregator(object):
+    """
+    Aggregate a prefix list into the smallest equivalent one.
+
+    Each entry is seen as the set of routes whose prefix is within
+    entry's prefix and whose length is within the range [ge, le]
+    (both equal to the prefix length for 'exact' entries). Entries
+    are the nodes of a binary radix tree, keyed by IP version, prefix
+    length and network address, with the list of ranges of lengths
+    they match.
+
+    The tree is then reduced, without changing the set of routes
+    that are matched:
+
+    - ranges that are already covered by those of an ancestor node
+      are removed;
+
+    - ranges that are in common between two sibling nodes are moved
+      to their parent node, since any route matched by the parent
+      with a length greater than the parent's one is also matched
+      by one of the two children.
+    """
+
+    MAX_LENGTH = {4: 32, 6: 128}
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+
+        # { (ip_ver, length, net): [(start, end), ...] }
+        self.nodes = {}
+
+        # Nodes that still carry the original entry, unchanged:
+        # { (ip_ver, length, net): <entry> }
+        self.orig_entries = {}
+
+        self.changed = False
+
+        for entry in self.entries:
+            self._add_entry(entry)
+
+    def _add_entry(self, entry):
+        ip_ver = 6 if ":" in entry["prefix"] else 4
+        max_length = self.MAX_LENGTH[ip_ver]
+        length = entry["length"]
+        net = int(binascii.hexlify(ip_pton(entry["prefix"])), 16)
+        if entry["exact"]:
+            rng = (length, length)
+        else:
+            rng = (entry["ge"] or length, entry["le"] or max_length)
+
+        key = (ip_ver, length, net)
+        if key in self.nodes:
+            # Duplicate prefix.
+            self.changed = True
+            self.orig_entries.pop(key, None)
+            self.nodes[key] = _merge_ranges(self.nodes[key] + [rng])
+        else:
+            self.nodes[key] = [rng]
+            self.orig_entries[key] = entry
+
+    def _set_ranges(self, key, ranges):
+        self.changed = True
+        self.orig_entries.pop(key, None)
+        if ranges:
+            self.nodes[key] = ranges
+        else:
+            del self.nodes[key]
+
+    def _remove_covered(self):
+        lengths = {4: set(), 6: set()}
+        for ip_ver, length, _ in self.nodes:
+            lengths[ip_ver].add(length)
+
+        for key in sorted(self.nodes):
+            ip_ver, length, net = key
+            max_length = self.MAX_LENGTH[ip_ver]
+
+            covered = []
+            for ancestor_length in lengths[ip_ver]:
+                if ancestor_length >= length:
+                    continue
+                mask_bits = max_length - ancestor_length
+                ancestor_key = (ip_ver, ancestor_length,
+                                net >> mask_bits << mask_bits)
+                if ancestor_key in self.nodes:
+                    covered += self.nodes[ancestor_key]
+            if not covered:
+                continue
+
+            ranges = self.nodes[key]
+            new_ranges = _reduce_ranges(ranges, _merge_ranges(covered))
+            if new_ranges != ranges:
+                self._set_ranges(key, new_ranges)
+
+    def _merge_siblings(self):
+        res = False
+        by_length = {}
+        for key in self.nodes:
+            by_length.setdefault((key[0], key[1]), []).append(key)
+
+        for ip_ver in (4, 6):
+            max_length = self.MAX_LENGTH[ip_ver]
+            for length in range(max_length, 0, -1):
+                keys = by_length.get((ip_ver, length))
+                if not keys:
+                    continue
+                bit = 1 << (max_length - length)
+                for key in keys:
+                    net = key[2]
+                    if net & bit:
+                        continue
+                    sibling_key = (ip_ver, length, net | bit)
+                    if key not in self.nodes or \
+                        sibling_key not in self.nodes:
+                        continue
+
+                    common = _intersect_ranges(self.nodes[key],
+                                               self.nodes[sibling_key])
+                    if not common:
+                        continue
+
+                    # The merge is done only if it reduces the total
+                    # number of ranges.
+                    parent_key = (ip_ver, length - 1, net)
+                    parent_ranges = self.nodes.get(parent_key, [])
+                    new_parent_ranges = _merge_ranges(parent_ranges + common)
+                    new_ranges = [_reduce_ranges(self.nodes[k], common)
+                                  for k in (key, sibling_key)]
+                    if len(new_parent_ranges) + \
+                        len(new_ranges[0]) + len(new_ranges[1]) >= \
+                        len(parent_ranges) + \
+                        len(self.nodes[key]) + len(self.nodes[sibling_key]):
+                        continue
+
+                    res = True
+                    self._set_ranges(key, new_ranges[0])
+                    self._set_ranges(sibling_key, new_ranges[1])
+                    if parent_key not in self.nodes:
+                        by_length.setdefault((ip_ver, length - 1),
+                                             []).append(parent_key)
+                    self._set_ranges(parent_key, new_parent_ranges)
+        return res
+
+    def _build_entry(self, key, rng):
+        ip_ver, length, net = key
+        max_length = self.MAX_LENGTH[ip_ver]
+        start, end = rng
+        packed = binascii.unhexlify("{:0{}x}".format(net, max_length // 4))
+        entry = {
+            "prefix": ip_ntop(packed),
+            "length": length,
+            "max_length": max_length,
+            "comment": None
+        }
+        if start == length and end == length:
+            entry["exact"] = True
+            entry["ge"] = None
+            entry["le"] = None
+        else:
+            entry["exact"] = False
+            entry["ge"] = start if start != length else None
+            entry["le"] = end if end != max_length else None
+        return entry
+
+    def aggregate(self):
+        """Return the aggregated list of entries.
+
+        If the list can't be reduced, the original one is returned.
+        Otherwise, entries are sorted by IP version and prefix;
+        those that are left unchanged are the original dicts.
+        """
+        self._remove_covered()
+        while self._merge_siblings():
+            self._remove_covered()
+
+        if not self.changed:
+            return self.entries
+
+        res = []
+        for key in sorted(self.nodes, key=lambda k: (k[0], k[2], k[1])):
+            if key in self.orig_entries:
+                res.append(self.orig_entries[key])
+                continue
+            for rng in self.nodes[key]:
+                res.append(self._build_entry(key, rng))
+        return res
+
+def aggregate_prefix_list(entries):
+    """Return the smallest prefix list equivalent to entries.
+
+    Details in PrefixListAggregator.
+    """
+    return PrefixListAggregator(entries).aggregate()
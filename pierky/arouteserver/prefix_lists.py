@@ -0,0 +1,139 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Functions used by the Jinja2 templates to render whole lists of
+# prefixes and ROAs in one call, instead of calling a macro for each
+# entry: the output is the same that the original macros produced.
+#
+# Entries are the dicts built by the configuration parsers and by the
+# enrichers ("prefix", "length", "exact", "ge", "le", "max_length",
+# "comment"); ROAs are the dicts from the RPKI ROAs enricher ("prefix",
+# "length", "max_len", "asn"). The IP version of a prefix is taken from
+# its textual representation, without building an IPNetwork object.
+
+
+def prefix_ip_ver(prefix):
+    return 6 if ":" in prefix else 4
+
+def _filter_ip_ver(entries, ip_ver):
+    if not ip_ver:
+        return entries
+    return [entry for entry in entries
+            if prefix_ip_ver(entry["prefix"]) == ip_ver]
+
+def _prefixlen_range(entry):
+    return (entry["ge"] or entry["length"],
+            entry["le"] or entry["max_length"])
+
+def bird_prefix_list_entry(entry):
+    if entry["exact"]:
+        return "{}/{}".format(entry["prefix"], entry["length"])
+    return "{}/{}{{{},{}}}".format(
+        entry["prefix"], entry["length"], *_prefixlen_range(entry)
+    )
+
+def bird_prefix_list(entries, ip_ver=None, group=False):
+    """Render the items of a BIRD prefix set.
+
+    When group is False, each entry is preceded by its comment and
+    entries are separated by a blank line; otherwise, they are
+    grouped 4 per line.
+    """
+    if not entries:
+        return ""
+
+    entries = _filter_ip_ver(entries, ip_ver)
+
+    if not group:
+        return ",\n\n".join([
+            "\t\t# {}\n\t\t{}".format(entry["comment"],
+                                      bird_prefix_list_entry(entry))
+            for entry in entries
+        ])
+
+    res = []
+    for idx, entry in enumerate(entries):
+        if idx:
+            res.append(",\n" if idx % 4 == 0 else ", ")
+        res.append("\t")
+        res.append(bird_prefix_list_entry(entry))
+    return "".join(res)
+
+def bird_roa_table(roas):
+    """Render the items of a BIRD ROA table."""
+    return "".join([
+        "\troa {} max {} as {};\n".format(roa["prefix"], roa["max_len"],
+                                          roa["asn"])
+        for roa in roas
+    ])
+
+def openbgpd_prefix_list_entry(entry):
+    res = "{}/{}".format(entry["prefix"], entry["length"])
+    if entry["exact"]:
+        return res
+    start, end = _prefixlen_range(entry)
+    if start != end:
+        return "{} prefixlen {} - {}".format(res, start, end)
+    return "{} prefixlen = {}".format(res, start)
+
+def openbgpd_prefix_list(entries, ip_ver=None):
+    """Render a comma-separated OpenBGPD list of prefixes."""
+    return ", ".join([openbgpd_prefix_list_entry(entry)
+                      for entry in _filter_ip_ver(entries, ip_ver)])
+
+def openbgpd_prefixset_list(entries, ip_ver=None):
+    """Render the items of an OpenBGPD prefix-set."""
+    return "".join(["    {}\n".format(openbgpd_prefix_list_entry(entry))
+                    for entry in _filter_ip_ver(entries, ip_ver)])
+
+def openbgpd_origin_set(entries, asn):
+    """Render the items of an OpenBGPD origin-set, all for one ASN."""
+    return "".join([
+        "{} source-as {}\n".format(openbgpd_prefix_list_entry(entry), asn)
+        for entry in entries
+    ])
+
+def openbgpd_roa_set(roas):
+    """Render the items of an OpenBGPD roa-set (or origin-set)."""
+    res = []
+    for roa in roas:
+        if roa["length"] != roa["max_len"]:
+            res.append("    {} maxlen {} source-as {}\n".format(
+                roa["prefix"], roa["max_len"], roa["asn"]))
+        else:
+            res.append("    {} source-as {}\n".format(
+                roa["prefix"], roa["asn"]))
+    return "".join(res)
+
+def openbgpd_roas_action(roas, action):
+    """Render one OpenBGPD 'match' rule for each ROA.
+
+    ROAs for AS0 are skipped.
+    """
+    res = []
+    for roa in roas:
+        if roa["asn"] == 0:
+            continue
+        if roa["length"] != roa["max_len"]:
+            res.append(
+                "match from group clients source-as {} prefix {} "
+                "prefixlen {} - {} {}\n".format(
+                    roa["asn"], roa["prefix"], roa["length"],
+                    roa["max_len"], action))
+        else:
+            res.append(
+                "match from group clients source-as {} prefix {} "
+                "{}\n".format(roa["asn"], roa["prefix"], action))
+    return "".join(res)
@@ -0,0 +1,155 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import cProfile
+import logging
+import os
+import pstats
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from .errors import ARouteServerError
+
+
+class BuildProfiler(object):
+    """
+    Profile the phases of a build.
+
+    For each phase, the following files are written to output_dir:
+
+    - <phase>.pstats: cProfile data, to be loaded using the pstats
+      module (or tools like snakeviz); all the threads started during
+      the phase (enrichers, their workers) are profiled;
+
+    - <phase>.txt: the functions with the highest cumulative time;
+
+    - <phase>.tracemalloc: the tracemalloc snapshot taken at the end
+      of the phase, to be loaded using tracemalloc.Snapshot.load();
+
+    - <phase>.allocations.txt: the lines of code that allocated most
+      of the memory still in use at the end of the phase, along with
+      the peak size of the memory traced during the phase.
+
+    Memory is traced only when tracemalloc is available (Python 3.4+).
+    When output_dir is None, phases are not profiled.
+    """
+
+    TOP_FUNCTIONS = 50
+    TOP_ALLOCATIONS = 50
+
+    # Frames stored for each memory block: more frames give more
+    # context, but make tracing much slower.
+    TRACEMALLOC_FRAMES = 1
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+        if not output_dir:
+            return
+
+        if not os.path.isdir(output_dir):
+            try:
+                os.makedirs(output_dir)
+            except OSError as e:
+                raise ARouteServerError(
+                    "Can't create the profiling directory {}: {}".format(
+                        output_dir, str(e)
+                    )
+                )
+
+        if tracemalloc is None:
+            logging.warning("tracemalloc is not available on this version "
+                            "of Python: memory allocations will not be "
+                            "profiled.")
+
+    def _get_path(self, phase, ext):
+        return os.path.join(self.output_dir, "{}.{}".format(phase, ext))
+
+    @contextmanager
+    def phase(self, name):
+        if not self.output_dir:
+            yield
+            return
+
+        # Threads started during the phase use their own profiler.
+        thread_profilers = []
+
+        def start_thread_profiler(frame, event, arg):
+            profiler = cProfile.Profile()
+            thread_profilers.append(profiler)
+            # This replaces start_thread_profiler for the thread.
+            profiler.enable()
+
+        if tracemalloc:
+            tracemalloc.start(self.TRACEMALLOC_FRAMES)
+
+        profiler = cProfile.Profile()
+        threading.setprofile(start_thread_profiler)
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            threading.setprofile(None)
+
+            if tracemalloc:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak_size = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            else:
+                snapshot = None
+
+            try:
+                self._save_profile(name, profiler, thread_profilers)
+                if snapshot:
+                    self._save_snapshot(name, snapshot, peak_size)
+            except Exception as e:
+                logging.error(
+                    "Error while saving the profiling data of the {} "
+                    "phase: {}".format(name, str(e))
+                )
+
+    def _save_profile(self, name, profiler, thread_profilers):
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profilers:
+            thread_profiler.create_stats()
+            if thread_profiler.stats:
+                stats.add(thread_profiler)
+        stats.dump_stats(self._get_path(name, "pstats"))
+
+        with open(self._get_path(name, "txt"), "w") as f:
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(self.TOP_FUNCTIONS)
+
+    def _save_snapshot(self, name, snapshot, peak_size):
+        snapshot.dump(self._get_path(name, "tracemalloc"))
+
+        top_stats = snapshot.statistics("lineno")
+        with open(self._get_path(name, "allocations.txt"), "w") as f:
+            f.write("Peak size of traced memory: {:.1f} MiB\n".format(
+                peak_size / 1024.0 / 1024.0
+            ))
+            f.write("Memory in use at the end of the phase: "
+                    "{:.1f} MiB\n\n".format(
+                        sum(stat.size for stat in top_stats) / 1024.0 / 1024.0
+                    ))
+            f.write("Top {} lines:\n\n".format(self.TOP_ALLOCATIONS))
+            for stat in top_stats[:self.TOP_ALLOCATIONS]:
+                f.write("{}\n".format(stat))
@@ -16,16 +16,19 @@
 import logging
 import os
 
+import requests
 from six.moves.urllib.request import urlopen
 
-from .ipaddresses import IPNetwork
-from .cached_objects import CachedObject
+from .ipaddresses import parse_ip_network
+from .cached_objects import CachedObject, COMPACT_CACHE_SERIALIZER
 from .errors import RegistroBRWhoisDBDumpError
+from .http_client import HTTPNotModified
 
 
 class RegistroBRWhoisDBDump(CachedObject):
 
     EXPIRY_TIME_TAG = "registrobr_whois_db_dump"
+    CACHE_SERIALIZER = COMPACT_CACHE_SERIALIZER
 
     def __init__(self, *args, **kwargs):
         CachedObject.__init__(self, *args, **kwargs)
@@ -64,7 +67,7 @@ class RegistroBRWhoisDBDump(CachedObject):
                     prefixes = fields[3:]
                     for prefix in prefixes:
                         try:
-                            IPNetwork(prefix)
+                            parse_ip_network(prefix, cache=False)
                         except Exception as e:
                             raise ValueError("invalid prefix: {} - {}".format(
                                 prefix, str(e)
@@ -103,7 +106,21 @@ class RegistroBRWhoisDBDump(CachedObject):
 
             url = self.source
             try:
-                response = urlopen(url).read()
+                if url.lower().startswith("ftp://"):
+                    response = urlopen(url).read()
+                else:
+                    response = self._http_get(url)
+                    response.raise_for_status()
+                    response = response.content
+            except HTTPNotModified:
+                raise
+            except requests.exceptions.HTTPError as e:
+                raise RegistroBRWhoisDBDumpError(
+                    "HTTP error while retrieving Registro.br Whois DB dump "
+                    "from {}: {}".format(
+                        url, str(e)
+                    )
+                )
             except Exception as e:
                 raise RegistroBRWhoisDBDumpError(
                     "Error while retrieving Registro.br Whois DB dump "
@@ -17,44 +17,189 @@ import json
 import logging
 
 import requests
+import six
 
-from .cached_objects import CachedObject
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from .cached_objects import CachedObject, COMPACT_CACHE_SERIALIZER
 from .errors import RPKIValidatorCacheError
-from .ipaddresses import IPNetwork
+from .http_client import HTTPNotModified
+from .ipaddresses import parse_ip_network
 
 
 class RIPE_RPKI_ROAs(CachedObject):
+    """RPKI ROAs exported by the RIPE RPKI Validator.
+
+    ROAs are stored in the 'roas' attribute (and in the cache) in
+    a compact format: a list of [asn, prefix, length, max_len, ta],
+    where asn, length and max_len are integers.
+
+    When ijson is available, the JSON export is parsed incrementally,
+    while it's read from the network or from the file.
+    """
 
     EXPIRY_TIME_TAG = "ripe_rpki_roas"
+    CACHE_SERIALIZER = COMPACT_CACHE_SERIALIZER
 
     DEFAULT_URL = "https://rpki-validator.ripe.net/api/export.json"
 
+    MAX_INVALID_ROAS = 10
+
     def __init__(self, *args, **kwargs):
         CachedObject.__init__(self, *args, **kwargs)
 
         self.urls = kwargs.get("ripe_rpki_validator_url",
                                [self.DEFAULT_URL])
 
-        self.roas = {}
+        self.roas = []
 
     def load_data(self):
         logging.debug("Loading RPKI ROAs...")
 
         CachedObject.load_data(self)
 
+        # Data cached by previous versions was the whole JSON export.
+        if self.from_cache and not isinstance(self.raw_data, list):
+            logging.debug("RPKI ROAs cached in the old format - "
+                          "trying to bypass the cache")
+            self.bypass_cache = True
+            CachedObject.load_data(self)
+
         self.roas = self.raw_data
 
     def _get_object_filename(self):
         return "ripe-rpki-cache.json"
 
+    @staticmethod
+    def _validate_roa(roa):
+        """Return the compact representation of a ROA.
+
+        ValueError is raised if the ROA is not valid.
+        """
+        if not isinstance(roa, dict):
+            raise ValueError("a dict was expected")
+
+        asn = roa.get("asn", None)
+        if not asn:
+            raise ValueError("missing ASN")
+        if not asn.startswith("AS"):
+            raise ValueError("invalid ASN: " + asn)
+        if not asn[2:].isdigit():
+            raise ValueError("invalid ASN: " + asn)
+
+        if "ta" not in roa:
+            raise ValueError("missing trust anchor")
+
+        prefix = roa.get("prefix", None)
+        if not prefix:
+            raise ValueError("missing prefix")
+        try:
+            prefix_obj = parse_ip_network(prefix, cache=False)
+        except:
+            raise ValueError("invalid prefix: " + prefix)
+
+        max_len = roa.get("maxLength", None)
+        if not max_len:
+            raise ValueError("missing maxLength")
+        if not isinstance(max_len, six.integer_types):
+            if not max_len.isdigit():
+                raise ValueError("invalid maxLength: " + max_len)
+
+        return [int(asn[2:]), prefix, prefix_obj.prefixlen, int(max_len),
+                roa["ta"]]
+
+    def _parse_roas(self, roas):
+        """Validate the ROAs and return their compact representation.
+
+        roas: iterable of ROAs, in the format used by the JSON export.
+        """
+        res = []
+        invalid = 0
+        for roa in roas:
+            try:
+                res.append(self._validate_roa(roa))
+            except ValueError as e:
+                logging.warning("Invalid ROA: {}, {}".format(
+                    str(roa), str(e)
+                ))
+
+                invalid += 1
+                if invalid > self.MAX_INVALID_ROAS:
+                    raise RPKIValidatorCacheError(
+                        "More than {} invalid ROAs have been found. "
+                        "Aborting.".format(self.MAX_INVALID_ROAS)
+                    )
+
+        return res
+
+    @staticmethod
+    def _check_roas_element(events, roas_element):
+        """Pass through the ijson events, looking for the 'roas' element.
+
+        roas_element is a dict whose "found" and "is_list" keys
+        are set on the basis of the events.
+        """
+        in_roas = False
+        for prefix, event, value in events:
+            if prefix == "" and event == "map_key" and value == "roas":
+                roas_element["found"] = True
+                in_roas = True
+            elif in_roas and prefix == "roas":
+                roas_element["is_list"] = event == "start_array"
+                in_roas = False
+            yield prefix, event, value
+
+    def _parse_export(self, f, url):
+        """Parse the JSON export read from the file-like object f."""
+        try:
+            if ijson:
+                roas_element = {"found": False, "is_list": False}
+                roas = self._parse_roas(ijson.items(
+                    self._check_roas_element(ijson.parse(f), roas_element),
+                    "roas.item"
+                ))
+
+                if not roas_element["found"]:
+                    raise RPKIValidatorCacheError("missing 'roas' root element")
+                if not roas_element["is_list"]:
+                    raise RPKIValidatorCacheError(
+                        "'roas' root element is not a list"
+                    )
+                return roas
+
+            dic = json.loads(f.read().decode("utf-8"))
+
+            if "roas" not in dic:
+                raise RPKIValidatorCacheError("missing 'roas' root element")
+            if not isinstance(dic["roas"], list):
+                raise RPKIValidatorCacheError(
+                    "'roas' root element is not a list"
+                )
+
+            return self._parse_roas(dic["roas"])
+        except RPKIValidatorCacheError:
+            raise
+        except Exception as e:
+            raise RPKIValidatorCacheError(
+                "Error while parsing ROAs from "
+                "RIPE RPKI Validator cache ({}): {}".format(
+                    url, str(e)
+                )
+            )
+
     def _get_data_from_url(self, url):
         if url.lower().startswith(("http://", "https://")):
             logging.debug("Fetching RPKI ROAs from {}".format(url))
             try:
-                response = requests.get(url,
-                                        headers={'Accept': 'text/json'})
+                response = self._http_get(url,
+                                          headers={'Accept': 'text/json'},
+                                          stream=True)
                 response.raise_for_status()
-                raw = response.content
+            except HTTPNotModified:
+                raise
             except requests.exceptions.HTTPError as e:
                 raise RPKIValidatorCacheError(
                     "HTTP error while retrieving ROAs from "
@@ -70,10 +215,17 @@ class RIPE_RPKI_ROAs(CachedObject):
                         url, str(e)
                     )
                 )
+
+            # The body is parsed while it's read from the socket.
+            response.raw.decode_content = True
+            try:
+                return self._parse_export(response.raw, url)
+            finally:
+                response.close()
         else:
             logging.debug("Loading RPKI ROAs from {} file".format(url))
             try:
-                raw = open(url, "rb").read()
+                f = open(url, "rb")
             except Exception as e:
                 raise RPKIValidatorCacheError(
                     "Error while reading ROAs from file "
@@ -82,66 +234,8 @@ class RIPE_RPKI_ROAs(CachedObject):
                     )
                 )
 
-        try:
-            roas = json.loads(raw.decode("utf-8"))
-        except Exception as e:
-            raise RPKIValidatorCacheError(
-                "Error while parsing ROAs from "
-                "RIPE RPKI Validator cache ({}): {}".format(
-                    url, str(e)
-                )
-            )
-
-        if "roas" not in roas:
-            raise RPKIValidatorCacheError("missing 'roas' root element")
-        if not isinstance(roas["roas"], list):
-            raise RPKIValidatorCacheError("'roas' root element is not a list")
-
-        max_invalid_roas = 10
-        invalid = 0
-        for roa in roas["roas"]:
-            try:
-                asn = roa.get("asn", None)
-                if not asn:
-                    raise ValueError("missing ASN")
-                if not asn.startswith("AS"):
-                    raise ValueError("invalid ASN: " + asn)
-                if not asn[2:].isdigit():
-                    raise ValueError("invalid ASN: " + asn)
-
-                if "ta" not in roa:
-                    raise ValueError("missing trust anchor")
-
-                prefix = roa.get("prefix", None)
-                if not prefix:
-                    raise ValueError("missing prefix")
-                try:
-                    IPNetwork(prefix)
-                except:
-                    raise ValueError("invalid prefix: " + prefix)
-
-                max_len = roa.get("maxLength", None)
-                if not max_len:
-                    raise ValueError("missing maxLength")
-                if not isinstance(max_len, int):
-                    if not max_len.isdigit():
-                        raise ValueError("invalid maxLength: " + max_len)
-
-            except ValueError as e:
-                logging.warning("Invalid ROA: {}, {}".format(
-                    str(roa), str(e)
-                ))
-
-                invalid += 1
-                if invalid > max_invalid_roas:
-                    raise RPKIValidatorCacheError(
-                        "More than {} invalid ROAs have been found. "
-                        "Aborting.".format(max_invalid_roas)
-                    )
-
-                continue
-
-        return roas
+            with f:
+                return self._parse_export(f, url)
 
     def _get_data(self):
         # List of (url, error)
@@ -0,0 +1,358 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import socket
+import struct
+
+from .cached_objects import CachedObject, COMPACT_CACHE_SERIALIZER
+from .errors import RTRError
+
+
+class RTRCacheReset(Exception):
+    """The cache can't answer a Serial Query: a Reset Query is needed."""
+    pass
+
+class RTRResponse(object):
+    """Data received from the cache in response to a query.
+
+    announced and withdrawn are sets of (asn, prefix, length, max_len).
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.session_id = None
+        self.serial = None
+        self.announced = set()
+        self.withdrawn = set()
+
+class RTRClient(object):
+    """
+    RPKI-to-Router protocol client (RFC 8210, RFC 6810).
+
+    Only what is needed to fetch the set of VRPs from the cache
+    is implemented: a new connection is used for each query and
+    it is closed as soon as the End of Data PDU is received.
+    Version 1 of the protocol is used, unless the cache only
+    supports version 0.
+    """
+
+    DEFAULT_PORT = 323
+    TIMEOUT = 60
+
+    SUPPORTED_VERSIONS = (1, 0)
+
+    PDU_SERIAL_NOTIFY = 0
+    PDU_SERIAL_QUERY = 1
+    PDU_RESET_QUERY = 2
+    PDU_CACHE_RESPONSE = 3
+    PDU_IPV4_PREFIX = 4
+    PDU_IPV6_PREFIX = 6
+    PDU_END_OF_DATA = 7
+    PDU_CACHE_RESET = 8
+    PDU_ROUTER_KEY = 9
+    PDU_ERROR_REPORT = 10
+
+    ERR_NO_DATA_AVAILABLE = 2
+    ERR_UNSUPPORTED_PROTOCOL_VERSION = 4
+
+    # version, PDU type, session ID (or other 16 bits field), length
+    HEADER = struct.Struct("!BBHI")
+
+    # flags, prefix length, max length, zero, prefix, ASN
+    IPV4_PREFIX = struct.Struct("!BBBB4sI")
+    IPV6_PREFIX = struct.Struct("!BBBB16sI")
+
+    FLAG_ANNOUNCEMENT = 0x01
+
+    MAX_PDU_LEN = 65536
+
+    def __init__(self, server, timeout=TIMEOUT):
+        host_port = server.rsplit(":", 1)
+        if len(host_port) == 2 and host_port[1].isdigit():
+            self.host = host_port[0]
+            self.port = int(host_port[1])
+        else:
+            self.host = server
+            self.port = self.DEFAULT_PORT
+        self.timeout = timeout
+
+    def _recv(self, sock, length):
+        data = b""
+        while len(data) < length:
+            buf = sock.recv(length - len(data))
+            if not buf:
+                raise RTRError("Connection closed by the RTR server")
+            data += buf
+        return data
+
+    def _read_pdu(self, sock):
+        version, pdu_type, field, length = self.HEADER.unpack(
+            self._recv(sock, self.HEADER.size)
+        )
+        if length < self.HEADER.size or length > self.MAX_PDU_LEN:
+            raise RTRError(
+                "Invalid length of RTR PDU type {}: {}".format(
+                    pdu_type, length
+                )
+            )
+        body = self._recv(sock, length - self.HEADER.size)
+        return version, pdu_type, field, body
+
+    @classmethod
+    def _parse_error_report(cls, field, body):
+        try:
+            pdu_len = struct.unpack("!I", body[:4])[0]
+            text_offset = 4 + pdu_len
+            text_len = struct.unpack("!I",
+                                     body[text_offset:text_offset + 4])[0]
+            text = body[text_offset + 4:text_offset + 4 + text_len]
+            text = text.decode("utf-8")
+        except Exception:
+            text = ""
+        return "error code {}{}".format(
+            field, ": {}".format(text) if text else ""
+        )
+
+    def _query(self, version, pdu_type, field=0, payload=b""):
+        query = self.HEADER.pack(version, pdu_type, field,
+                                 self.HEADER.size + len(payload)) + payload
+
+        try:
+            sock = socket.create_connection((self.host, self.port),
+                                            timeout=self.timeout)
+        except Exception as e:
+            raise RTRError(
+                "Can't connect to RTR server {}:{}: {}".format(
+                    self.host, self.port, str(e)
+                )
+            )
+
+        res = RTRResponse(version)
+
+        try:
+            sock.sendall(query)
+
+            while True:
+                pdu_version, pdu_type, field, body = self._read_pdu(sock)
+
+                if pdu_type == self.PDU_ERROR_REPORT:
+                    if field == self.ERR_UNSUPPORTED_PROTOCOL_VERSION:
+                        return None
+                    raise RTRError(
+                        "Error reported by the RTR server: {}".format(
+                            self._parse_error_report(field, body)
+                        )
+                    )
+
+                if pdu_version != version:
+                    raise RTRError(
+                        "Unexpected RTR protocol version: {}".format(
+                            pdu_version
+                        )
+                    )
+
+                if pdu_type == self.PDU_SERIAL_NOTIFY:
+                    continue
+
+                if pdu_type == self.PDU_CACHE_RESET:
+                    raise RTRCacheReset()
+
+                if pdu_type == self.PDU_CACHE_RESPONSE:
+                    res.session_id = field
+                    continue
+
+                if res.session_id is None:
+                    raise RTRError(
+                        "Unexpected RTR PDU type {} before Cache "
+                        "Response".format(pdu_type)
+                    )
+
+                if pdu_type in (self.PDU_IPV4_PREFIX, self.PDU_IPV6_PREFIX):
+                    if pdu_type == self.PDU_IPV4_PREFIX:
+                        fmt, family = self.IPV4_PREFIX, socket.AF_INET
+                    else:
+                        fmt, family = self.IPV6_PREFIX, socket.AF_INET6
+                    if len(body) != fmt.size:
+                        raise RTRError(
+                            "Invalid length of RTR PDU type {}".format(
+                                pdu_type
+                            )
+                        )
+                    flags, length, max_len, _, prefix, asn = \
+                        fmt.unpack(body)
+                    vrp = (asn, "{}/{}".format(
+                        socket.inet_ntop(family, prefix), length
+                    ), length, max_len)
+                    if flags & self.FLAG_ANNOUNCEMENT:
+                        res.withdrawn.discard(vrp)
+                        res.announced.add(vrp)
+                    else:
+                        res.announced.discard(vrp)
+                        res.withdrawn.add(vrp)
+                    continue
+
+                if pdu_type == self.PDU_ROUTER_KEY:
+                    continue
+
+                if pdu_type == self.PDU_END_OF_DATA:
+                    if field != res.session_id:
+                        raise RTRError("RTR session ID changed")
+                    res.serial = struct.unpack("!I", body[:4])[0]
+                    return res
+
+                raise RTRError("Unknown RTR PDU type: {}".format(pdu_type))
+        except (RTRError, RTRCacheReset):
+            raise
+        except Exception as e:
+            raise RTRError(
+                "Error while reading data from the RTR server {}:{}: "
+                "{}".format(self.host, self.port, str(e))
+            )
+        finally:
+            sock.close()
+
+    def reset_query(self):
+        """Fetch the whole set of VRPs.
+
+        Returns an RTRResponse object.
+        """
+        for version in self.SUPPORTED_VERSIONS:
+            res = self._query(version, self.PDU_RESET_QUERY)
+            if res:
+                return res
+            logging.debug("RTR server {}:{} does not support "
+                          "version {}".format(self.host, self.port, version))
+        raise RTRError(
+            "No supported RTR protocol versions in common with the "
+            "server {}:{}".format(self.host, self.port)
+        )
+
+    def serial_query(self, version, session_id, serial):
+        """Fetch the changes since the given serial number.
+
+        Returns an RTRResponse object; RTRCacheReset is raised when
+        the cache can't provide the changes.
+        """
+        res = self._query(version, self.PDU_SERIAL_QUERY, session_id,
+                          struct.pack("!I", serial))
+        if not res:
+            raise RTRCacheReset()
+        if res.session_id != session_id:
+            raise RTRCacheReset()
+        return res
+
+class RTR_ROAs(CachedObject):
+    """RPKI ROAs (VRPs) fetched from a local cache via RTR.
+
+    ROAs are stored in the 'roas' attribute in the same compact
+    format used by RIPE_RPKI_ROAs: [asn, prefix, length, max_len, ta],
+    where ta is always None, since it is not carried by RTR.
+
+    The RTR session ID and serial number are kept in the cache along
+    with the ROAs: once expired, the cached ROAs are updated using
+    only the changes occurred since then.
+    """
+
+    EXPIRY_TIME_TAG = "ripe_rpki_roas"
+    CACHE_SERIALIZER = COMPACT_CACHE_SERIALIZER
+
+    def __init__(self, *args, **kwargs):
+        CachedObject.__init__(self, *args, **kwargs)
+
+        self.server = kwargs.get("rtr_server")
+
+        self.roas = []
+
+    def load_data(self):
+        logging.debug("Loading RPKI ROAs via RTR...")
+
+        CachedObject.load_data(self)
+
+        self.roas = self.raw_data["roas"]
+
+    def _get_object_filename(self):
+        return "rtr-roas.json"
+
+    def _set_stale_data(self, get_data, meta):
+        # Expired data is the base for the incremental update.
+        self.get_stale_data = get_data
+
+    def _get_incremental_data(self, client):
+        if not self.get_stale_data or self.bypass_cache:
+            return None
+
+        stale = self.get_stale_data()
+        if not stale or stale.get("server") != self.server:
+            return None
+
+        try:
+            res = client.serial_query(stale["version"], stale["session_id"],
+                                      stale["serial"])
+        except RTRCacheReset:
+            logging.debug("RTR server {} can't provide the changes since "
+                          "serial {}".format(self.server, stale["serial"]))
+            return None
+        except RTRError as e:
+            # RFC 8210: start over with a Reset Query.
+            logging.warning("Error while fetching the changes since "
+                            "serial {} from the RTR server {}, the whole "
+                            "set of ROAs will be requested: {}".format(
+                                stale["serial"], self.server, str(e)
+                            ))
+            return None
+
+        vrps = set([tuple(roa[:4]) for roa in stale["roas"]])
+        vrps -= res.withdrawn
+        vrps |= res.announced
+
+        logging.info(
+            "RPKI ROAs updated via RTR from {} (serial {} -> {}): "
+            "{} announced, {} withdrawn".format(
+                self.server, stale["serial"], res.serial,
+                len(res.announced), len(res.withdrawn)
+            )
+        )
+        return res, vrps
+
+    def _get_data(self):
+        client = RTRClient(self.server)
+
+        incremental = self._get_incremental_data(client)
+        if incremental:
+            res, vrps = incremental
+        else:
+            res = client.reset_query()
+            vrps = res.announced
+            logging.info(
+                "RPKI ROAs loaded via RTR from {} (serial {})".format(
+                    self.server, res.serial
+                )
+            )
+
+        # Saved as metadata too, so that the SQLite cache backend
+        # keeps the expired ROAs.
+        self.http_meta = {
+            "rtr_session_id": res.session_id,
+            "rtr_serial": res.serial
+        }
+
+        return {
+            "server": self.server,
+            "version": res.version,
+            "session_id": res.session_id,
+            "serial": res.serial,
+            "roas": sorted([list(vrp) + [None] for vrp in vrps])
+        }
@@ -52,7 +52,7 @@ class MockedEnv(object):
 
     def do_mock_rttgetter(mocked_env):
 
-        def _mock_RTTGetter(self):
+        def _mock_RTTGetter(self, executor=None):
             rtts = {}
             for k in mocked_env.base_inst.RTT:
                 if k in mocked_env.base_inst.DATA:
@@ -84,13 +84,16 @@ class MockedEnv(object):
 
         def _mock_RSet_run_cmd(self, cmd):
             prefix_list = []
+            seen = set()
             for obj_name in self.object_names:
                 raw = mocked_env.load("irrdb_data",
                                       "rset_{}_ipv{}.json".format(obj_name,
                                                                   self.ip_ver),
                                       ret_type="json")
                 for prefix in raw["prefix_list"]:
-                    if prefix not in prefix_list:
+                    key = json.dumps(prefix, sort_keys=True)
+                    if key not in seen:
+                        seen.add(key)
                         prefix_list.append(prefix)
             return json.dumps({"prefix_list": prefix_list}).encode()
 
@@ -117,7 +120,7 @@ class MockedEnv(object):
                 })
             )
 
-        def _mock_ASSet(self):
+        def _mock_ASSet(self, executor=None):
             self.prepare()
             for as_set_bundle_id in self.builder.irrdb_info:
                 record = self.builder.irrdb_info[as_set_bundle_id]
@@ -129,7 +132,7 @@ class MockedEnv(object):
                 if asns:
                     record.save("asns", asns)
 
-        def _mock_RSet(self):
+        def _mock_RSet(self, executor=None):
             self.prepare()
             allow_longer_prefixes = self.builder.cfg_general["filtering"]["irrdb"]["allow_longer_prefixes"]
             for as_set_bundle_id in self.builder.irrdb_info:
@@ -194,11 +197,18 @@ class MockedEnv(object):
         ).start()
         mock_get_url_net.side_effect = get_url_net
 
+        # Cache is bypassed, prefetched data would be lost anyway.
+        mock_prefetch = mock.patch.object(
+            PeeringDBNet, "prefetch"
+        ).start()
+        mock_prefetch.return_value = None
+
     def do_mock_ripe_rpki_cache(mocked_env):
 
         def get_data(self):
-            return mocked_env.load("ripe-rpki-cache", "ripe-rpki-cache.json",
+            data = mocked_env.load("ripe-rpki-cache", "ripe-rpki-cache.json",
                                    ret_type="json")
+            return self._parse_roas(data["roas"])
 
         mock_get_data = mock.patch.object(
             RIPE_RPKI_ROAs, "_get_data", autospec=True
@@ -240,6 +250,7 @@ class MockedEnv(object):
 
           Mock the PeeringDBInfo._get_data_from_peeringdb() and
           PeeringDBNet._get_peeringdb_url() methods.
+          PeeringDBNet.prefetch() is disabled.
 
           It reads data from the <base_dir>/peeringdb_data/net_<ASN>.json
 
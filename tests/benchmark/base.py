@@ -0,0 +1,175 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from pierky.arouteserver.tests.base import ARouteServerTestCase
+
+from .data import BenchmarkData, DATA_VERSION
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+CLIENTS_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "real", "clients")
+
+BGP_SPEAKERS = {
+    "bird": "BIRD",
+    "openbgpd": "OpenBGPD"
+}
+
+class BenchmarkTestCase(ARouteServerTestCase):
+    __test__ = False
+
+    IXP = None
+    CLIENTS_FILE = None
+    IP_VER = None
+
+    BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+    # How much a metric can exceed the baseline before the result
+    # is considered a regression.
+    TOLERANCE = {
+        "wall_time": 0.25,
+        "peak_rss": 0.15,
+        "output_size": 0.05
+    }
+
+    @classmethod
+    def _setUpClass(cls):
+        if "BENCHMARK" not in os.environ:
+            raise unittest.SkipTest("BENCHMARK is not set")
+
+        cls.var_dir = os.path.join(BENCHMARK_DIR, "var")
+
+        cls.data_dir = os.path.join(cls.var_dir, "data")
+        if not os.path.exists(cls.data_dir):
+            os.makedirs(cls.data_dir)
+
+        cls.rs_config_dir = os.path.join(cls.var_dir, "configs")
+        if not os.path.exists(cls.rs_config_dir):
+            os.makedirs(cls.rs_config_dir)
+
+        # Data are generated once for all the IXPs.
+        BenchmarkData(cls.data_dir).generate(
+            sorted(glob.glob(os.path.join(CLIENTS_DIR, "*.yml")))
+        )
+
+    @classmethod
+    def _load_json(cls, path):
+        if not os.path.exists(path):
+            return {"data_version": DATA_VERSION, "results": {}}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    @classmethod
+    def _save_result(cls, path, name, res):
+        data = cls._load_json(path)
+        data["data_version"] = DATA_VERSION
+        data["results"][name] = res
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    def get_name(self, bgp_speaker, ip_ver):
+        return "{ixp}, {bgp_speaker}, {ip_ver}".format(
+            ixp=self.IXP,
+            bgp_speaker=BGP_SPEAKERS[bgp_speaker],
+            ip_ver="IPv{}".format(ip_ver) if ip_ver else "IPv4 & IPv6"
+        )
+
+    def build_config(self, bgp_speaker, ip_ver):
+        filename = "{ixp}_{bgp_speaker}{ip_ver}.conf".format(
+            ixp=self.IXP,
+            bgp_speaker=bgp_speaker,
+            ip_ver="_ipv{}".format(ip_ver) if ip_ver else ""
+        )
+
+        cmd = [sys.executable, "-m", "tests.benchmark.build"]
+        cmd += ["--data-dir", self.data_dir]
+        cmd += ["--clients", os.path.join(CLIENTS_DIR, self.CLIENTS_FILE)]
+        cmd += ["--output", os.path.join(self.rs_config_dir, filename)]
+        cmd += [bgp_speaker]
+        if ip_ver:
+            cmd += ["--ip-ver", str(ip_ver)]
+
+        out = subprocess.check_output(cmd, cwd=ROOT_DIR)
+        return json.loads(out.decode("utf-8"))
+
+    def compare_with_baseline(self, name, res):
+        if "BENCHMARK_UPDATE_BASELINE" in os.environ:
+            self._save_result(self.BASELINE_FILE, name, res)
+            return
+
+        baseline = self._load_json(self.BASELINE_FILE)
+        if baseline["data_version"] != DATA_VERSION:
+            self.fail("The baseline has been recorded using a different "
+                      "version of the data; please update it by running "
+                      "the benchmarks with BENCHMARK_UPDATE_BASELINE set.")
+
+        if name not in baseline["results"]:
+            self.info("No baseline for {}".format(name))
+            return
+
+        regressions = []
+        for metric in sorted(self.TOLERANCE):
+            expected = baseline["results"][name][metric]
+            value = res[metric]
+            self.info("  {}: {} (baseline {}, {:+.1f}%)".format(
+                metric, value, expected,
+                (value - expected) * 100.0 / expected
+            ))
+            if value > expected * (1 + self.TOLERANCE[metric]):
+                regressions.append(metric)
+
+        if regressions:
+            self.fail("Regression over the baseline: {}".format(
+                ", ".join(regressions)))
+
+    def run_benchmark(self, bgp_speaker, ip_ver):
+        if ip_ver and self.IP_VER and ip_ver != self.IP_VER:
+            self.skipTest("IPv{} only".format(self.IP_VER))
+
+        name = self.get_name(bgp_speaker, ip_ver)
+        res = self.build_config(bgp_speaker, ip_ver)
+
+        self.info("")
+        self.info("{}: {} seconds, peak RSS {:.1f} MiB, "
+                  "output {:.1f} MiB".format(
+                      name, res["wall_time"],
+                      res["peak_rss"] / 1024.0 / 1024.0,
+                      res["output_size"] / 1024.0 / 1024.0
+                  ))
+
+        self._save_result(os.path.join(self.var_dir, "last.json"), name, res)
+        self.compare_with_baseline(name, res)
+
+    def test_bird_4(self):
+        """BIRD, IPv4"""
+        self.run_benchmark("bird", 4)
+
+    def test_bird_6(self):
+        """BIRD, IPv6"""
+        self.run_benchmark("bird", 6)
+
+    def test_openbgpd(self):
+        """OpenBGPD, IPv4 & IPv6"""
+        self.run_benchmark("openbgpd", None)
+
+    def shortDescription(self):
+        return "Benchmark: {}, {}".format(self.IXP, self._testMethodDoc)
@@ -0,0 +1,112 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Build a configuration using the pre-recorded data and print its metrics.
+
+Executed by the benchmarks in a dedicated process, so that the peak
+memory usage is not affected by other builds:
+
+    python -m tests.benchmark.build --data-dir DIR --clients FILE \\
+        --output FILE bird --ip-ver 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pierky.arouteserver.build_stats import build_stats, BuildStats
+from pierky.arouteserver.builder import BIRDConfigBuilder, \
+                                        OpenBGPDConfigBuilder
+from pierky.arouteserver.tests.mocked_env import MockedEnv
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REAL_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "real")
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+TEMPLATES_DIR = os.path.join(ROOT_DIR, "templates")
+
+# Same RTT getter used by the tests in tests/real.
+RTT_GETTER_PATH = os.path.join(ROOT_DIR, "utils", "fake_rtt_getter.sh")
+
+BUILDERS = {
+    "bird": BIRDConfigBuilder,
+    "openbgpd": OpenBGPDConfigBuilder
+}
+
+def get_phase_seconds(name, **labels):
+    for hist in build_stats.to_dict()["histograms"].get(name, []):
+        if hist["labels"] == labels:
+            return round(hist["sum"], 3)
+    return None
+
+def build(data_dir, clients, output, bgp_speaker, ip_ver=None,
+          target_version=None):
+    MockedEnv(base_dir=data_dir, default=False, peering_db=True, irr=True,
+              ripe_rpki_cache=True, arin_db_dump=True)
+
+    cache_dir = tempfile.mkdtemp(suffix="arouteserver_benchmark")
+    try:
+        build_stats.reset()
+
+        start_time = time.time()
+        builder = BUILDERS[bgp_speaker](
+            template_dir=os.path.join(TEMPLATES_DIR, bgp_speaker),
+            template_name="main.j2",
+            cache_dir=cache_dir,
+            cfg_general=os.path.join(REAL_DIR, "general.yml"),
+            cfg_bogons=os.path.join(REAL_DIR, "bogons.yml"),
+            cfg_clients=clients,
+            rtt_getter_path=RTT_GETTER_PATH,
+            ip_ver=ip_ver,
+            target_version=target_version,
+            ignore_errors=["*"]
+        )
+        with open(output, "w") as f:
+            builder.render_template(output_file=f)
+        wall_time = time.time() - start_time
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        "wall_time": round(wall_time, 3),
+        "enrichment_time": get_phase_seconds("build_phase_seconds",
+                                             phase="enrichment"),
+        "peak_rss": BuildStats.get_peak_rss()["self"],
+        "output_size": os.path.getsize(output)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--clients", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("bgp_speaker", choices=sorted(BUILDERS))
+    parser.add_argument("--ip-ver", type=int, choices=[4, 6])
+    parser.add_argument("--target-version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    res = build(args.data_dir, args.clients, args.output, args.bgp_speaker,
+                ip_ver=args.ip_ver, target_version=args.target_version)
+    sys.stdout.write(json.dumps(res))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Pre-recorded external data used by the benchmarks.
+
+IRRDB, PeeringDB, RPKI ROAs and ARIN Whois DB data are synthetic, of
+realistic size, and are generated from fixed seeds, so that they are
+always the same for the same DATA_VERSION: ASNs originate from a
+handful to thousands of prefixes, AS-SETs range from a few members to
+bundles of 100k prefixes, and ROAs make up a full VRP set (~450k).
+
+Data are saved in the layout expected by MockedEnv (irrdb_data/,
+peeringdb_data/, ripe-rpki-cache/, arin_whois_db/), so that they are
+read from disk, parsed and processed by the same code that handles
+the real ones.
+"""
+
+import json
+import os
+import random
+import zlib
+
+import yaml
+
+# To be bumped every time the generated data change: the stored
+# baseline is then no longer comparable.
+DATA_VERSION = 1
+
+# ASNs that originate prefixes and can be members of AS-SETs.
+ASN_UNIVERSE = 70000
+
+MAX_PREFIXES_PER_ASN = 5000
+MAX_PREFIXES_PER_AS_SET = 100000
+MAX_MEMBERS_PER_AS_SET = 20000
+
+ROA_COVERAGE = 0.6
+
+TRUST_ANCHORS = (
+    ("RIPE NCC RPKI Root", 40),
+    ("APNIC RPKI Root", 20),
+    ("ARIN", 25),
+    ("LACNIC RPKI Root", 10),
+    ("AfriNIC RPKI Root", 5),
+)
+
+# First octets of the IPv4 prefixes: private, loopback, link-local,
+# shared and documentation networks are left out.
+IPV4_FIRST_OCTETS = [
+    i for i in range(1, 224) if i not in (10, 100, 127, 169, 172, 192, 198)
+]
+
+def _get_rng(*seeds):
+    return random.Random(zlib.crc32(
+        "-".join([str(seed) for seed in seeds]).encode("utf-8")
+    ))
+
+def _heavy_tailed(rng, scale, alpha, max_value):
+    return min(int(scale * rng.paretovariate(alpha)), max_value)
+
+class BenchmarkData(object):
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+        # { (<asn>, <ip_ver>): [<prefix>, ...] }
+        self.prefixes = {}
+
+    def get_prefixes(self, asn, ip_ver):
+        """Return the prefixes originated by asn (IPv4 or IPv6)."""
+        key = (asn, ip_ver)
+        if key in self.prefixes:
+            return self.prefixes[key]
+
+        rng = _get_rng("prefixes", asn, ip_ver)
+        res = []
+        if ip_ver == 4:
+            cnt = _heavy_tailed(rng, 2, 1.2, MAX_PREFIXES_PER_ASN) - 1
+            for _ in range(cnt):
+                length = rng.choice((16, 19, 20, 21, 22, 22, 23, 24, 24, 24))
+                net = (rng.choice(IPV4_FIRST_OCTETS) << 24) | \
+                    rng.getrandbits(24)
+                net = net >> (32 - length) << (32 - length)
+                res.append("{}.{}.{}.{}/{}".format(
+                    net >> 24, (net >> 16) & 255, (net >> 8) & 255,
+                    net & 255, length
+                ))
+        else:
+            cnt = _heavy_tailed(rng, 1, 1.3, MAX_PREFIXES_PER_ASN // 4) - 1
+            for _ in range(cnt):
+                length = rng.choice((32, 36, 40, 44, 48, 48, 48))
+                net = (0x2a00 << 16 | rng.getrandbits(16)) << 32 | \
+                    rng.getrandbits(32)
+                net = net >> (64 - length) << (64 - length)
+                res.append("{:x}:{:x}:{:x}:{:x}::/{}".format(
+                    net >> 48, (net >> 32) & 0xffff, (net >> 16) & 0xffff,
+                    net & 0xffff, length
+                ))
+
+        res = sorted(set(res))
+        self.prefixes[key] = res
+        return res
+
+    def get_as_set_members(self, name):
+        """Return the ASNs that are members of the AS-SET 'name'.
+
+        Members are added until the AS-SET reaches
+        MAX_PREFIXES_PER_AS_SET prefixes.
+        """
+        rng = _get_rng("as-set", name)
+        cnt = _heavy_tailed(rng, 1, 0.5, MAX_MEMBERS_PER_AS_SET)
+        res = []
+        tot_prefixes = 0
+        while len(res) < cnt and tot_prefixes < MAX_PREFIXES_PER_AS_SET:
+            asn = rng.randint(1, ASN_UNIVERSE)
+            res.append(asn)
+            tot_prefixes += len(self.get_prefixes(asn, 4)) + \
+                len(self.get_prefixes(asn, 6))
+        return sorted(set(res))
+
+    def get_peeringdb_as_set(self, asn):
+        """Return the AS-SET that the network has on PeeringDB."""
+        rng = _get_rng("peeringdb", asn)
+        if rng.random() < 0.7:
+            return "AS-SYNTH{}".format(asn)
+        return None
+
+    def get_roas(self):
+        rng = _get_rng("roas")
+        tas = []
+        for ta, weight in TRUST_ANCHORS:
+            tas.extend([ta] * weight)
+
+        res = []
+        for asn in range(1, ASN_UNIVERSE + 1):
+            for ip_ver in (4, 6):
+                for prefix in self.get_prefixes(asn, ip_ver):
+                    if rng.random() > ROA_COVERAGE:
+                        continue
+                    length = int(prefix.split("/")[1])
+                    max_length = 24 if ip_ver == 4 else 48
+                    res.append({
+                        "asn": "AS{}".format(asn),
+                        "prefix": prefix,
+                        "maxLength": rng.choice(
+                            (length, length, length, max(length, max_length))
+                        ),
+                        "ta": rng.choice(tas)
+                    })
+        return res
+
+    def get_arin_whois_records(self):
+        rng = _get_rng("arin")
+        res = {"v4": [], "v6": []}
+        for asn in range(1, ASN_UNIVERSE + 1):
+            if rng.random() > 0.2:
+                continue
+            for ip_ver in (4, 6):
+                for prefix in self.get_prefixes(asn, ip_ver):
+                    res["v{}".format(ip_ver)].append({
+                        "originas": "AS{}".format(asn),
+                        "prefix": prefix
+                    })
+        return res
+
+    def _write(self, subdir, filename, data):
+        dir_path = os.path.join(self.data_dir, subdir)
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        with open(os.path.join(dir_path, filename), "w") as f:
+            json.dump(data, f)
+
+    def _write_irrdb_object(self, name, asns):
+        self._write("irrdb_data", "asset_{}.json".format(name),
+                    {"asn_list": asns})
+        for ip_ver in (4, 6):
+            prefixes = []
+            for asn in asns:
+                prefixes.extend(self.get_prefixes(asn, ip_ver))
+            self._write(
+                "irrdb_data", "rset_{}_ipv{}.json".format(name, ip_ver),
+                {"prefix_list": [{"prefix": prefix, "exact": True}
+                                 for prefix in sorted(set(prefixes))]}
+            )
+
+    def _write_clients_data(self, clients_file_path):
+        with open(clients_file_path, "r") as f:
+            clients = yaml.safe_load(f)["clients"]
+
+        as_sets = set()
+        for client in clients:
+            asn = client["asn"]
+
+            self._write_irrdb_object("AS{}".format(asn), [asn])
+
+            pdb_as_set = self.get_peeringdb_as_set(asn)
+            if pdb_as_set:
+                as_sets.add(pdb_as_set)
+
+            self._write("peeringdb_data", "net_{}.json".format(asn), {
+                "data": [{
+                    "asn": asn,
+                    "irr_as_set": pdb_as_set or "",
+                    "info_prefixes4": len(self.get_prefixes(asn, 4)) * 2,
+                    "info_prefixes6": len(self.get_prefixes(asn, 6)) * 2,
+                }]
+            })
+
+            # AS-SETs names are upper-cased by ARouteServer when it
+            # looks for their data.
+            cfg = client.get("cfg", {})
+            as_sets.update([
+                name.upper() for name in
+                cfg.get("filtering", {}).get("irrdb", {}).get("as_sets", [])
+            ])
+
+        for name in as_sets:
+            self._write_irrdb_object(name, self.get_as_set_members(name))
+
+    def _is_up_to_date(self):
+        path = os.path.join(self.data_dir, "version")
+        if not os.path.exists(path):
+            return False
+        with open(path, "r") as f:
+            return f.read().strip() == str(DATA_VERSION)
+
+    def generate(self, clients_files):
+        """Generate the data needed to build the given clients files.
+
+        Nothing is done if data have already been generated for the
+        current DATA_VERSION.
+        """
+        if self._is_up_to_date():
+            return
+
+        for clients_file_path in clients_files:
+            self._write_clients_data(clients_file_path)
+
+        self._write("ripe-rpki-cache", "ripe-rpki-cache.json",
+                    {"roas": self.get_roas()})
+
+        self._write("arin_whois_db", "dump.json", {
+            "json_schema": "0.1.0",
+            "source": "ARIN-WHOIS",
+            "whois_records": self.get_arin_whois_records()
+        })
+
+        with open(os.path.join(self.data_dir, "version"), "w") as f:
+            f.write(str(DATA_VERSION))
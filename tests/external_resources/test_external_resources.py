@@ -77,7 +77,7 @@ class TestExternalResources(unittest.TestCase):
         rpki_roas = RIPE_RPKI_ROAs(ripe_rpki_validator_url=urls, **cache_cfg)
         rpki_roas.load_data()
         self.assertTrue(len(rpki_roas.roas) > 0)
-        self.assertTrue(any([r for r in rpki_roas.roas["roas"] if r["prefix"] == "193.0.0.0/21"]))
+        self.assertTrue(any([r for r in rpki_roas.roas if r[1] == "193.0.0.0/21"]))
 
     def test_asset(self):
         """External resources: ASNs from AS-SET via bgpq3"""
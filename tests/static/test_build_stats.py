@@ -0,0 +1,128 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pierky.arouteserver.build_stats import BuildStats
+
+
+class TestBuildStats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = BuildStats()
+        self.stats.observe("task_seconds", 0.003, enricher="A")
+        self.stats.observe("task_seconds", 0.2, enricher="A")
+        self.stats.observe("task_seconds", 1000, enricher="A")
+        self.stats.observe("task_seconds", 2, enricher="B")
+        self.stats.incr("cache_lookups_total", object_type="X", result="hit")
+        self.stats.incr("cache_lookups_total", object_type="X", result="hit")
+        self.stats.incr("downloaded_bytes_total", 100)
+
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_010_dict(self):
+        """Build stats: histograms and counters"""
+        res = self.stats.to_dict()
+
+        hist = res["histograms"]["task_seconds"]
+        self.assertEqual([h["labels"] for h in hist],
+                         [{"enricher": "A"}, {"enricher": "B"}])
+        self.assertEqual(hist[0]["count"], 3)
+        self.assertAlmostEqual(hist[0]["sum"], 1000.203)
+        self.assertEqual(hist[0]["min"], 0.003)
+        self.assertEqual(hist[0]["max"], 1000)
+        self.assertEqual(hist[0]["buckets"]["0.005"], 1)
+        self.assertEqual(hist[0]["buckets"]["0.25"], 1)
+        self.assertEqual(sum(hist[0]["buckets"].values()), 2)
+
+        self.assertEqual(
+            res["counters"],
+            {
+                "cache_lookups_total": [
+                    {"labels": {"object_type": "X", "result": "hit"},
+                     "value": 2}
+                ],
+                "downloaded_bytes_total": [
+                    {"labels": {}, "value": 100}
+                ]
+            }
+        )
+
+    def test_020_prometheus(self):
+        """Build stats: Prometheus text format"""
+        lines = self.stats.to_prometheus().split("\n")
+
+        for line in (
+            "# TYPE arouteserver_task_seconds histogram",
+            'arouteserver_task_seconds_bucket{enricher="A",le="0.005"} 1',
+            'arouteserver_task_seconds_bucket{enricher="A",le="0.25"} 2',
+            'arouteserver_task_seconds_bucket{enricher="A",le="300"} 2',
+            'arouteserver_task_seconds_bucket{enricher="A",le="+Inf"} 3',
+            'arouteserver_task_seconds_count{enricher="A"} 3',
+            'arouteserver_task_seconds_count{enricher="B"} 1',
+            "# TYPE arouteserver_cache_lookups_total counter",
+            'arouteserver_cache_lookups_total{object_type="X",result="hit"} 2',
+            "arouteserver_downloaded_bytes_total 100",
+        ):
+            self.assertIn(line, lines)
+
+        self.assertEqual(
+            len([l for l in lines if l.startswith("# TYPE") and
+                 "task_seconds" in l]),
+            1
+        )
+
+    def test_030_merge(self):
+        """Build stats: merge"""
+        other = BuildStats()
+        other.observe("task_seconds", 0.001, enricher="A")
+        other.observe("task_seconds", 1, enricher="C")
+        other.incr("downloaded_bytes_total", 50)
+
+        self.stats.merge(other.export())
+        res = self.stats.to_dict()
+
+        hist = res["histograms"]["task_seconds"]
+        self.assertEqual(len(hist), 3)
+        self.assertEqual(hist[0]["count"], 4)
+        self.assertEqual(hist[0]["min"], 0.001)
+        self.assertEqual(hist[0]["buckets"]["0.005"], 2)
+        self.assertEqual(hist[2]["labels"], {"enricher": "C"})
+        self.assertEqual(res["counters"]["downloaded_bytes_total"][0]["value"],
+                         150)
+
+    def test_040_save(self):
+        """Build stats: save"""
+        path = os.path.join(self.temp_dir, "stats.json")
+        self.stats.save(path)
+        with open(path, "r") as f:
+            res = json.load(f)
+        self.assertEqual(res["histograms"]["task_seconds"][0]["count"], 3)
+
+        path = os.path.join(self.temp_dir, "stats.prom")
+        self.stats.save(path, "prometheus")
+        with open(path, "r") as f:
+            self.assertIn("arouteserver_downloaded_bytes_total 100\n",
+                          f.read())
+
+        self.stats.reset()
+        self.assertEqual(self.stats.to_dict()["histograms"], {})
@@ -0,0 +1,248 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pierky.arouteserver.build_stats import build_stats
+from pierky.arouteserver.cached_objects import CachedObject, \
+                                               JSONCacheSerializer, \
+                                               MsgPackCacheSerializer, \
+                                               SQLiteCache, \
+                                               msgpack
+from pierky.arouteserver.errors import ExternalDataNoInfoError
+
+
+DATA = {
+    "roas": [
+        {"asn": "AS64496", "prefix": "192.0.2.0/24", "maxLength": 24,
+         "ta": "RIPE NCC RPKI Root"},
+        {"asn": "AS64497", "prefix": "2001:db8::/32", "maxLength": 48,
+         "ta": "APNIC RPKI Root"},
+    ],
+    "none": None,
+    "float": 1.5,
+    "bool": True
+}
+
+class FakeCachedObject(CachedObject):
+
+    def __init__(self, data, *args, **kwargs):
+        CachedObject.__init__(self, *args, **kwargs)
+        self.data = data
+        self.get_data_cnt = 0
+
+    def _get_object_filename(self):
+        return "fake.json"
+
+    def _get_data(self):
+        self.get_data_cnt += 1
+        if self.data is None:
+            raise ExternalDataNoInfoError()
+        return self.data
+
+class TestCachedObject_JSON(unittest.TestCase):
+
+    CACHE_SERIALIZER = JSONCacheSerializer
+    CACHE_BACKEND = "files"
+    FILENAME = "fake.json"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_obj(self, data=DATA, cache_expiry=10, load=True):
+        obj = FakeCachedObject(data, cache_dir=self.temp_dir,
+                               cache_expiry=cache_expiry,
+                               cache_backend=self.CACHE_BACKEND)
+        obj.CACHE_SERIALIZER = self.CACHE_SERIALIZER
+        if load:
+            obj.load_data()
+        return obj
+
+    def test_010_save_load(self):
+        """Cached objects: save and load"""
+        obj = self.get_obj()
+        self.assertFalse(obj.from_cache)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.temp_dir, self.FILENAME))
+        )
+
+        obj = self.get_obj()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.get_data_cnt, 0)
+        self.assertEqual(obj.raw_data, DATA)
+
+    def test_020_expired(self):
+        """Cached objects: expired"""
+        build_stats.reset()
+
+        self.get_obj(cache_expiry=1)
+        self.get_obj(cache_expiry=1)
+        time.sleep(2)
+
+        obj = self.get_obj(cache_expiry=1)
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.get_data_cnt, 1)
+
+        lookups = build_stats.to_dict()["counters"]["cache_lookups_total"]
+        self.assertEqual(
+            dict((lookup["labels"]["result"], lookup["value"])
+                 for lookup in lookups),
+            {"miss": 1, "hit": 1, "expired": 1}
+        )
+
+    def test_030_missing_info(self):
+        """Cached objects: missing info"""
+        with self.assertRaises(ExternalDataNoInfoError):
+            self.get_obj(data=None)
+
+        obj = self.get_obj(load=False)
+        with self.assertRaises(ExternalDataNoInfoError):
+            obj.load_data()
+        self.assertEqual(obj.get_data_cnt, 0)
+
+    def write_invalid_data(self):
+        with open(os.path.join(self.temp_dir, self.FILENAME), "w") as f:
+            f.write("")
+
+    def test_040_invalid_file(self):
+        """Cached objects: invalid file"""
+        self.write_invalid_data()
+
+        obj = self.get_obj()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, DATA)
+
+@unittest.skipIf(msgpack is None, "msgpack not available")
+class TestCachedObject_MsgPack(TestCachedObject_JSON):
+
+    CACHE_SERIALIZER = MsgPackCacheSerializer
+    FILENAME = "fake.msgpack"
+
+    def test_050_expired_not_decoded(self):
+        """Cached objects: expired data is not decoded"""
+        self.get_obj()
+
+        # Data corrupted, but only the header is read.
+        path = os.path.join(self.temp_dir, self.FILENAME)
+        with open(path, "rb") as f:
+            header = f.read(MsgPackCacheSerializer.HEADER.size)
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(b"\xc1")
+
+        obj = self.get_obj(cache_expiry=-1, load=False)
+        self.assertFalse(obj.load_data_from_cache())
+
+    def test_060_truncated_file(self):
+        """Cached objects: truncated file is a cache miss"""
+        path = os.path.join(self.temp_dir, self.FILENAME)
+        with open(path, "wb") as f:
+            f.write(MsgPackCacheSerializer.MAGIC)
+
+        with open(path, "rb") as f:
+            self.assertEqual(MsgPackCacheSerializer.load(f),
+                             (None, None, None))
+
+        with open(path, "wb"):
+            pass
+
+        with open(path, "rb") as f:
+            self.assertEqual(MsgPackCacheSerializer.load(f),
+                             (None, None, None))
+
+    @unittest.skipIf(not os.path.isfile("/proc/self/maps"),
+                     "/proc/self/maps not available")
+    def test_070_mapping_closed(self):
+        """Cached objects: mapping closed once data is decoded"""
+        self.get_obj()
+
+        path = os.path.join(self.temp_dir, self.FILENAME)
+
+        def is_mapped():
+            with open("/proc/self/maps") as f:
+                return any(line.rstrip().endswith(path) for line in f)
+
+        with open(path, "rb") as f:
+            _, get_data, _ = MsgPackCacheSerializer.load(f)
+        self.assertTrue(is_mapped())
+
+        self.assertEqual(get_data(), DATA)
+        self.assertFalse(is_mapped())
+        self.assertEqual(get_data(), DATA)
+
+class TestCachedObject_SQLite(TestCachedObject_JSON):
+
+    CACHE_BACKEND = "sqlite"
+    FILENAME = SQLiteCache.FILENAME
+
+    def write_invalid_data(self):
+        SQLiteCache.get(self.temp_dir).save(
+            "FakeCachedObject", "fake.json", int(time.time()),
+            int(time.time()) + 10, "json", "{"
+        )
+
+    def test_060_purge_expired(self):
+        """Cached objects: purge expired objects"""
+        self.get_obj(cache_expiry=1)
+        obj = self.get_obj(data=[1], cache_expiry=100, load=False)
+        obj._get_object_filename = lambda: "fake2.json"
+        obj.load_data()
+
+        cache = SQLiteCache.get(self.temp_dir)
+        self.assertEqual(cache.count_expired(), 0)
+
+        time.sleep(2)
+
+        self.assertEqual(cache.count_expired(), 1)
+        self.assertEqual(cache.purge_expired(), 1)
+        self.assertEqual(cache.count_expired(), 0)
+
+    def test_070_threads(self):
+        """Cached objects: concurrent threads"""
+        errors = []
+
+        def save_and_load(i):
+            try:
+                obj = FakeCachedObject([i], cache_dir=self.temp_dir,
+                                       cache_backend=self.CACHE_BACKEND)
+                obj._get_object_filename = lambda: "fake_{}.json".format(i)
+                obj.load_data()
+                obj.raw_data = None
+                self.assertTrue(obj.load_data_from_cache())
+                self.assertEqual(obj.raw_data, [i])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save_and_load, args=(i,))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+
+@unittest.skipIf(msgpack is None, "msgpack not available")
+class TestCachedObject_SQLite_MsgPack(TestCachedObject_SQLite):
+
+    CACHE_SERIALIZER = MsgPackCacheSerializer
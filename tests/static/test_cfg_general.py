@@ -236,7 +236,7 @@ class TestConfigParserGeneral(TestConfigParserBase):
     def test_use_rpki_roas_source(self):
         """{}: rpki_roas.source"""
         self.assertEqual(self.cfg["rpki_roas"]["source"], "ripe-rpki-validator-cache")
-        self._test_option(self.cfg["rpki_roas"], "source", ("ripe-rpki-validator-cache","rtrlib"))
+        self._test_option(self.cfg["rpki_roas"], "source", ("ripe-rpki-validator-cache","rtrlib","rtr"))
         self._test_mandatory(self.cfg["rpki_roas"], "source", has_default=True)
 
     def use_arin_whois_db_dump_enabled(self):
@@ -1122,6 +1122,7 @@ class TestConfigParserGeneral(TestConfigParserBase):
                     "https://rpki-validator.ripe.net/api/export.json",
                     "https://rpki.gin.ntt.net/api/export.json"
                 ],
+                "rtr_server": "127.0.0.1:3323",
                 "allowed_trust_anchors": [
                     "APNIC RPKI Root",
                     "AfriNIC RPKI Root",
@@ -1233,6 +1234,7 @@ class TestConfigParserGeneral(TestConfigParserBase):
                     "https://rpki-validator.ripe.net/api/export.json",
                     "https://rpki.gin.ntt.net/api/export.json"
                 ],
+                "rtr_server": "127.0.0.1:3323",
                 "allowed_trust_anchors": [
                     "APNIC RPKI Root",
                     "AfriNIC RPKI Root",
@@ -61,6 +61,10 @@ class TestProgramConfig(unittest.TestCase):
             ("bgpq3_host", "rr.ntt.net"),
             ("bgpq3_sources", ("RIPE,APNIC,AFRINIC,ARIN,NTTCOM,ALTDB,BBOI,"
                                "BELL,JPIRR,LEVEL3,RADB,RGNET,SAVVIS,TC")),
+            ("cache_backend", "files"),
+            ("irrdb_client", "bgpq3"),
+            ("irrdb_whois_connections", 16),
+            ("irrdb_memory_cache_size", 256),
             ("rtt_getter_path", ""),
             ("threads", 4),
             ("cache_expiry",
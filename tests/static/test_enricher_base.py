@@ -0,0 +1,237 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import six
+import threading
+import time
+import unittest
+
+from pierky.arouteserver.enrichers.base import BaseConfigEnricher, \
+                                              BaseConfigEnricherTaskHandler, \
+                                              run_enrichers
+from pierky.arouteserver.errors import ARouteServerError, BuilderError
+
+
+class FakeEnricher(BaseConfigEnricher):
+
+    DESCR = None
+    FAIL = False
+    DURATION = 0.1
+
+    def enrich(self, executor=None):
+        with self.builder["lock"]:
+            self.builder["started"].append(self.DESCR)
+            self.builder["running"].add(self.DESCR)
+            self.builder["max_running"] = max(self.builder["max_running"],
+                                              len(self.builder["running"]))
+        time.sleep(self.DURATION)
+        with self.builder["lock"]:
+            self.builder["running"].remove(self.DESCR)
+            self.builder["completed"].append(self.DESCR)
+        if self.FAIL is True:
+            raise ARouteServerError("{} failed".format(self.DESCR))
+        if self.FAIL:
+            raise self.FAIL
+
+class A(FakeEnricher):
+    DESCR = "A"
+
+class B(FakeEnricher):
+    DESCR = "B"
+    DEPENDS_ON = (A,)
+
+class C(FakeEnricher):
+    DESCR = "C"
+    DEPENDS_ON = (A,)
+
+class D(FakeEnricher):
+    DESCR = "D"
+    DEPENDS_ON = (B,)
+
+class E(FakeEnricher):
+    DESCR = "E"
+
+class TestEnricherScheduler(unittest.TestCase):
+
+    def run_enrichers(self, enricher_classes):
+        self.status = {
+            "lock": threading.Lock(),
+            "started": [],
+            "completed": [],
+            "running": set(),
+            "max_running": 0
+        }
+        return run_enrichers(self.status, enricher_classes, 1)
+
+    def test_010_dependencies(self):
+        """Enrichers scheduler: dependencies"""
+        self.assertTrue(self.run_enrichers([A, B, C, D, E]))
+
+        started = self.status["started"]
+        completed = self.status["completed"]
+        self.assertEqual(sorted(completed), ["A", "B", "C", "D", "E"])
+        for enricher, dep in (("B", "A"), ("C", "A"), ("D", "B")):
+            self.assertLess(completed.index(dep), started.index(enricher))
+
+        # A and E, then B and C.
+        self.assertGreaterEqual(self.status["max_running"], 2)
+
+    def test_020_unused_dependencies(self):
+        """Enrichers scheduler: dependencies not used"""
+        self.assertTrue(self.run_enrichers([D, C]))
+        self.assertEqual(sorted(self.status["completed"]), ["C", "D"])
+        self.assertEqual(self.status["max_running"], 2)
+
+    def test_030_subclass_dependencies(self):
+        """Enrichers scheduler: dependencies on subclasses"""
+        class A1(A):
+            DESCR = "A1"
+
+        self.assertTrue(self.run_enrichers([B, A1]))
+        self.assertEqual(self.status["completed"], ["A1", "B"])
+
+    def test_040_failure(self):
+        """Enrichers scheduler: dependents of failed enrichers"""
+        class FailingA(A):
+            FAIL = True
+
+        self.assertFalse(self.run_enrichers([FailingA, B, C, D, E]))
+        self.assertEqual(sorted(self.status["completed"]), ["A", "E"])
+
+    def test_050_exception(self):
+        """Enrichers scheduler: unhandled exceptions"""
+        class FailingA(A):
+            FAIL = ValueError("unhandled")
+
+        class SlowE(E):
+            DURATION = 0.3
+
+        with six.assertRaisesRegex(self, ValueError, "unhandled"):
+            self.run_enrichers([FailingA, B, SlowE])
+
+        # Running enrichers are completed before raising.
+        self.assertEqual(sorted(self.status["completed"]), ["A", "E"])
+
+class Worker(BaseConfigEnricherTaskHandler):
+
+    DESCR = "Test worker"
+
+    def do_task(self, task):
+        with self.status["lock"]:
+            self.status["running"] += 1
+            self.status["max_running"] = max(self.status["max_running"],
+                                             self.status["running"])
+        try:
+            time.sleep(0.01)
+            if task == self.status.get("error_on"):
+                raise ARouteServerError("error on {}".format(task))
+            if task == self.status.get("fatal_error_on"):
+                raise ValueError("fatal error on {}".format(task))
+            return task * 2
+        finally:
+            with self.status["lock"]:
+                self.status["running"] -= 1
+
+    def save_data(self, task, data):
+        self.status["results"][task] = data
+
+class TasksEnricher(BaseConfigEnricher):
+
+    WORKER_THREAD_CLASS = Worker
+
+    def _config_thread(self, thread):
+        thread.status = self.builder
+
+    def get_tasks(self):
+        for task in range(1, self.builder["tasks"] + 1):
+            # Tasks are generated while the first ones are running.
+            self.builder["max_in_flight"] = max(
+                self.builder["max_in_flight"],
+                task - 1 - len(self.builder["results"])
+            )
+            yield task
+
+class TestEnricherExecutor(unittest.TestCase):
+
+    def enrich(self, tasks, threads, **kwargs):
+        self.status = {
+            "lock": threading.Lock(),
+            "tasks": tasks,
+            "results": {},
+            "running": 0,
+            "max_running": 0,
+            "max_in_flight": 0
+        }
+        self.status.update(kwargs)
+        TasksEnricher(self.status, threads).enrich()
+
+    def test_010_results(self):
+        """Enrichers executor: results"""
+        self.enrich(50, 4)
+        self.assertEqual(self.status["results"],
+                         dict((task, task * 2) for task in range(1, 51)))
+        self.assertGreater(self.status["max_running"], 1)
+        self.assertLessEqual(self.status["max_running"], 4)
+
+        # Tasks are submitted only up to the max number of in-flight ones.
+        self.assertLessEqual(
+            self.status["max_in_flight"],
+            4 * TasksEnricher.MAX_IN_FLIGHT_TASKS_PER_THREAD
+        )
+
+    def test_020_no_tasks(self):
+        """Enrichers executor: no tasks"""
+        self.enrich(0, 4)
+        self.assertEqual(self.status["results"], {})
+
+    def test_030_errors(self):
+        """Enrichers executor: errors"""
+        with self.assertRaises(BuilderError):
+            self.enrich(50, 4, error_on=10)
+
+        # Errors don't stop the other tasks.
+        self.assertEqual(len(self.status["results"]), 49)
+        self.assertNotIn(10, self.status["results"])
+
+    def test_040_fatal_errors(self):
+        """Enrichers executor: fatal errors"""
+        with self.assertRaises(BuilderError):
+            self.enrich(50, 4, fatal_error_on=10)
+
+        # Pending tasks are cancelled.
+        self.assertLess(len(self.status["results"]), 20)
+        self.assertEqual(self.status["running"], 0)
+
+    def test_050_shared_executor(self):
+        """Enrichers executor: threads shared among enrichers"""
+        class TasksEnricher2(TasksEnricher):
+            pass
+
+        self.status = {
+            "lock": threading.Lock(),
+            "tasks": 50,
+            "results": {},
+            "running": 0,
+            "max_running": 0,
+            "max_in_flight": 0
+        }
+        self.assertTrue(
+            run_enrichers(self.status, [TasksEnricher, TasksEnricher2], 2)
+        )
+        self.assertEqual(len(self.status["results"]), 50)
+
+        # Enrichers running at the same time don't exceed the
+        # configured number of threads.
+        self.assertEqual(self.status["max_running"], 2)
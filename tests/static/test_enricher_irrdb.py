@@ -13,14 +13,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import binascii
 import copy
 import os
+import pickle
 import shutil
+import six
 import tempfile
+import time
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
 import unittest
 import yaml
 
 from pierky.arouteserver.builder import TemplateContextDumper
+from pierky.arouteserver.enrichers import irrdb
+from pierky.arouteserver.enrichers.irrdb import IRRDB, IRRDBBuildManifest
+from pierky.arouteserver.errors import BuilderError
+from pierky.arouteserver.ipaddresses import ip_ntop, ip_pton
 from pierky.arouteserver.tests.mocked_env import MockedEnv
 
 class TestIRRDBEnricher_Base(unittest.TestCase):
@@ -81,13 +93,34 @@ class TestIRRDBEnricher_Base(unittest.TestCase):
                 return client
         return None
 
+    @staticmethod
+    def expand_prefix(entry):
+        # Entries that have been aggregated (for example 10.0.0.0/7
+        # with ge = 8) are expanded to the prefixes of length 'ge'
+        # that they cover (10.0.0.0/8, 11.0.0.0/8).
+        if entry["exact"] or not entry["ge"]:
+            return [entry]
+        packed = ip_pton(entry["prefix"])
+        net = int(binascii.hexlify(packed), 16)
+        bits = len(packed) * 8
+        res = []
+        for i in range(2 ** (entry["ge"] - entry["length"])):
+            sub_net = net + (i << (bits - entry["ge"]))
+            res.append({
+                "prefix": ip_ntop(binascii.unhexlify(
+                    "{:0{}x}".format(sub_net, bits // 4))),
+                "length": entry["ge"]
+            })
+        return res
+
     def get_client_info(self, client):
         asns = []
         prefixes = []
         for bundle_id in client["cfg"]["filtering"]["irrdb"]["as_set_bundle_ids"]:
             bundle = self.builder.data["irrdb_info"][bundle_id]
             asns.extend(bundle.asns)
-            prefixes.extend(bundle.prefixes)
+            for prefix in bundle.prefixes:
+                prefixes.extend(self.expand_prefix(prefix))
         return sorted(asns), ["{}/{}".format(_["prefix"], _["length"])
                               for _ in sorted(prefixes,
                                               key=lambda item: item["prefix"])]
@@ -278,3 +311,210 @@ class TestIRRDBEnricher_Base(unittest.TestCase):
             self.get_client_info(self.get_client_by_id("AS3_2")),
             ([3, 300], [])
         )
+
+    def test_030_build_manifest(self, *patches):
+        """IRRDB enricher: build manifest"""
+        clients = copy.deepcopy(self.CLIENTS_SIMPLE)
+        clients["clients"][0]["cfg"] = {"filtering": {"irrdb": {"as_sets": ["AS-ONE"]}}}
+
+        self.setup_builder(self.GENERAL_SIMPLE, clients)
+
+        manifest = IRRDBBuildManifest(self.temp_dir)
+        manifest.load()
+
+        self.assertEqual(len(manifest.bundles), 3)
+        for bundle_id in self.builder.irrdb_info:
+            # One fingerprint for ASNs and one for prefixes.
+            self.assertEqual(len(manifest.bundles[bundle_id]), 2)
+
+        # Bundles are known only for the same address family.
+        self.setup_builder(self.GENERAL_SIMPLE, clients, ip_ver=6)
+
+        manifest.load()
+        for bundle_id in self.builder.irrdb_info:
+            self.assertEqual(len(manifest.bundles[bundle_id]), 4)
+
+    def test_031_build_manifest_old(self, *patches):
+        """IRRDB enricher: build manifest, old entries removed"""
+        manifest = IRRDBBuildManifest(self.temp_dir)
+        old_ts = int(time.time()) - IRRDBBuildManifest.MAX_AGE - 1
+        manifest.bundles = {
+            "removed": {"fingerprint": old_ts},
+            "recent": {"fingerprint": int(time.time()) - 60}
+        }
+        manifest.save()
+
+        self.setup_builder(self.GENERAL_SIMPLE, self.CLIENTS_SIMPLE)
+
+        manifest.load()
+        self.assertNotIn("removed", manifest.bundles)
+        self.assertIn("recent", manifest.bundles)
+        for bundle_id in self.builder.irrdb_info:
+            self.assertEqual(len(manifest.bundles[bundle_id]), 2)
+
+    def test_032_build_manifest_max_age(self, *patches):
+        """IRRDB enricher: build manifest, data reused up to max age"""
+        manifest = IRRDBBuildManifest(self.temp_dir)
+        old_ts = int(time.time()) - IRRDBBuildManifest.MAX_AGE + 60
+        manifest.bundles = {"bundle": {"fingerprint": old_ts}}
+
+        # Reusing the data doesn't make it more recent.
+        self.assertTrue(manifest.is_known("bundle", "fingerprint"))
+        manifest.add("bundle", "fingerprint", refreshed=False)
+        self.assertEqual(manifest.bundles["bundle"]["fingerprint"], old_ts)
+
+        manifest.bundles["bundle"]["fingerprint"] = old_ts - 120
+        self.assertFalse(manifest.is_known("bundle", "fingerprint"))
+
+        manifest.add("bundle", "fingerprint", refreshed=True)
+        self.assertTrue(manifest.is_known("bundle", "fingerprint"))
+
+    def test_033_build_manifest_client_cfg(self, *patches):
+        """IRRDB enricher: build manifest, client configuration changed"""
+        self.setup_builder(self.GENERAL_SIMPLE, self.CLIENTS_SIMPLE)
+
+        clients = copy.deepcopy(self.CLIENTS_SIMPLE)
+        clients["clients"][0]["cfg"] = {
+            "filtering": {"irrdb": {"enforce_prefix_in_as_set": False}}
+        }
+        self.setup_builder(self.GENERAL_SIMPLE, clients)
+
+        manifest = IRRDBBuildManifest(self.temp_dir)
+        manifest.load()
+
+        # Only the bundle used by the changed client has new fingerprints.
+        for bundle_id, record in self.builder.irrdb_info.items():
+            self.assertEqual(len(manifest.bundles[bundle_id]),
+                             4 if record.object_names == ["AS1"] else 2)
+
+class TestIRRDBWhoisPool(unittest.TestCase):
+
+    def test_010_shared_pool(self):
+        """IRRDB enrichers: whois sessions pool shared"""
+        builder = mock.Mock(irrdb_client="whois", bgpq3_host="127.0.0.1",
+                            irrdb_whois_connections=4,
+                            irrdb_whois_resolver=None,
+                            irrdb_whois_pool=None)
+
+        asns = irrdb.IRRDBConfigEnricher_ASNs(builder, 1)
+        prefixes = irrdb.IRRDBConfigEnricher_Prefixes(builder, 1)
+
+        with mock.patch.object(irrdb.IRRdWhoisSessionPool, "close") as close:
+            asns._acquire_whois_pool()
+            prefixes._acquire_whois_pool()
+            self.assertIs(asns.whois_pool, prefixes.whois_pool)
+            self.assertEqual(asns.whois_pool.max_sessions, 4)
+
+            asns._release_whois_pool()
+            self.assertEqual(close.call_count, 0)
+            self.assertIsNotNone(builder.irrdb_whois_pool)
+
+            prefixes._release_whois_pool()
+            self.assertEqual(close.call_count, 1)
+            self.assertIsNone(builder.irrdb_whois_pool)
+
+class TestIRRDBMemoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.unpack_asns = mock.patch.object(
+            irrdb, "unpack_asns", side_effect=irrdb.unpack_asns
+        ).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def get_records(self, memory_cache_size, cnt):
+        irrdb_info = IRRDB(memory_cache_size=memory_cache_size)
+        records = []
+        for i in range(cnt):
+            record_id = irrdb_info.request("AS{}".format(i + 1), "client")
+            record = irrdb_info[record_id]
+            record.save("asns", list(range(i, i + 100)))
+            records.append(record)
+        self.unpack_asns.reset_mock()
+        return irrdb_info, records
+
+    def test_010_hit(self):
+        """IRRDB memory cache: data loaded only once"""
+        _, records = self.get_records(1024 * 1024, 3)
+        for _ in range(3):
+            for i, record in enumerate(records):
+                self.assertEqual(list(record.asns), list(range(i, i + 100)))
+        self.assertEqual(self.unpack_asns.call_count, 0)
+
+    def test_020_eviction(self):
+        """IRRDB memory cache: least recently used data evicted"""
+        irrdb_info, records = self.get_records(1000, 3)
+        cache = irrdb_info.memory_cache
+        self.assertLessEqual(cache.size, 1000)
+        self.assertEqual(len(cache.items), 2)
+
+        # The first record has been evicted, then it's loaded again
+        # and the second one is evicted.
+        self.assertEqual(list(records[0].asns), list(range(0, 100)))
+        self.assertEqual(self.unpack_asns.call_count, 1)
+        self.assertEqual(list(records[2].asns), list(range(2, 102)))
+        self.assertEqual(self.unpack_asns.call_count, 1)
+        self.assertEqual(list(records[1].asns), list(range(1, 101)))
+        self.assertEqual(self.unpack_asns.call_count, 2)
+        self.assertLessEqual(cache.size, 1000)
+
+    def test_030_disabled(self):
+        """IRRDB memory cache: disabled"""
+        irrdb_info, records = self.get_records(0, 2)
+        self.assertEqual(list(records[0].asns), list(range(0, 100)))
+        self.assertEqual(list(records[0].asns), list(range(0, 100)))
+        self.assertEqual(self.unpack_asns.call_count, 2)
+        self.assertEqual(irrdb_info.memory_cache.size, 0)
+
+    def test_040_pickle(self):
+        """IRRDB memory cache: not passed to other processes"""
+        irrdb_info, records = self.get_records(1024 * 1024, 1)
+        record = pickle.loads(pickle.dumps(records[0]))
+        self.unpack_asns.reset_mock()
+        self.assertEqual(len(record.memory_cache.items), 0)
+        self.assertEqual(list(record.asns), list(range(0, 100)))
+        self.assertEqual(self.unpack_asns.call_count, 1)
+
+class TestIRRDBRefs(unittest.TestCase):
+
+    @staticmethod
+    def prefix(prefix, length, comment=None):
+        return {"prefix": prefix, "length": length, "exact": True,
+                "ge": None, "le": None, "comment": comment,
+                "max_length": 128 if ":" in prefix else 32}
+
+    def test_010_same_data(self):
+        """IRRDB: records with the same data share the same name"""
+        irrdb_info = IRRDB()
+        ids = {}
+        for name, asns, prefixes in (
+            ("AS1", [1, 2], [self.prefix("192.0.2.0", 24),
+                             self.prefix("2001:db8::", 32)]),
+            ("AS-FOO", [2, 1], [self.prefix("2001:db8::", 32, "foo"),
+                                self.prefix("192.0.2.0", 24, "foo")]),
+            ("AS-BAR", [3], [self.prefix("192.0.2.0", 24)]),
+        ):
+            ids[name] = irrdb_info.request(name, "client")
+            irrdb_info[ids[name]].save("asns", asns)
+            irrdb_info[ids[name]].save("prefixes", prefixes)
+
+        first = min(ids["AS1"], ids["AS-FOO"])
+        for objects in ("asns", "prefixes"):
+            self.assertEqual(irrdb_info.get_ref(ids["AS1"], objects),
+                             irrdb_info[first].name)
+            self.assertEqual(irrdb_info.get_ref(ids["AS-FOO"], objects),
+                             irrdb_info[first].name)
+            self.assertEqual(irrdb_info.get_ref(ids["AS-BAR"], objects),
+                             "AS_BAR")
+
+        # Only IPv4 prefixes are taken into account in the IPv4 view.
+        view = irrdb_info.get_view(list(ids.values()), 4, set(["client"]))
+        first = min(ids.values())
+        for name in ids:
+            self.assertEqual(view.get_ref(ids[name], "prefixes"),
+                             irrdb_info[first].name)
+        self.assertEqual(view.get_ref(ids["AS-BAR"], "asns"), "AS_BAR")
+
+        with six.assertRaisesRegex(self, BuilderError, "views are read-only"):
+            view[ids["AS1"]].save("asns", [1])
@@ -0,0 +1,239 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import json
+import shutil
+from six.moves import BaseHTTPServer, socketserver
+import tempfile
+import threading
+import time
+import unittest
+
+from pierky.arouteserver.cached_objects import CachedObject, \
+                                               MsgPackCacheSerializer, \
+                                               SQLiteCache, \
+                                               msgpack
+from pierky.arouteserver.http_client import http_get
+
+
+class FakeHTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(
+            (self.path, self.headers.get("If-None-Match"))
+        )
+
+        etag = '"{}"'.format(server.version)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            if server.etag_on_304 is True:
+                self.send_header("ETag", etag)
+            elif server.etag_on_304:
+                self.send_header("ETag", server.etag_on_304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = json.dumps({"version": server.version}).encode("utf-8")
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+            f.write(body)
+        body = buf.getvalue()
+
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeHTTPServer(socketserver.ThreadingMixIn,
+                     BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           FakeHTTPHandler)
+        self.version = 1
+        self.etag_on_304 = True
+        self.requests = []
+
+class FakeCachedObject(CachedObject):
+
+    def __init__(self, url, *args, **kwargs):
+        CachedObject.__init__(self, *args, **kwargs)
+        self.url = url
+
+    def _get_object_filename(self):
+        return "fake.json"
+
+    def _get_data(self):
+        response = self._http_get(self.url)
+        response.raise_for_status()
+        return json.loads(response.content.decode("utf-8"))
+
+class TestHTTPClient(unittest.TestCase):
+
+    CACHE_BACKEND = "files"
+    CACHE_SERIALIZER = None
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+        self.server = FakeHTTPServer()
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"poll_interval": 0.05}
+        )
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        self.url = "http://{}:{}/data.json".format(
+            *self.server.server_address
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_obj(self, cache_expiry):
+        obj = FakeCachedObject(self.url, cache_dir=self.temp_dir,
+                               cache_expiry=cache_expiry,
+                               cache_backend=self.CACHE_BACKEND)
+        if self.CACHE_SERIALIZER:
+            obj.CACHE_SERIALIZER = self.CACHE_SERIALIZER
+        obj.load_data()
+        return obj
+
+    def test_010_gzip(self):
+        """HTTP client: gzip-encoded response"""
+        response = http_get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode("utf-8")),
+                         {"version": 1})
+
+    def test_020_revalidation(self):
+        """HTTP client: expired cache revalidated"""
+        obj = self.get_obj(10)
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, {"version": 1})
+
+        # Expired: a conditional request is sent, the server
+        # answers 304 and the cached data is used.
+        obj = self.get_obj(0)
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, {"version": 1})
+        self.assertEqual(self.server.requests[-1],
+                         ("/data.json", '"1"'))
+
+        # The cache has been refreshed.
+        obj = self.get_obj(10)
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_030_changed(self):
+        """HTTP client: expired cache, resource changed"""
+        self.get_obj(10)
+
+        self.server.version = 2
+        obj = self.get_obj(0)
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, {"version": 2})
+
+        obj = self.get_obj(0)
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(self.server.requests[-1],
+                         ("/data.json", '"2"'))
+
+    def test_035_revalidation_no_validators(self):
+        """HTTP client: validators kept when 304 doesn't carry them"""
+        self.get_obj(10)
+
+        self.server.etag_on_304 = False
+        for _ in range(2):
+            obj = self.get_obj(0)
+            self.assertTrue(obj.from_cache)
+            self.assertEqual(obj.raw_data, {"version": 1})
+            self.assertEqual(self.server.requests[-1],
+                             ("/data.json", '"1"'))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_036_revalidation_new_validators(self):
+        """HTTP client: validators updated when 304 carries new ones"""
+        self.get_obj(10)
+
+        self.server.etag_on_304 = '"1b"'
+        obj = self.get_obj(0)
+        self.assertTrue(obj.from_cache)
+
+        self.get_obj(0)
+        self.assertEqual(self.server.requests[-1],
+                         ("/data.json", '"1b"'))
+
+    def test_040_bypass_cache(self):
+        """HTTP client: no revalidation when cache is bypassed"""
+        self.get_obj(10)
+
+        obj = FakeCachedObject(self.url, cache_dir=self.temp_dir,
+                               cache_expiry=0,
+                               cache_backend=self.CACHE_BACKEND)
+        obj.load_data_from_cache()
+        obj.bypass_cache = True
+        obj.load_data()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(self.server.requests[-1], ("/data.json", None))
+
+@unittest.skipIf(msgpack is None, "msgpack not available")
+class TestHTTPClient_MsgPack(TestHTTPClient):
+
+    CACHE_SERIALIZER = MsgPackCacheSerializer
+
+class TestHTTPClient_SQLite(TestHTTPClient):
+
+    CACHE_BACKEND = "sqlite"
+
+    def test_050_purge_expired(self):
+        """HTTP client: expired objects that can be revalidated not purged"""
+        self.get_obj(0)
+
+        cache = SQLiteCache.get(self.temp_dir)
+        self.assertEqual(cache.purge_expired(), 0)
+
+        obj = self.get_obj(0)
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, {"version": 1})
+        self.assertEqual(self.server.requests[-1],
+                         ("/data.json", '"1"'))
+
+        # Purged once the grace period is over.
+        self.assertEqual(
+            cache.purge_expired(
+                epoch_time=int(time.time()) + cache.STALE_GRACE_PERIOD
+            ), 1
+        )
+
+        obj = self.get_obj(0)
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(self.server.requests[-1], ("/data.json", None))
@@ -0,0 +1,64 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from pierky.arouteserver.ipaddresses import IPNetwork, IPNet, \
+                                            parse_ip_network, \
+                                            parse_ip_networks
+
+
+class TestIPNet(unittest.TestCase):
+
+    def test_010_same_of_ipnetwork(self):
+        """IPNet: same attributes of IPNetwork"""
+        for prefix in ("192.0.2.0/24", "10.0.0.1", "0.0.0.0/0",
+                       "2001:db8::/32", "2001:DB8:0:0::/64",
+                       "::ffff:192.0.2.0/120", "::/0"):
+            net = parse_ip_network(prefix)
+            exp = IPNetwork(prefix)
+            self.assertEqual(
+                (net.ip, net.prefixlen, net.max_prefixlen, net.version,
+                 str(net)),
+                (exp.ip, exp.prefixlen, exp.max_prefixlen, exp.version,
+                 str(exp))
+            )
+
+    def test_020_invalid(self):
+        """IPNet: invalid prefixes"""
+        for prefix in ("192.0.2.1/24", "192.0.2/24", "192.0.2.0/33",
+                       "2001:db8::/129", "2001:db8::1/64", "192.0.2.0/",
+                       "192.0.2.0/x", "abc", ""):
+            with self.assertRaises(ValueError):
+                parse_ip_network(prefix)
+
+    def test_030_contains(self):
+        """IPNet: networks containment and equality"""
+        net = parse_ip_network("10.0.0.0/8")
+        self.assertIn(parse_ip_network("10.1.0.0/16"), net)
+        self.assertIn(parse_ip_network("10.0.0.0/8"), net)
+        self.assertNotIn(parse_ip_network("11.0.0.0/16"), net)
+        self.assertNotIn(parse_ip_network("0.0.0.0/0"), net)
+        self.assertNotIn(parse_ip_network("a00::/16"), net)
+        self.assertEqual(net, IPNet(4, 10 << 24, 8))
+        self.assertNotEqual(net, parse_ip_network("10.0.0.0/9"))
+
+    def test_040_bulk(self):
+        """IPNet: bulk parsing"""
+        res = parse_ip_networks(["192.0.2.0/24", "2001:db8::/32",
+                                 "192.0.2.0/24"])
+        self.assertEqual([str(net) for net in res],
+                         ["192.0.2.0/24", "2001:db8::/32", "192.0.2.0/24"])
+        self.assertIs(res[0], res[2])
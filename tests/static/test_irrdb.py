@@ -233,6 +233,25 @@ class TestIRRDBInfo(TestIRRDBInfo_Base):
         self.file_exists("test4_file")
         self.assertEqual(run_cmd.call_count, 2)
 
+    @mock.patch.object(FakeIRRDBObject, "_get_object_filename", return_value="test5_file")
+    @mock.patch.object(FakeIRRDBObject, "_run_cmd", return_value="test5")
+    def test_015_cache_expired_ignored(self, run_cmd, _):
+        """IRRDB info: base, cache expired but ignored"""
+        self.setup_obj(["TEST"], cache_expiry=1)
+        self.obj.load_data()
+
+        self.assertEqual(run_cmd.call_count, 1)
+
+        time.sleep(2)
+
+        self.setup_obj(["TEST"], cache_expiry=1)
+        self.obj.ignore_cache_expiry = True
+        self.obj.load_data()
+
+        self.assertEqual(self.obj.raw_data, "test5")
+        self.assertTrue(self.obj.from_cache)
+        self.assertEqual(run_cmd.call_count, 1)
+
 class TestIRRDBInfo_ASSet(TestIRRDBInfo_Base):
 
     __test__ = True
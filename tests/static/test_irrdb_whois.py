@@ -0,0 +1,338 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+from six.moves import socketserver
+import six
+import tempfile
+import threading
+import unittest
+
+from pierky.arouteserver.errors import IRRDBToolsError
+from pierky.arouteserver.irrdb import ASSet, RSet
+from pierky.arouteserver.irrdb_whois import IRRdWhoisSession, \
+                                            IRRdWhoisSessionPool
+
+
+class FakeIRRdHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+
+        persistent = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            query = line.decode("utf-8").strip()
+            server.queries.append(query)
+
+            if query == "!!":
+                persistent = True
+                continue
+
+            if query.startswith("!s"):
+                resp = "C\n"
+            elif query in server.data:
+                data = server.data[query]
+                if data is None:
+                    resp = "D\n"
+                elif data.startswith("F"):
+                    resp = "{}\n".format(data)
+                else:
+                    data = "{}\n".format(data)
+                    resp = "A{}\n{}C\n".format(len(data), data)
+            else:
+                resp = "D\n"
+
+            self.wfile.write(resp.encode("utf-8"))
+
+            if not persistent:
+                break
+
+class FakeIRRdServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, data):
+        socketserver.TCPServer.__init__(self, ("127.0.0.1", 0),
+                                        FakeIRRdHandler)
+        self.data = data
+        self.queries = []
+        self.connections = 0
+
+class TestIRRdWhois(unittest.TestCase):
+
+    DATA = {
+        "!iAS-ONE": "AS1 AS-ONE-CUST",
+        "!iAS-ONE-CUST": "AS2 AS3",
+        "!iAS-TWO": "AS3 AS4",
+        "!iRS-ONE": "192.0.2.0/24 2001:db8:1::/48^+",
+        "!iRS-RANGES": "192.0.2.0/24^+ 198.51.100.0/24^- "
+                       "203.0.113.0/24^25-26 10.0.0.0/8^16 10.0.0.0/8 "
+                       "172.16.0.0/12^8",
+        "!iRS-SET-RANGE": "192.0.2.0/24 RS-ONE^+",
+        "!iAS-ERR": "F Internal error",
+        "!iAS-LOOP1": "AS10 AS-LOOP2",
+        "!iAS-LOOP2": "AS20 AS-LOOP3 AS-LOOP4",
+        "!iAS-LOOP3": "AS30 AS-LOOP1",
+        "!iAS-LOOP4": "AS40",
+        "!gAS1": "10.0.0.0/8 10.1.0.0/16",
+        "!gAS2": "10.1.0.0/16 192.168.0.0/24",
+        "!gAS3": "172.16.0.0/12",
+        "!6AS1": "2001:db8::/32",
+        "!6AS3": "2001:db8:3::/48",
+    }
+
+    # Number of IPv4 prefixes of AS-ONE + AS-TWO.
+    POOL_PREFIXES_CNT = 4
+
+    def get_server_data(self):
+        return self.DATA
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+        self.server = FakeIRRdServer(self.get_server_data())
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"poll_interval": 0.05}
+        )
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        self.client = IRRdWhoisSession(
+            "{}:{}".format(*self.server.server_address)
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_obj(self, cls, object_names, *args, **kwargs):
+        obj = cls(object_names, *args,
+                  cache_dir=self.temp_dir,
+                  bgpq3_sources="RIPE,RADB",
+                  whois_client=self.client,
+                  **kwargs)
+        obj.load_data()
+        return obj
+
+    def test_010_asns(self):
+        """IRRd whois: ASNs"""
+        obj = self.get_obj(ASSet, ["AS-ONE", "AS-TWO", "AS10"])
+        self.assertEqual(obj.asns, [1, 2, 3, 4, 10])
+
+        # AS-SETs expanded in a batch for each nesting level.
+        self.assertEqual(self.server.queries,
+                         ["!!", "!v", "!sRIPE,RADB",
+                          "!iAS-ONE", "!iAS-TWO", "!iAS-ONE-CUST"])
+
+    def test_020_prefixes_ipv4(self):
+        """IRRd whois: IPv4 prefixes"""
+        obj = self.get_obj(RSet, ["AS-ONE", "RS-ONE"], 4, False)
+        self.assertEqual(
+            [(p["prefix"], p["length"], p["exact"]) for p in obj.prefixes],
+            [("10.0.0.0", 8, True),
+             ("10.1.0.0", 16, True),
+             ("172.16.0.0", 12, True),
+             ("192.0.2.0", 24, True),
+             ("192.168.0.0", 24, True)]
+        )
+
+    def test_021_prefixes_ipv6_longer(self):
+        """IRRd whois: IPv6 prefixes, allow longer prefixes"""
+        obj = self.get_obj(RSet, ["AS-ONE", "RS-ONE"], 6, True)
+        self.assertEqual(
+            [(p["prefix"], p["length"], p["exact"], p["le"])
+             for p in obj.prefixes],
+            [("2001:db8::", 32, False, 128),
+             ("2001:db8:1::", 48, False, 128),
+             ("2001:db8:3::", 48, False, 128)]
+        )
+
+    def test_022_range_operators(self):
+        """IRRd whois: route-set members with range operators"""
+        obj = self.get_obj(RSet, ["RS-RANGES"], 4, False)
+        self.assertEqual(
+            [(p["prefix"], p["length"], p["exact"], p["ge"], p["le"])
+             for p in obj.prefixes],
+            [("10.0.0.0", 8, True, None, None),
+             ("10.0.0.0", 8, False, 16, 16),
+             ("192.0.2.0", 24, False, 24, 32),
+             ("198.51.100.0", 24, False, 25, 32),
+             ("203.0.113.0", 24, False, 25, 26)]
+        )
+
+    def test_023_range_operator_on_set(self):
+        """IRRd whois: range operator applied to a set"""
+        with six.assertRaisesRegex(self, IRRDBToolsError,
+                                   "range operators are only supported "
+                                   "on prefixes.+RS-ONE\\^\\+"):
+            self.get_obj(RSet, ["RS-SET-RANGE"], 4, False)
+
+    def test_024_cache_key(self):
+        """IRRd whois: cache not shared with bgpq3"""
+        obj = self.get_obj(RSet, ["AS-ONE"], 4, False)
+        self.assertEqual(obj._get_object_filename(),
+                         "AS_ONE-r_set-ipv4-whois.json")
+        obj = self.get_obj(ASSet, ["AS-ONE"])
+        self.assertEqual(obj._get_object_filename(),
+                         "AS_ONE-as_set-whois.json")
+
+        obj = ASSet(["AS-ONE"], cache_dir=self.temp_dir)
+        self.assertEqual(obj._get_object_filename(), "AS_ONE-as_set.json")
+
+    def test_030_persistent_session(self):
+        """IRRd whois: one session for multiple objects"""
+        self.get_obj(ASSet, ["AS-ONE"])
+        self.get_obj(RSet, ["AS-TWO"], 4, False)
+        self.get_obj(RSet, ["AS-TWO"], 6, False)
+
+        self.assertEqual(self.server.connections, 1)
+
+        # Sources are set only once.
+        self.assertEqual(
+            len([q for q in self.server.queries if q.startswith("!s")]), 1
+        )
+
+    def test_040_source(self):
+        """IRRd whois: specific source"""
+        self.get_obj(ASSet, ["RADB::AS-ONE"])
+        self.assertEqual(self.server.queries,
+                         ["!!", "!v", "!sRADB,RIPE,RADB",
+                          "!iAS-ONE", "!iAS-ONE-CUST"])
+
+    def test_041_nested_sets_cache(self):
+        """IRRd whois: nested sets expanded only once"""
+        self.get_obj(ASSet, ["AS-ONE"])
+        self.get_obj(ASSet, ["AS-ONE-CUST", "AS-TWO"])
+        obj = self.get_obj(RSet, ["AS-ONE", "AS-TWO"], 4, False)
+        self.assertEqual(len(obj.prefixes), self.POOL_PREFIXES_CNT)
+        obj = self.get_obj(RSet, ["AS-ONE-CUST"], 4, False)
+
+        queries = [q for q in self.server.queries if q.startswith("!i")]
+        self.assertEqual(sorted(queries),
+                         ["!iAS-ONE", "!iAS-ONE-CUST", "!iAS-TWO"])
+
+        # Routes of each origin ASN queried only once too.
+        queries = [q for q in self.server.queries
+                   if q.startswith(("!g", "!a"))]
+        self.assertEqual(len(queries), len(set(queries)))
+
+    def test_042_loop(self):
+        """IRRd whois: loop among sets"""
+        obj = self.get_obj(ASSet, ["AS-LOOP2"])
+        self.assertEqual(obj.asns, [10, 20, 30, 40])
+
+        obj = self.get_obj(ASSet, ["AS-LOOP3"])
+        self.assertEqual(obj.asns, [10, 20, 30, 40])
+
+        obj = self.get_obj(ASSet, ["AS-LOOP4"])
+        self.assertEqual(obj.asns, [40])
+
+        queries = [q for q in self.server.queries if q.startswith("!i")]
+        self.assertEqual(len(queries), 4)
+
+    def test_050_error(self):
+        """IRRd whois: error returned by the server"""
+        with six.assertRaisesRegex(self, IRRDBToolsError,
+                                   "Internal error"):
+            self.get_obj(ASSet, ["AS-ERR"])
+
+        # A new connection is used after the error.
+        obj = self.get_obj(ASSet, ["AS-TWO"])
+        self.assertEqual(obj.asns, [3, 4])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_060_connection_refused(self):
+        """IRRd whois: connection refused"""
+        self.client = IRRdWhoisSession("127.0.0.1:1")
+        with six.assertRaisesRegex(self, IRRDBToolsError,
+                                   "Can't connect"):
+            self.get_obj(ASSet, ["AS-ONE"])
+
+    def test_070_pool(self):
+        """IRRd whois: pool of sessions"""
+        self.client = IRRdWhoisSessionPool(
+            "{}:{}".format(*self.server.server_address), 2
+        )
+
+        errors = []
+
+        def expand():
+            try:
+                for _ in range(10):
+                    obj = RSet(["AS-ONE", "AS-TWO"], 4, False,
+                               cache_dir=self.temp_dir,
+                               whois_client=self.client)
+                    obj.bypass_cache = True
+                    obj.load_data()
+                    self.assertEqual(len(obj.prefixes),
+                                     self.POOL_PREFIXES_CNT)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=expand) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(self.server.connections, 2)
+        self.assertLessEqual(len(self.client.sessions), 2)
+
+class TestIRRdWhois_IRRd4(TestIRRdWhois):
+
+    POOL_PREFIXES_CNT = 3
+
+    def get_server_data(self):
+        data = dict(self.DATA)
+        data["!v"] = "IRRd -- version 4.0.8"
+        data["!a4AS-ONE"] = "10.0.0.0/8 172.16.0.0/12 192.168.0.0/24"
+        data["!a4AS-TWO"] = "172.16.0.0/12"
+        data["!a4RS-ONE"] = "192.0.2.0/24"
+        data["!a6AS-ONE"] = "2001:db8::/32 2001:db8:3::/48"
+        data["!a6RS-ONE"] = "2001:db8:1::/48"
+        return data
+
+    def test_020_prefixes_ipv4(self):
+        """IRRd whois: IPv4 prefixes, IRRd 4"""
+        obj = self.get_obj(RSet, ["AS-ONE", "RS-ONE", "AS64496"], 4, False)
+        self.assertEqual(
+            [(p["prefix"], p["length"]) for p in obj.prefixes],
+            [("10.0.0.0", 8),
+             ("172.16.0.0", 12),
+             ("192.0.2.0", 24),
+             ("192.168.0.0", 24)]
+        )
+
+        # Sets expanded server-side.
+        self.assertEqual(self.server.queries,
+                         ["!!", "!v", "!sRIPE,RADB",
+                          "!a4AS-ONE", "!gAS64496", "!a4RS-ONE"])
+
+    def test_022_range_operators(self):
+        """IRRd whois: route-set members with range operators, IRRd 4"""
+        self.skipTest("Sets are expanded server-side by IRRd 4")
+
+    def test_023_range_operator_on_set(self):
+        """IRRd whois: range operator applied to a set, IRRd 4"""
+        self.skipTest("Sets are expanded server-side by IRRd 4")
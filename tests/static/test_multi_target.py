@@ -0,0 +1,247 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import copy
+import os
+import shutil
+import six
+import tempfile
+import unittest
+import yaml
+
+from pierky.arouteserver.build_stats import build_stats
+from pierky.arouteserver.builder import ConfigBuilder, BIRDConfigBuilder, \
+                                        OpenBGPDConfigBuilder, render_targets
+from pierky.arouteserver.commands.tpl_rendering import \
+    MultiTargetRenderingCommand
+from pierky.arouteserver.errors import BuilderError, TemplateRenderingError
+from pierky.arouteserver.tests.mocked_env import MockedEnv
+
+
+class TestMultiTarget(unittest.TestCase):
+
+    GENERAL = {
+        "cfg": {
+            "rs_as": 999,
+            "router_id": "192.0.2.2",
+            "path_hiding": False,
+            "filtering": {
+                "irrdb": {
+                    "enforce_origin_in_as_set": True,
+                    "enforce_prefix_in_as_set": True
+                }
+            }
+        }
+    }
+    CLIENTS = {
+        "clients": [
+            {"asn": 1, "ip": "192.0.2.11"},
+            {"asn": 2, "ip": ["192.0.2.21", "2001:db8::21"]},
+            {"asn": 3, "ip": "2001:db8::31"}
+        ]
+    }
+
+    def setUp_mocked_env(self, **kwargs):
+        self.mocked_env = MockedEnv(base_dir=os.path.dirname(__file__),
+                                    default=False, irr=True, **kwargs)
+        self.mocked_env.mocked_files = {
+            "irrdb_data/rset_AS1_ipv6.json": {"prefix_list": []},
+            "irrdb_data/rset_AS2_ipv6.json": {
+                "prefix_list": [{"prefix": "2001:db8:2::/48"}]
+            },
+        }
+
+    def setUp(self):
+        self.setUp_mocked_env()
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+        self.cfg_general = self.write_file("general.yml", self.GENERAL)
+        self.cfg_clients = self.write_file("clients.yml", self.CLIENTS)
+
+    def tearDown(self):
+        MockedEnv.stopall()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_file(self, name, dic):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "w") as f:
+            yaml.dump(dic, f, default_flow_style=False)
+        return path
+
+    def get_builder(self, builder_class, template_dir, ip_ver=None,
+                    **kwargs):
+        return builder_class(
+            template_dir=template_dir,
+            template_name="main.j2",
+            cfg_general=self.cfg_general,
+            cfg_clients=self.cfg_clients,
+            cfg_bogons="config.d/bogons.yml",
+            cache_dir=self.temp_dir,
+            ip_ver=ip_ver,
+            **kwargs
+        )
+
+    def render(self, builder):
+        return builder.render_template()
+
+    def read_file(self, path):
+        with open(path, "r") as f:
+            return f.read()
+
+    def check_same_output(self):
+        expected = {}
+        for ip_ver in (4, 6):
+            builder = self.get_builder(BIRDConfigBuilder, "templates/bird",
+                                       ip_ver=ip_ver)
+            expected["bird{}".format(ip_ver)] = self.render(builder)
+        builder = self.get_builder(OpenBGPDConfigBuilder,
+                                   "templates/openbgpd")
+        expected["openbgpd"] = self.render(builder)
+
+        builder = self.get_builder(ConfigBuilder, "templates/html")
+        targets = [
+            (builder.get_target_builder(BIRDConfigBuilder, "templates/bird",
+                                        ip_ver=4),
+             os.path.join(self.temp_dir, "bird4")),
+            (builder.get_target_builder(BIRDConfigBuilder, "templates/bird",
+                                        ip_ver=6),
+             os.path.join(self.temp_dir, "bird6")),
+            (builder.get_target_builder(OpenBGPDConfigBuilder,
+                                        "templates/openbgpd"),
+             os.path.join(self.temp_dir, "openbgpd")),
+        ]
+
+        for processes in (1, 2):
+            render_targets(targets, processes=processes)
+
+            for name in expected:
+                self.assertEqual(
+                    self.read_file(os.path.join(self.temp_dir, name)),
+                    expected[name]
+                )
+
+    def test_010_same_output(self):
+        """Multi-target: same output of single target builds"""
+        self.check_same_output()
+
+        # AS3's AS-SET has no IPv6 prefixes.
+        self.assertIn("# no prefixes found for AS3",
+                      self.read_file(os.path.join(self.temp_dir, "bird6")))
+        self.assertNotIn("AS3",
+                         self.read_file(os.path.join(self.temp_dir, "bird4")))
+
+    def test_015_same_output_rpki_whois(self):
+        """Multi-target: same output, RPKI ROAs and ARIN Whois DB"""
+        MockedEnv.stopall()
+        self.setUp_mocked_env(ripe_rpki_cache=True, arin_db_dump=True)
+        self.mocked_env.mocked_files.update({
+            "ripe-rpki-cache/ripe-rpki-cache.json": {"roas": [
+                {"asn": "AS1", "prefix": "1.0.0.0/8", "maxLength": 24,
+                 "ta": "RIPE NCC RPKI Root"},
+                {"asn": "AS1", "prefix": "2001:db8:1::/48", "maxLength": 48,
+                 "ta": "RIPE NCC RPKI Root"},
+                {"asn": "AS3", "prefix": "2001:db8:3::/48", "maxLength": 48,
+                 "ta": "RIPE NCC RPKI Root"},
+                {"asn": "AS4", "prefix": "4.0.0.0/8", "maxLength": 8,
+                 "ta": "RIPE NCC RPKI Root"},
+            ]},
+            "arin_whois_db/dump.json": {
+                "json_schema": "0.1.0",
+                "source": "ARIN-WHOIS",
+                "whois_records": {
+                    "v4": [{"originas": "AS1", "prefix": "101.0.0.0/16"},
+                           {"originas": "AS3", "prefix": "103.0.0.0/16"}],
+                    "v6": [{"originas": "AS2", "prefix": "2001:db8:102::/48"}]
+                }
+            },
+        })
+
+        general = copy.deepcopy(self.GENERAL)
+        general["cfg"]["filtering"]["irrdb"].update({
+            "use_rpki_roas_as_route_objects": {"enabled": True},
+            "use_arin_bulk_whois_data": {"enabled": True}
+        })
+        self.cfg_general = self.write_file("general.yml", general)
+
+        self.check_same_output()
+
+        bird4 = self.read_file(os.path.join(self.temp_dir, "bird4"))
+        bird6 = self.read_file(os.path.join(self.temp_dir, "bird6"))
+        self.assertIn("1.0.0.0/8", bird4)
+        self.assertIn("101.0.0.0/16", bird4)
+        self.assertNotIn("103.0.0.0/16", bird4)
+        self.assertIn("2001:db8:3::/48", bird6)
+        self.assertIn("2001:db8:102::/48", bird6)
+        self.assertNotIn("ARIN_Whois_db_AS1", bird6)
+
+    def test_020_target_validation(self):
+        """Multi-target: target builders are validated"""
+        builder = self.get_builder(ConfigBuilder, "templates/html")
+
+        with six.assertRaisesRegex(self, BuilderError,
+                                   "explicit target IP version"):
+            builder.get_target_builder(BIRDConfigBuilder, "templates/bird")
+
+        bird4 = builder.get_target_builder(BIRDConfigBuilder,
+                                           "templates/bird", ip_ver=4)
+        with six.assertRaisesRegex(self, BuilderError,
+                                   "initialized for both IPv4 and IPv6"):
+            bird4.get_target_builder(BIRDConfigBuilder, "templates/bird",
+                                     ip_ver=6)
+
+    def test_030_rendering_error(self):
+        """Multi-target: rendering errors"""
+        builder = self.get_builder(ConfigBuilder, "templates/html")
+        bird4 = builder.get_target_builder(BIRDConfigBuilder,
+                                           "templates/bird", ip_ver=4)
+        path = os.path.join(self.temp_dir, "missing_dir", "bird4")
+
+        with six.assertRaisesRegex(self, TemplateRenderingError,
+                                   "missing_dir"):
+            render_targets([(bird4, path)])
+
+    def test_035_build_stats(self):
+        """Multi-target: stats of the targets rendered by other processes"""
+        builder = self.get_builder(ConfigBuilder, "templates/html")
+        targets = [
+            (builder.get_target_builder(BIRDConfigBuilder, "templates/bird",
+                                        ip_ver=ip_ver),
+             os.path.join(self.temp_dir, "bird{}".format(ip_ver)))
+            for ip_ver in (4, 6)
+        ]
+
+        build_stats.reset()
+        render_targets(targets, processes=2)
+
+        stats = build_stats.to_dict()["histograms"]["template_render_seconds"]
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["labels"],
+                         {"template": "templates/bird/main.j2"})
+        self.assertEqual(stats[0]["count"], 2)
+
+    def test_040_targets_format(self):
+        """Multi-target: targets command line format"""
+        parse_target = MultiTargetRenderingCommand.parse_target
+
+        self.assertEqual(parse_target("bird4=/etc/bird/bird4.conf"),
+                         ("bird", 4, "/etc/bird/bird4.conf"))
+        self.assertEqual(parse_target("template-context=ctx=1.yml"),
+                         ("template-context", None, "ctx=1.yml"))
+
+        for s in ("bird", "bird5=a", "foo=a", "bird4="):
+            with six.assertRaisesRegex(self, argparse.ArgumentTypeError,
+                                       "invalid target"):
+                parse_target(s)
@@ -0,0 +1,155 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+import unittest
+
+from pierky.arouteserver.config.validators import ValidatorPrefixListEntry
+from pierky.arouteserver.packed_lists import PackedPrefixList, ROAList, \
+                                             pack_asns, unpack_asns
+
+
+def entry(prefix, length, **kwargs):
+    kwargs.update({"prefix": prefix, "length": length})
+    return ValidatorPrefixListEntry().validate(kwargs)
+
+class TestPackedLists(unittest.TestCase):
+
+    def test_010_asns(self):
+        """Packed lists: ASNs"""
+        asns = [1, 65535, 4200000000]
+        self.assertEqual(list(unpack_asns(pack_asns(asns))), asns)
+        self.assertEqual(len(unpack_asns(pack_asns([]))), 0)
+
+    def test_020_prefixes(self):
+        """Packed lists: prefixes"""
+        entries = [
+            entry("192.0.2.0", 24, exact=True),
+            entry("2001:db8::", 32, ge=48, le=64),
+            entry("10.0.0.0", 8, le=24),
+            entry("::ffff:0:0", 96),
+            entry("1:0:0:2::", 64, exact=True),
+        ]
+        lst = PackedPrefixList(PackedPrefixList.pack(entries))
+        self.assertEqual(len(lst), 5)
+        self.assertEqual(list(lst), entries)
+        self.assertEqual(lst[1], entries[1])
+        self.assertEqual(lst[-1], entries[-1])
+        self.assertEqual(lst[1:3], entries[1:3])
+        self.assertEqual(lst.comments, None)
+        with self.assertRaises(IndexError):
+            lst[5]
+
+        self.assertEqual(list(lst.filter_ip_ver(4)),
+                         [entries[0], entries[2]])
+        self.assertEqual(list(lst.filter_ip_ver(6)),
+                         [entries[1], entries[3], entries[4]])
+
+    def test_030_comments(self):
+        """Packed lists: prefixes with comments"""
+        entries = [
+            entry("192.0.2.0", 24, exact=True, comment="Test"),
+            entry("2001:db8::", 32),
+        ]
+        lst = PackedPrefixList(PackedPrefixList.pack(entries))
+        self.assertEqual(list(lst), entries)
+        self.assertEqual(list(lst.filter_ip_ver(6)), [entries[1]])
+
+    def test_040_empty(self):
+        """Packed lists: empty list of prefixes"""
+        lst = PackedPrefixList(PackedPrefixList.pack([]))
+        self.assertEqual(len(lst), 0)
+        self.assertFalse(lst)
+        self.assertEqual(list(lst), [])
+
+    def test_050_roas(self):
+        """Packed lists: ROAs"""
+        roas = ROAList.from_roas([
+            [64497, "2001:db8::/32", 32, 48, "RIPE"],
+            [64496, "192.0.2.0/24", 24, 24, "APNIC"],
+            [64496, "198.51.100.0/24", 24, 24, "RIPE"],
+            [64499, "10.0.0.0/8", 8, 24, "ARIN"],
+            [64495, "192.0.2.0/24", 24, 25, "RIPE"],
+        ])
+        self.assertEqual(len(roas), 5)
+        self.assertEqual(roas[0], {"prefix": "2001:db8::/32", "length": 32,
+                                   "max_len": 48, "asn": 64497})
+
+        def prefixes_asns(roas):
+            return [(roa["prefix"], roa["asn"]) for roa in roas]
+
+        self.assertEqual(
+            prefixes_asns(roas.sort()),
+            [("10.0.0.0/8", 64499), ("192.0.2.0/24", 64495),
+             ("192.0.2.0/24", 64496), ("198.51.100.0/24", 64496),
+             ("2001:db8::/32", 64497)]
+        )
+
+        filtered = roas.filter(afis=set([4]), tas=set(["RIPE", "APNIC"]))
+        self.assertEqual(
+            prefixes_asns(filtered),
+            [("192.0.2.0/24", 64496), ("198.51.100.0/24", 64496),
+             ("192.0.2.0/24", 64495)]
+        )
+        filtered = filtered.filter(asns=set([64496])).sort()
+        self.assertEqual(filtered.prefixes, ["192.0.2.0/24", "198.51.100.0/24"])
+        self.assertEqual(filtered.count_afi(4), 2)
+        self.assertEqual(filtered.count_afi(6), 0)
+
+        # Only the rows of the list are pickled.
+        self.assertEqual(list(pickle.loads(pickle.dumps(filtered))),
+                         list(filtered))
+        self.assertEqual(
+            len(pickle.loads(pickle.dumps(filtered)).columns["prefixes"]), 2
+        )
+
+        self.assertEqual(len(ROAList.from_roas([])), 0)
+        self.assertFalse(ROAList())
+
+    def test_060_roas_redundant(self):
+        """Packed lists: redundant ROAs"""
+        roas = ROAList.from_roas([
+            [64496, "10.0.0.0/8", 8, 24, "RIPE"],
+            # Covered by the first one.
+            [64496, "10.1.0.0/16", 16, 24, "RIPE"],
+            [64496, "10.2.0.0/16", 16, 20, "RIPE"],
+            # Longer max length.
+            [64496, "10.3.0.0/16", 16, 25, "RIPE"],
+            # Covered by the previous one.
+            [64496, "10.3.1.0/24", 24, 25, "RIPE"],
+            # Different ASN.
+            [64497, "10.4.0.0/16", 16, 16, "RIPE"],
+            # Same prefix, shorter max length.
+            [64497, "10.4.0.0/16", 16, 16, "RIPE"],
+            [64498, "192.0.2.0/24", 24, 24, "RIPE"],
+            [64498, "192.0.2.0/24", 24, 25, "RIPE"],
+            [64496, "2001:db8::/32", 32, 48, "RIPE"],
+            [64496, "2001:db8:1::/48", 48, 48, "RIPE"],
+            [64496, "2001:db9::/48", 48, 48, "RIPE"],
+        ])
+        self.assertEqual(
+            [(roa["prefix"], roa["max_len"], roa["asn"])
+             for roa in roas.remove_redundant()],
+            [("10.0.0.0/8", 24, 64496),
+             ("10.3.0.0/16", 25, 64496),
+             ("10.4.0.0/16", 16, 64497),
+             ("192.0.2.0/24", 25, 64498),
+             ("2001:db8::/32", 48, 64496),
+             ("2001:db9::/48", 48, 64496)]
+        )
+
+        roas = roas.filter(asns=set([64497])).remove_redundant()
+        self.assertEqual(len(roas), 1)
+        self.assertIs(roas.remove_redundant(), roas)
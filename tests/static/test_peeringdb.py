@@ -13,12 +13,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import os
+import shutil
+import tempfile
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
+import requests
 import unittest
 
+from pierky.arouteserver import peering_db
 from pierky.arouteserver.tests.mocked_env import MockedEnv
 from pierky.arouteserver.peering_db import PeeringDBNet
-from pierky.arouteserver.errors import PeeringDBNoInfoError 
+from pierky.arouteserver.errors import PeeringDBError, PeeringDBNoInfoError 
 
 
 class TestPeeringDBInfo(unittest.TestCase):
@@ -73,3 +82,81 @@ class TestPeeringDBInfo(unittest.TestCase):
         self.assertEqual(net.parse_as_sets("RIPE:AS-ONE@RIPE"), [])
         self.assertEqual(net.parse_as_sets("RIPE: AS-ONE@RIPE"), ["RIPE::AS-ONE"])
         self.assertEqual(net.parse_as_sets("AS-ONE@TWO@RIPE"), [])
+
+class TestPeeringDBPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+        with open(os.path.join(os.path.dirname(__file__),
+                               "peeringdb_data", "net_1.json")) as f:
+            self.net1 = json.load(f)["data"][0]
+
+        self.urls = []
+
+        self.mock_read_from_url = mock.patch.object(
+            PeeringDBNet, "_read_from_url"
+        ).start()
+        self.mock_read_from_url.side_effect = self.read_from_url
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def read_from_url(self, url):
+        self.urls.append(url)
+        if "asn__in=" not in url:
+            raise PeeringDBError("Only bulk requests expected")
+        return json.dumps({"meta": {}, "data": [self.net1]})
+
+    def test_010_prefetch(self):
+        """PeeringDB network: prefetch"""
+        PeeringDBNet.prefetch([2, 1, 1], cache_dir=self.temp_dir)
+        self.assertEqual(
+            self.urls,
+            ["https://www.peeringdb.com/api/net?asn__in=1,2"]
+        )
+
+        net = PeeringDBNet(1, cache_dir=self.temp_dir)
+        net.load_data()
+        self.assertTrue(net.from_cache)
+        self.assertEqual(net.info_prefixes4, 20)
+
+        net = PeeringDBNet(2, cache_dir=self.temp_dir)
+        with self.assertRaises(PeeringDBNoInfoError):
+            net.load_data()
+
+        # Networks already in the cache are not fetched again.
+        PeeringDBNet.prefetch([1, 2], cache_dir=self.temp_dir)
+        self.assertEqual(len(self.urls), 1)
+
+    def test_020_prefetch_chunks(self):
+        """PeeringDB network: prefetch, chunks"""
+        with mock.patch.object(PeeringDBNet, "PREFETCH_CHUNK_SIZE", 2):
+            PeeringDBNet.prefetch([1, 2, 3, 4, 5], cache_dir=self.temp_dir)
+        self.assertEqual(
+            [url.split("=")[1] for url in self.urls],
+            ["1,2", "3,4", "5"]
+        )
+
+    def test_030_prefetch_error(self):
+        """PeeringDB network: prefetch, error"""
+        self.mock_read_from_url.side_effect = PeeringDBError("Error")
+        PeeringDBNet.prefetch([1], cache_dir=self.temp_dir)
+
+        # Nothing cached: the network is fetched again.
+        net = PeeringDBNet(1, cache_dir=self.temp_dir)
+        self.assertFalse(net.load_data_from_cache())
+
+    def test_031_prefetch_connection_error(self):
+        """PeeringDB network: prefetch, connection error"""
+        mock.patch.stopall()
+        mock.patch.object(
+            peering_db, "http_get",
+            side_effect=requests.exceptions.ConnectionError("Refused")
+        ).start()
+
+        PeeringDBNet.prefetch([1], cache_dir=self.temp_dir)
+
+        net = PeeringDBNet(1, cache_dir=self.temp_dir)
+        self.assertFalse(net.load_data_from_cache())
@@ -0,0 +1,119 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import unittest
+
+from pierky.arouteserver.prefix_aggregation import aggregate_prefix_list
+
+
+def entry(prefix, length, exact=False, ge=None, le=None):
+    return {
+        "prefix": prefix,
+        "length": length,
+        "exact": exact,
+        "ge": ge,
+        "le": le,
+        "max_length": 128 if ":" in prefix else 32,
+        "comment": None
+    }
+
+def matched_routes(entries):
+    """Set of the routes matched by entries, all within 10.0.0.0/24."""
+    res = set()
+    for e in entries:
+        net = int(e["prefix"].split(".")[3])
+        if e["exact"]:
+            start, end = e["length"], e["length"]
+        else:
+            start, end = e["ge"] or e["length"], e["le"] or 32
+        for length in range(start, end + 1):
+            for sub_net in range(net, net + (1 << (32 - e["length"])),
+                                 1 << (32 - length)):
+                res.add((sub_net, length))
+    return res
+
+class TestPrefixAggregation(unittest.TestCase):
+
+    def test_010_unchanged(self):
+        """Prefix aggregation: nothing to aggregate"""
+        entries = [
+            entry("10.0.0.0", 24, exact=True),
+            entry("10.0.2.0", 24, exact=True),
+            entry("2001:db8::", 32, le=48),
+        ]
+        self.assertEqual(aggregate_prefix_list(entries), entries)
+
+    def test_020_duplicates(self):
+        """Prefix aggregation: duplicate prefixes"""
+        self.assertEqual(
+            aggregate_prefix_list([
+                entry("10.0.0.0", 24, ge=25, le=26),
+                entry("10.0.0.0", 24, ge=27, le=28),
+                entry("10.0.0.0", 24, ge=25, le=26),
+            ]),
+            [entry("10.0.0.0", 24, ge=25, le=28)]
+        )
+
+    def test_030_covered(self):
+        """Prefix aggregation: more specific prefixes already covered"""
+        self.assertEqual(
+            aggregate_prefix_list([
+                entry("10.0.0.0", 16),
+                entry("10.0.1.0", 24, exact=True),
+                entry("2001:db8::", 32),
+                entry("2001:db8:1::", 48, le=64),
+            ]),
+            [entry("10.0.0.0", 16), entry("2001:db8::", 32)]
+        )
+
+    def test_040_siblings(self):
+        """Prefix aggregation: siblings merged into their parent"""
+        self.assertEqual(
+            aggregate_prefix_list([
+                entry("10.0.{}.0".format(i), 24, exact=True)
+                for i in range(256)
+            ]),
+            [entry("10.0.0.0", 16, ge=24, le=24)]
+        )
+        self.assertEqual(
+            aggregate_prefix_list([
+                entry("2001:db8::", 33),
+                entry("2001:db8:8000::", 33),
+            ]),
+            [entry("2001:db8::", 32, ge=33)]
+        )
+
+    def test_050_equivalence(self):
+        """Prefix aggregation: same routes matched, never more entries"""
+        rnd = random.Random(0)
+        for _ in range(300):
+            entries = []
+            for _ in range(rnd.randint(1, 12)):
+                length = rnd.randint(24, 30)
+                net = rnd.randrange(0, 256, 1 << (32 - length))
+                kind = rnd.randint(0, 2)
+                if kind == 0:
+                    entries.append(entry("10.0.0.{}".format(net), length,
+                                         exact=True))
+                else:
+                    ge = rnd.randint(length, 32)
+                    le = rnd.randint(ge, 32)
+                    entries.append(entry("10.0.0.{}".format(net), length,
+                                         ge=ge if ge != length else None,
+                                         le=le if le != 32 else None))
+            res = aggregate_prefix_list(entries)
+            self.assertEqual(matched_routes(res), matched_routes(entries))
+            self.assertLessEqual(len(res), len(entries))
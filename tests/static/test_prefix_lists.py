@@ -0,0 +1,112 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from pierky.arouteserver.config.validators import ValidatorPrefixListEntry
+from pierky.arouteserver.prefix_lists import bird_prefix_list, \
+                                             bird_roa_table, \
+                                             openbgpd_prefix_list, \
+                                             openbgpd_prefixset_list, \
+                                             openbgpd_origin_set, \
+                                             openbgpd_roa_set, \
+                                             openbgpd_roas_action
+
+
+def entry(prefix, length, **kwargs):
+    kwargs.update({"prefix": prefix, "length": length})
+    return ValidatorPrefixListEntry().validate(kwargs)
+
+ENTRIES = [
+    entry("192.0.2.0", 24, exact=True, comment="exact"),
+    entry("2001:db8::", 32, comment="any more specific"),
+    entry("198.51.100.0", 24, ge=25, le=26),
+    entry("203.0.113.0", 24, le=24),
+    entry("10.0.0.0", 8, exact=True),
+]
+
+ROAS = [
+    {"prefix": "192.0.2.0/24", "length": 24, "max_len": 24, "asn": 64496},
+    {"prefix": "2001:db8::/32", "length": 32, "max_len": 48, "asn": 64497},
+    {"prefix": "198.51.100.0/24", "length": 24, "max_len": 24, "asn": 0},
+]
+
+class TestPrefixLists(unittest.TestCase):
+
+    def test_010_bird(self):
+        """Prefix lists: BIRD"""
+        self.assertEqual(
+            bird_prefix_list(ENTRIES, 4),
+            "\t\t# exact\n\t\t192.0.2.0/24,\n\n"
+            "\t\t# None\n\t\t198.51.100.0/24{25,26},\n\n"
+            "\t\t# None\n\t\t203.0.113.0/24{24,24},\n\n"
+            "\t\t# None\n\t\t10.0.0.0/8"
+        )
+        self.assertEqual(
+            bird_prefix_list(ENTRIES, group=True),
+            "\t192.0.2.0/24, \t2001:db8::/32{32,128}, "
+            "\t198.51.100.0/24{25,26}, \t203.0.113.0/24{24,24},\n"
+            "\t10.0.0.0/8"
+        )
+        self.assertEqual(bird_prefix_list(ENTRIES, 6, True),
+                         "\t2001:db8::/32{32,128}")
+        self.assertEqual(bird_prefix_list([], 4), "")
+        self.assertEqual(
+            bird_roa_table(ROAS[:2]),
+            "\troa 192.0.2.0/24 max 24 as 64496;\n"
+            "\troa 2001:db8::/32 max 48 as 64497;\n"
+        )
+
+    def test_020_openbgpd(self):
+        """Prefix lists: OpenBGPD"""
+        self.assertEqual(
+            openbgpd_prefix_list(ENTRIES),
+            "192.0.2.0/24, 2001:db8::/32 prefixlen 32 - 128, "
+            "198.51.100.0/24 prefixlen 25 - 26, "
+            "203.0.113.0/24 prefixlen = 24, 10.0.0.0/8"
+        )
+        self.assertEqual(
+            openbgpd_prefixset_list(ENTRIES, 6),
+            "    2001:db8::/32 prefixlen 32 - 128\n"
+        )
+        self.assertEqual(
+            openbgpd_origin_set(ENTRIES[:2], 64496),
+            "192.0.2.0/24 source-as 64496\n"
+            "2001:db8::/32 prefixlen 32 - 128 source-as 64496\n"
+        )
+        self.assertEqual(
+            openbgpd_roa_set(ROAS),
+            "    192.0.2.0/24 source-as 64496\n"
+            "    2001:db8::/32 maxlen 48 source-as 64497\n"
+            "    198.51.100.0/24 source-as 0\n"
+        )
+        self.assertEqual(
+            openbgpd_roas_action(ROAS, "set ext-community X"),
+            "match from group clients source-as 64496 prefix "
+            "192.0.2.0/24 set ext-community X\n"
+            "match from group clients source-as 64497 prefix "
+            "2001:db8::/32 prefixlen 32 - 48 set ext-community X\n"
+        )
+
+    def test_030_generator(self):
+        """Prefix lists: entries from a generator"""
+        self.assertEqual(
+            bird_prefix_list((e for e in ENTRIES[:2]), 4, True),
+            "\t192.0.2.0/24"
+        )
+        self.assertEqual(
+            openbgpd_prefix_list((e for e in ENTRIES[:2]), 4),
+            "192.0.2.0/24"
+        )
@@ -0,0 +1,71 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pierky.arouteserver.profiling import BuildProfiler, tracemalloc
+
+
+def thread_func(res):
+    res.append([str(i) for i in range(10000)])
+
+class TestBuildProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_010_phase(self):
+        """Profiling: phase, with threads"""
+        output_dir = os.path.join(self.temp_dir, "profile")
+        profiler = BuildProfiler(output_dir)
+
+        res = []
+        with profiler.phase("enrichment"):
+            thread = threading.Thread(target=thread_func, args=(res,))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(len(res[0]), 10000)
+
+        stats = pstats.Stats(os.path.join(output_dir, "enrichment.pstats"))
+        self.assertIn("thread_func",
+                      [func[2] for func in stats.stats])
+
+        with open(os.path.join(output_dir, "enrichment.txt"), "r") as f:
+            self.assertIn("thread_func", f.read())
+
+        if tracemalloc:
+            with open(os.path.join(output_dir,
+                                   "enrichment.allocations.txt"), "r") as f:
+                self.assertIn("Peak size of traced memory", f.read())
+            self.assertTrue(tracemalloc.Snapshot.load(
+                os.path.join(output_dir, "enrichment.tracemalloc")
+            ).traces)
+            self.assertFalse(tracemalloc.is_tracing())
+
+    def test_020_disabled(self):
+        """Profiling: disabled"""
+        profiler = BuildProfiler(None)
+        with profiler.phase("enrichment"):
+            pass
+        self.assertEqual(os.listdir(self.temp_dir), [])
@@ -0,0 +1,138 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import six
+import tempfile
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
+import unittest
+
+from pierky.arouteserver.errors import RPKIValidatorCacheError
+from pierky.arouteserver import ripe_rpki_cache
+from pierky.arouteserver.ripe_rpki_cache import RIPE_RPKI_ROAs
+
+
+ROAS = [
+    {"asn": "AS64496", "prefix": "192.0.2.0/24", "maxLength": 24,
+     "ta": "RIPE NCC RPKI Root"},
+    {"asn": "AS64497", "prefix": "2001:db8::/32", "maxLength": "48",
+     "ta": "APNIC RPKI Root"},
+    {"asn": "64498", "prefix": "198.51.100.0/24", "maxLength": 24,
+     "ta": "RIPE NCC RPKI Root"},
+]
+
+class TestRIPERPKIROAs(unittest.TestCase):
+
+    USE_IJSON = True
+
+    def setUp(self):
+        if self.USE_IJSON and ripe_rpki_cache.ijson is None:
+            self.skipTest("ijson not available")
+        if not self.USE_IJSON:
+            mock.patch.object(ripe_rpki_cache, "ijson", None).start()
+
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+        self.export_path = os.path.join(self.temp_dir, "export.json")
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_export(self, data):
+        with open(self.export_path, "w") as f:
+            json.dump(data, f)
+
+    def load(self):
+        obj = RIPE_RPKI_ROAs(cache_dir=self.temp_dir,
+                             ripe_rpki_validator_url=[self.export_path])
+        obj.load_data()
+        return obj
+
+    def test_010_parse(self):
+        """RIPE RPKI ROAs: parse the export"""
+        self.write_export({"roas": ROAS})
+
+        obj = self.load()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(
+            obj.roas,
+            [[64496, "192.0.2.0/24", 24, 24, "RIPE NCC RPKI Root"],
+             [64497, "2001:db8::/32", 32, 48, "APNIC RPKI Root"]]
+        )
+
+        obj = self.load()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(len(obj.roas), 2)
+
+    def test_020_too_many_invalid(self):
+        """RIPE RPKI ROAs: too many invalid ROAs"""
+        self.write_export({"roas": [ROAS[2]] * 11})
+
+        with six.assertRaisesRegex(self, RPKIValidatorCacheError,
+                                   "More than 10 invalid ROAs"):
+            self.load()
+
+    def test_030_invalid_json(self):
+        """RIPE RPKI ROAs: invalid JSON"""
+        with open(self.export_path, "w") as f:
+            f.write(json.dumps({"roas": ROAS})[:-10])
+
+        with six.assertRaisesRegex(self, RPKIValidatorCacheError,
+                                   "Error while parsing ROAs"):
+            self.load()
+
+    def test_040_missing_roas(self):
+        """RIPE RPKI ROAs: missing 'roas' element"""
+        self.write_export({"foo": ROAS})
+
+        with six.assertRaisesRegex(self, RPKIValidatorCacheError,
+                                   "missing 'roas' root element"):
+            self.load()
+
+    def test_041_empty_roas(self):
+        """RIPE RPKI ROAs: empty 'roas' element"""
+        self.write_export({"roas": []})
+
+        obj = self.load()
+        self.assertEqual(obj.roas, [])
+
+    def test_042_roas_not_a_list(self):
+        """RIPE RPKI ROAs: 'roas' element is not a list"""
+        self.write_export({"roas": {"foo": ROAS}})
+
+        with six.assertRaisesRegex(self, RPKIValidatorCacheError,
+                                   "'roas' root element is not a list"):
+            self.load()
+
+    def test_050_old_cache_format(self):
+        """RIPE RPKI ROAs: cache in the old format"""
+        self.write_export({"roas": ROAS})
+
+        obj = RIPE_RPKI_ROAs(cache_dir=self.temp_dir)
+        obj.raw_data = {"roas": ROAS}
+        obj.save_data_to_cache()
+
+        obj = self.load()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(len(obj.roas), 2)
+
+class TestRIPERPKIROAs_NoIJSON(TestRIPERPKIROAs):
+
+    USE_IJSON = False
@@ -0,0 +1,256 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import six
+from six.moves import socketserver
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+from pierky.arouteserver.cached_objects import SQLiteCache
+from pierky.arouteserver.errors import RTRError
+from pierky.arouteserver.rpki_rtr import RTRClient, RTR_ROAs
+
+
+HEADER = RTRClient.HEADER
+
+def prefix_pdu(version, announce, vrp):
+    asn, prefix, length, max_len = vrp
+    if ":" in prefix:
+        pdu_type, fmt, family = 6, RTRClient.IPV6_PREFIX, socket.AF_INET6
+    else:
+        pdu_type, fmt, family = 4, RTRClient.IPV4_PREFIX, socket.AF_INET
+    body = fmt.pack(1 if announce else 0, length, max_len, 0,
+                    socket.inet_pton(family, prefix.split("/")[0]), asn)
+    return HEADER.pack(version, pdu_type, 0, HEADER.size + len(body)) + body
+
+class FakeRTRHandler(socketserver.BaseRequestHandler):
+
+    def recv(self, length):
+        data = b""
+        while len(data) < length:
+            data += self.request.recv(length - len(data))
+        return data
+
+    def handle(self):
+        server = self.server
+
+        version, pdu_type, session_id, length = HEADER.unpack(
+            self.recv(HEADER.size)
+        )
+        body = self.recv(length - HEADER.size)
+        server.queries.append((version, pdu_type, session_id, body))
+
+        if version not in server.versions:
+            msg = b"Unsupported version"
+            err = struct.pack("!I", 0) + struct.pack("!I", len(msg)) + msg
+            self.request.sendall(
+                HEADER.pack(version, 10, 4, HEADER.size + len(err)) + err
+            )
+            return
+
+        if pdu_type == 1 and server.serial_query_error:
+            err = struct.pack("!I", 0) + struct.pack("!I", 0)
+            self.request.sendall(
+                HEADER.pack(version, 10, server.serial_query_error,
+                            HEADER.size + len(err)) + err
+            )
+            return
+
+        end_of_data_session_id = server.session_id
+
+        if pdu_type == 1:
+            serial = struct.unpack("!I", body)[0]
+            if server.session_id_changed:
+                end_of_data_session_id = server.session_id + 1
+            if session_id != server.session_id or \
+                serial not in server.deltas:
+                self.request.sendall(HEADER.pack(version, 8, 0, 8))
+                return
+            pdus = [prefix_pdu(version, announce, vrp)
+                    for announce, vrp in server.deltas[serial]]
+        else:
+            pdus = [prefix_pdu(version, True, vrp) for vrp in server.vrps]
+
+        res = HEADER.pack(version, 3, server.session_id, 8)
+        res += b"".join(pdus)
+        if version == 0:
+            res += HEADER.pack(version, 7, end_of_data_session_id, 12)
+            res += struct.pack("!I", server.serial)
+        else:
+            res += HEADER.pack(version, 7, end_of_data_session_id, 24)
+            res += struct.pack("!IIII", server.serial, 3600, 600, 7200)
+        self.request.sendall(res)
+
+class FakeRTRServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.TCPServer.__init__(self, ("127.0.0.1", 0),
+                                        FakeRTRHandler)
+        self.versions = (0, 1)
+        self.session_id = 1234
+        self.serial = 10
+        self.vrps = [
+            (64496, "192.0.2.0/24", 24, 24),
+            (64497, "2001:db8::/32", 32, 48),
+        ]
+        # serial: [(announce, vrp)]
+        self.deltas = {}
+        # Error code sent in response to Serial Queries.
+        self.serial_query_error = None
+        # When True, the session ID changes in the middle of the
+        # response to a Serial Query.
+        self.session_id_changed = False
+        self.queries = []
+
+class TestRTR(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+        self.server = FakeRTRServer()
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"poll_interval": 0.05}
+        )
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        self.rtr_server = "{}:{}".format(*self.server.server_address)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def load(self, cache_expiry=3600, cache_backend=None):
+        obj = RTR_ROAs(cache_dir=self.temp_dir, cache_expiry=cache_expiry,
+                       cache_backend=cache_backend,
+                       rtr_server=self.rtr_server)
+        obj.load_data()
+        return obj
+
+    def test_010_reset_query(self):
+        """RTR: full set of VRPs"""
+        obj = self.load()
+        self.assertEqual(
+            obj.roas,
+            [[64496, "192.0.2.0/24", 24, 24, None],
+             [64497, "2001:db8::/32", 32, 48, None]]
+        )
+        self.assertEqual(self.server.queries, [(1, 2, 0, b"")])
+
+        obj = self.load()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(len(self.server.queries), 1)
+
+    def test_020_serial_query(self):
+        """RTR: incremental update"""
+        self.load()
+
+        self.server.deltas[10] = [
+            (False, (64496, "192.0.2.0/24", 24, 24)),
+            (True, (64498, "198.51.100.0/24", 24, 32)),
+        ]
+        self.server.serial = 11
+
+        obj = self.load(cache_expiry=0)
+        self.assertEqual(
+            obj.roas,
+            [[64497, "2001:db8::/32", 32, 48, None],
+             [64498, "198.51.100.0/24", 24, 32, None]]
+        )
+        self.assertEqual(self.server.queries[-1],
+                         (1, 1, 1234, struct.pack("!I", 10)))
+
+        # The new serial is used for the following update.
+        self.server.deltas[11] = []
+        obj = self.load(cache_expiry=0)
+        self.assertEqual(len(obj.roas), 2)
+        self.assertEqual(self.server.queries[-1],
+                         (1, 1, 1234, struct.pack("!I", 11)))
+
+    def test_030_cache_reset(self):
+        """RTR: cache reset"""
+        self.load()
+
+        self.server.session_id = 5678
+        self.server.vrps = [(64499, "203.0.113.0/24", 24, 24)]
+
+        obj = self.load(cache_expiry=0)
+        self.assertEqual(obj.roas,
+                         [[64499, "203.0.113.0/24", 24, 24, None]])
+        self.assertEqual([q[1] for q in self.server.queries], [2, 1, 2])
+
+    def test_040_version_0(self):
+        """RTR: protocol version 0"""
+        self.server.versions = (0,)
+
+        obj = self.load()
+        self.assertEqual(len(obj.roas), 2)
+        self.assertEqual([(q[0], q[1]) for q in self.server.queries],
+                         [(1, 2), (0, 2)])
+
+        self.server.deltas[10] = []
+        self.load(cache_expiry=0)
+        self.assertEqual(self.server.queries[-1][:2], (0, 1))
+
+    def test_045_serial_query_error(self):
+        """RTR: error report in response to a serial query"""
+        self.load()
+
+        self.server.serial_query_error = RTRClient.ERR_NO_DATA_AVAILABLE
+        self.server.vrps = [(64499, "203.0.113.0/24", 24, 24)]
+
+        obj = self.load(cache_expiry=0)
+        self.assertEqual(obj.roas,
+                         [[64499, "203.0.113.0/24", 24, 24, None]])
+        self.assertEqual([q[1] for q in self.server.queries], [2, 1, 2])
+
+    def test_046_session_id_changed(self):
+        """RTR: session ID changed during a serial query"""
+        self.load()
+
+        self.server.deltas[10] = [
+            (True, (64498, "198.51.100.0/24", 24, 32)),
+        ]
+        self.server.session_id_changed = True
+
+        obj = self.load(cache_expiry=0)
+        self.assertEqual(len(obj.roas), 2)
+        self.assertEqual([q[1] for q in self.server.queries], [2, 1, 2])
+
+    def test_050_connection_refused(self):
+        """RTR: connection refused"""
+        self.rtr_server = "127.0.0.1:1"
+        with six.assertRaisesRegex(self, RTRError, "Can't connect"):
+            self.load()
+
+    def test_060_sqlite_purge_expired(self):
+        """RTR: expired ROAs not purged from the SQLite cache"""
+        self.load(cache_expiry=0, cache_backend="sqlite")
+
+        self.assertEqual(SQLiteCache.get(self.temp_dir).purge_expired(), 0)
+
+        self.server.deltas[10] = []
+        obj = self.load(cache_expiry=0, cache_backend="sqlite")
+        self.assertEqual(len(obj.roas), 2)
+        self.assertEqual([q[1] for q in self.server.queries], [2, 1])
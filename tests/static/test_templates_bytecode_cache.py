@@ -0,0 +1,104 @@
+# Copyright (C) 2017-2019 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
+import unittest
+
+from pierky.arouteserver.builder import ConfigBuilder, BIRDConfigBuilder, \
+                                        OpenBGPDConfigBuilder, \
+                                        TemplateContextDumper, \
+                                        TemplatesBytecodeCache
+
+
+class TestTemplatesBytecodeCache(unittest.TestCase):
+
+    TEMPLATES = (
+        ("templates/bird", BIRDConfigBuilder),
+        ("templates/openbgpd", OpenBGPDConfigBuilder),
+        ("templates/html", ConfigBuilder),
+        ("templates/template-context", TemplateContextDumper),
+    )
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+        self.bytecode_dir = os.path.join(self.temp_dir,
+                                         TemplatesBytecodeCache.DIR_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_cached_files(self):
+        return sorted(os.listdir(self.bytecode_dir))
+
+    def test_010_precompile(self):
+        """Templates bytecode cache: precompile distributed templates"""
+        tot = 0
+        for template_dir, builder_class in self.TEMPLATES:
+            cnt = builder_class.precompile_templates(template_dir,
+                                                     self.temp_dir)
+            self.assertEqual(
+                cnt,
+                len([f for f in os.listdir(template_dir)
+                     if f.endswith(".j2")])
+            )
+            tot += cnt
+
+        self.assertEqual(len(self.get_cached_files()), tot)
+
+    def test_020_reuse(self):
+        """Templates bytecode cache: compiled templates are reused"""
+        template_dir = os.path.join(self.temp_dir, "templates")
+        os.mkdir(template_dir)
+        template_path = os.path.join(template_dir, "main.j2")
+        with open(template_path, "w") as f:
+            f.write("{{ 1 + 1 }}")
+
+        ConfigBuilder.precompile_templates(template_dir, self.temp_dir)
+        cached_files = self.get_cached_files()
+        self.assertEqual(len(cached_files), 1)
+
+        env = ConfigBuilder.get_j2_environment(template_dir, self.temp_dir)
+        with mock.patch.object(env, "compile") as compile:
+            self.assertEqual(env.get_template("main.j2").render(), "2")
+            self.assertFalse(compile.called)
+
+        # Template changed: a new fingerprint is used.
+        with open(template_path, "w") as f:
+            f.write("{{ 1 + 2 }}")
+
+        env = ConfigBuilder.get_j2_environment(template_dir, self.temp_dir)
+        self.assertEqual(env.get_template("main.j2").render(), "3")
+        self.assertEqual(len(self.get_cached_files()), 2)
+
+    def test_030_corrupted(self):
+        """Templates bytecode cache: corrupted cache file"""
+        template_dir = os.path.join(self.temp_dir, "templates")
+        os.mkdir(template_dir)
+        with open(os.path.join(template_dir, "main.j2"), "w") as f:
+            f.write("{{ 1 + 1 }}")
+
+        ConfigBuilder.precompile_templates(template_dir, self.temp_dir)
+        for filename in self.get_cached_files():
+            with open(os.path.join(self.bytecode_dir, filename), "wb") as f:
+                f.write(b"foo")
+
+        env = ConfigBuilder.get_j2_environment(template_dir, self.temp_dir)
+        self.assertEqual(env.get_template("main.j2").render(), "2")
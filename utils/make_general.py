@@ -323,6 +323,7 @@ CFG = CfgStatement("cfg", t="General options", statement_pattern="^()(cfg):()",
         CfgStatement("rpki_roas", t="RPKI ROAs", post_comment=True, sub=[
             CfgStatement("source", pre_comment=True),
             CfgStatement("ripe_rpki_validator_url", pre_comment=True),
+            CfgStatement("rtr_server", pre_comment=True),
             CfgStatement("allowed_trust_anchors", pre_comment=True),
         ]),
         CfgStatement("blackhole_filtering", t="Blackhole filtering", post_comment=True, sub=[